@@ -0,0 +1,43 @@
+"""
+Framework overhead of an agent step (`get_act` + `report`) on cartpole sized states (1 env), with a policy that
+does no work. The bare agent only does the bookkeeping every agent does, replay also stores the transition.
+"""
+import time
+import numpy as np
+import torch
+import reward as rw, reward.utils as U
+
+N_STEPS = 20000
+
+
+class Model:
+    gamma = .99
+    def __init__(self): self.a = torch.zeros(1, dtype=torch.long)
+    def get_act(self, ss): return self.a
+    def train(self, **kwargs): pass
+
+
+class Bare(rw.agent.Agent):
+    def register_sa(self, s, a): super().register_sa(s=s, a=a)
+    def report(self, r, d): super().report(r=r, d=d)
+
+
+def step_us(agent, S):
+    s, r = S(np.zeros((1, 4), dtype='float32')), np.zeros(1)
+    ds = np.random.random((N_STEPS, 1)) < .005
+    U.global_step.reset()
+    start = time.perf_counter()
+    for d in ds:
+        agent.get_act(s)
+        agent.report(r=r, d=d)
+    return (time.perf_counter() - start) / N_STEPS * 1e6
+
+
+if __name__ == '__main__':
+    U.device.set_device(torch.device('cpu'))
+    rw.logger.set_logfreq(10 * N_STEPS)
+    S, A = rw.space.Continuous(low=-np.ones(4), high=np.ones(4)), rw.space.Categorical(n_acs=2)
+    print(f'{"agent":>7} {"default (us/step)":>18} {"fast (us/step)":>15}')
+    for name, make in [('bare', lambda fast: Bare(Model(), s_sp=S, a_sp=A, fast=fast)),
+                       ('replay', lambda fast: rw.agent.Replay(Model(), s_sp=S, a_sp=A, bs=32, maxlen=N_STEPS, learn_start=N_STEPS, fast=fast))]:
+        print(f'{name:>7} {step_us(make(False), S):>18.1f} {step_us(make(True), S):>15.1f}')
@@ -0,0 +1,62 @@
+"""
+Ape-X style actor/learner throughput on a stand-in env: actor processes step envs with a cpu copy of the
+policy while the learner trains a small DQN on prioritized replay, both rates are reported separately.
+"""
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.multiprocessing as mp
+import reward as rw, reward.utils as U
+
+N_STEPS, N_ENVS, BS = 20000, 4, 64
+# Cpu time of each env step
+ENV_US = 50
+
+
+class Corridor:
+    "Walk right (action 1) to reach the end of the corridor, a small reward is given at the end."
+    def __init__(self, length=10): self.length, self.t, self.pos = length, 0, 0
+    def reset(self):
+        self.t, self.pos = 0, 0
+        return self._s()
+    def step(self, a):
+        end = time.perf_counter() + ENV_US * 1e-6
+        while time.perf_counter() < end: pass
+        self.t, self.pos = self.t + 1, max(0, self.pos + (1 if int(a) == 1 else -1))
+        done = self.pos == self.length or self.t == 4 * self.length
+        return self._s(), float(self.pos == self.length), done, {}
+    def close(self): pass
+    def _s(self): return np.array([self.pos / self.length, self.t / (4 * self.length)], dtype='float32')
+
+
+class Policy:
+    def __init__(self, qnn, exp_rate): self.qnn, self._exp_rate = qnn, U.make_callable(exp_rate)
+
+    def get_act(self, s):
+        q = self.qnn(s)
+        a = q.argmax(dim=1)
+        explore = torch.rand(len(a)) < self._exp_rate(U.global_step.get())
+        return torch.where(explore, torch.randint(q.shape[1], a.shape), a)
+
+
+def make_agent():
+    S, A = rw.space.Continuous(low=np.zeros(2), high=np.ones(2)), rw.space.Categorical(n_acs=2)
+    qnn = nn.Sequential(nn.Linear(2, 64), nn.ReLU(), nn.Linear(64, 2))
+    qnn_targ = nn.Sequential(nn.Linear(2, 64), nn.ReLU(), nn.Linear(64, 2)).eval()
+    policy = Policy(qnn=qnn, exp_rate=U.scheds.Linear(1., .05, N_STEPS // 2))
+    model = rw.model.DQN(policy=policy, qnn=qnn, qnn_targ=qnn_targ, targ_up_freq=1000, targ_up_w=1.,
+                         q_opt=torch.optim.Adam(qnn.parameters(), lr=1e-3))
+    return rw.agent.PrReplay(model=model, s_sp=S, a_sp=A, bs=BS, maxlen=N_STEPS, learn_start=1000)
+
+
+if __name__ == '__main__':
+    U.device.set_device(torch.device('cpu'))
+    rw.logger.set_logfreq(10 * N_STEPS)
+    print(f'{N_ENVS} envs per actor, {ENV_US}us env step, batch size {BS}, {mp.cpu_count()} cpus')
+    print(f'{"n_actors":>10} {"actor (steps/s)":>16} {"learner (updates/s)":>20}')
+    for n_actors in [1, 2, 4]:
+        U.global_step.reset()
+        runner = rw.runner.ApeX(make_agent(), Corridor, n_actors=n_actors, n_envs=N_ENVS, seg_len=25)
+        stats = runner.run(maxsteps=N_STEPS)
+        print(f'{n_actors:>10} {stats["actor_steps_s"]:>16.0f} {stats["learner_updates_s"]:>20.0f}')
@@ -0,0 +1,49 @@
+"""
+Compressed frame storage for atari replay (32 x 84x84x4 uint8 batches, frames stored once): bytes per transition
+and sampling speed of raw frames vs frames compressed one by one, with different LRU cache sizes and decompression
+threads. Frames are synthetic but atari-like (flat background, a few moving sprites and a score bar).
+"""
+import time
+import numpy as np
+import reward as rw
+from reward.mem.checkpoint import CODECS
+
+MAXLEN, BS, REPEAT = 50000, 32, 300
+
+
+def frame(i, rng):
+    f = np.full((84, 84), 87, dtype='uint8')
+    f[:8] = 0
+    f[2:6, 4:4 + i % 60] = 200
+    for k in range(4):
+        x, y = (i * (k + 1) + 17 * k) % 76, (i // 3 + 23 * k) % 70 + 8
+        f[y:y + 6, x:x + 8] = 50 * k + 30 + rng.randint(0, 3, size=(6, 8))
+    return f[None, ..., None]
+
+
+def fill(b, n):
+    S, A, rng = rw.space.Image(shape=[1, 84, 84, 1]), rw.space.Categorical(n_acs=4), np.random.RandomState(0)
+    stack = rw.tfm.img.Stack(n=4)
+    for i in range(n):
+        s = S(frame(i, rng)).apply_tfms(stack)
+        b.add_transition(s=[s], a=[A(np.array([0]))], r=np.array([0.]), d=np.array([i % 1000 == 999]))
+
+
+def samples_s(b):
+    start = time.perf_counter()
+    for _ in range(REPEAT): b.sample(bs=BS)
+    return REPEAT * BS / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    print(f'{"codec":>6} {"cache":>6} {"threads":>8} {"bytes/transition":>17} {"samples/s":>10}')
+    b = rw.mem.ReplayBuffer(maxlen=MAXLEN)
+    fill(b, n=MAXLEN)
+    print(f'{"raw":>6} {"-":>6} {"-":>8} {b.ss[0][0].nbytes:>17} {samples_s(b):>10.0f}')
+    del b
+    for codec in [c for c in ['zlib', 'lz4', 'zstd'] if c in CODECS]:
+        for cache_len, n_threads in [(0, 1), (0, 4), (10000, 1), (10000, 4)]:
+            b = rw.mem.CompressedReplayBuffer(maxlen=MAXLEN, codec=codec, cache_len=cache_len, n_threads=n_threads)
+            fill(b, n=MAXLEN)
+            print(f'{codec:>6} {cache_len:>6} {n_threads:>8} {b.nbytes / len(b):>17.0f} {samples_s(b):>10.0f}')
+            del b
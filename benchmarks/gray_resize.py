@@ -0,0 +1,16 @@
+"Atari preprocessing, (N, 210, 160, 3) uint8 -> (N, 84, 84, 1) uint8: Gray + Resize transforms vs fused GrayResize."
+import timeit
+import numpy as np
+import reward as rw
+
+REPEAT = 200
+
+
+if __name__ == '__main__':
+    print(f'{"N":>5} {"gray+resize (us)":>17} {"fused (us)":>11}')
+    for n in [1, 16, 64]:
+        S = rw.space.Image(shape=[n, 210, 160, 3])
+        x = S(np.random.randint(0, 256, size=(n, 210, 160, 3), dtype='uint8'))
+        tfms = [[rw.tfm.img.Gray(), rw.tfm.img.Resize(sz=[84, 84])], rw.tfm.img.GrayResize(sz=[84, 84])]
+        res = [timeit.timeit(lambda: x.apply_tfms(tfm), number=REPEAT) / REPEAT * 1e6 for tfm in tfms]
+        print(f'{n:>5} {res[0]:>17.1f} {res[1]:>11.1f}')
@@ -0,0 +1,41 @@
+"""
+Logging overhead per training update with DQN-like logs (3 scalars and 3 histograms of 256 values per update, a forced
+episode log every 10 updates), default vs buffered logger (histograms recorded for 10% of the calls), for
+different numbers of updates between log boundaries. Tensorboard files are written to a temporary directory, logs are hidden
+so no table is printed.
+"""
+import time, tempfile
+import torch
+import reward as rw, reward.utils as U
+from reward.logger.logger import Logger
+
+N_UPDATES, BS = 10000, 256
+
+
+def update_us(logger, logfreq):
+    loss, q = torch.rand(()), torch.rand(BS, 1)
+    q_mean = q.mean()
+    start = time.perf_counter()
+    for i in range(N_UPDATES):
+        logger.add_log('loss', loss, hidden=True)
+        logger.add_log('q_mean', q_mean, hidden=True)
+        logger.add_log('temperature', loss, hidden=True)
+        for name in ['acs', 'q', 'qtarg']: logger.add_histogram(name, q)
+        if i % 10 == 0: logger.add_log('episode/reward', loss, hidden=True, force=True)
+        if i % logfreq == logfreq - 1: logger.log()
+    logger.flush()
+    return (time.perf_counter() - start) / N_UPDATES * 1e6
+
+
+if __name__ == '__main__':
+    print(f'{"updates/log":>12} {"default (us)":>13} {"buffered (us)":>14}')
+    with tempfile.TemporaryDirectory() as d:
+        for logfreq in [100, 1000, 10000]:
+            us = []
+            for buffered in [False, True]:
+                logger = Logger(logfreq=1e12)
+                logger.set_logdir(f'{d}/{logfreq}_{buffered}')
+                if buffered: logger.set_buffered(hist_rate=.1)
+                us.append(update_us(logger, logfreq))
+                logger.close_pbar()
+            print(f'{logfreq:>12} {us[0]:>13.1f} {us[1]:>14.1f}')
@@ -0,0 +1,37 @@
+"""
+Replay sampling of atari batches (32 x 84x84x4 uint8, frames stored once): in-RAM columns vs memmap files, with and without
+a hot window of recent steps in RAM. Samples are drawn from the whole buffer (uniform) and from the recent steps
+(as prioritized replay tends to), files much smaller than RAM are served by the page cache.
+"""
+import time, tempfile
+import numpy as np
+import reward as rw
+
+MAXLEN, BS, REPEAT, HOT_LEN = 100000, 32, 500, 10000
+
+
+def fill(b, n):
+    S, A = rw.space.Image(shape=[1, 84, 84, 1]), rw.space.Categorical(n_acs=4)
+    stack = rw.tfm.img.Stack(n=4)
+    frames = np.random.randint(0, 256, size=(64, 1, 84, 84, 1), dtype='uint8')
+    for i in range(n):
+        s = S(frames[i % 64]).apply_tfms(stack)
+        b.add_transition(s=[s], a=[A(np.array([0]))], r=np.array([0.]), d=np.array([i % 1000 == 999]))
+
+
+def samples_s(b, recent):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        if recent: b._get_batch(idxs=(b.position - 1 - np.random.randint(HOT_LEN - 1, size=(BS, 1))) % b.nsteps)
+        else: b.sample(bs=BS)
+    return REPEAT * BS / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    print(f'{"buffer":>14} {"uniform (samples/s)":>20} {"recent (samples/s)":>19}')
+    with tempfile.TemporaryDirectory() as d:
+        for name, b in [('ram', rw.mem.ReplayBuffer(maxlen=MAXLEN)), ('memmap', rw.mem.MemmapReplayBuffer(maxlen=MAXLEN, path=f'{d}/cold')),
+                        ('memmap + hot', rw.mem.MemmapReplayBuffer(maxlen=MAXLEN, path=f'{d}/hot', hot_len=HOT_LEN))]:
+            fill(b, n=MAXLEN)
+            print(f'{name:>14} {samples_s(b, recent=False):>20.0f} {samples_s(b, recent=True):>19.0f}')
+            del b
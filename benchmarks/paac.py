@@ -0,0 +1,124 @@
+"""
+PAAC per-step overhead on a dummy env: Queue signalling + cloning (previous implementation) vs semaphores + double-buffered shared memory.
+Also compares synchronous stepping with two halves stepped asynchronously, overlapping (simulated) inference with env steps.
+"""
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import reward as rw
+from collections import namedtuple
+
+N_ENVS, N_STEPS = 64, 300
+# Inference latency (e.g. waiting on the gpu) and cpu time of each env step, for the async comparison
+INFER_MS, ENV_US = 5, 100
+
+
+class DummyEnv:
+    def __init__(self): self.s, self.t = np.zeros((84, 84, 1), dtype='uint8'), 0
+    def reset(self): return self.s
+    def step(self, a):
+        self.t += 1
+        return self.s, 1., self.t % 100 == 0, {}
+
+
+class BusyEnv(DummyEnv):
+    def step(self, a):
+        end = time.perf_counter() + ENV_US * 1e-6
+        while time.perf_counter() < end: pass
+        return super().step(a)
+
+
+def infer(s, n):
+    time.sleep(INFER_MS * 1e-3)
+    return np.zeros((n, 1), dtype='int32')
+
+
+def run_sync(runner):
+    s = runner.reset()
+    for _ in range(N_STEPS): s, r, d, _ = runner.step(infer(s, N_ENVS))
+
+
+def run_halves(runner):
+    ss = [runner.reset(group=g) for g in range(2)]
+    for g in range(2): runner.step_async(infer(ss[g], N_ENVS // 2), group=g)
+    for _ in range(N_STEPS):
+        for g in range(2):
+            ss[g], r, d, _ = runner.step_wait(group=g)
+            runner.step_async(infer(ss[g], N_ENVS // 2), group=g)
+    for g in range(2): runner.step_wait(group=g)
+
+
+def queue_run(env_fn, n_envs, ss, acs, rs, ds, inq, outq, s_sp, tfms):
+    envs = [env_fn() for _ in range(n_envs)]
+    while True:
+        signal = inq.get()
+        a = acs.numpy()
+        for i, env in enumerate(envs):
+            if signal is None: s = env.reset()
+            else:
+                s, r, d, _ = env.step(a[i].squeeze())
+                if d: s = env.reset()
+                rs[i] = torch.as_tensor(r, dtype=rs.dtype)
+                ds[i] = torch.as_tensor(d, dtype=ds.dtype)
+            s = np.array(s_sp(s[None]).apply_tfms(tfms))
+            ss[i] = torch.as_tensor(s, dtype=ss.dtype)[0]
+        outq.put(None)
+
+
+class QueuePAAC:
+    def __init__(self, env_fn, n_envs, s_sp, a_sp, n_workers, tfms=None):
+        self.n_envs, self.n_workers = n_envs, n_workers
+        self._ss = torch.as_tensor(np.zeros((n_envs, *s_sp.shape), dtype=s_sp.dtype)).share_memory_()
+        self._acs = torch.as_tensor(np.zeros((n_envs, *a_sp.shape), dtype=a_sp.dtype)).share_memory_()
+        self._rs, self._ds = torch.zeros(n_envs).share_memory_(), torch.zeros(n_envs, dtype=torch.int).share_memory_()
+        Worker = namedtuple('Worker', 'p send recv')
+        self._workers = []
+        for ss, acs, rs, ds in zip(*[t.chunk(n_workers) for t in [self._ss, self._acs, self._rs, self._ds]]):
+            sendq, recvq = mp.Queue(), mp.Queue()
+            p = mp.Process(target=queue_run, args=(env_fn, ss.shape[0], ss, acs, rs, ds, sendq, recvq, s_sp, tfms))
+            p.daemon = True
+            p.start()
+            self._workers.append(Worker(p=p, send=sendq, recv=recvq))
+
+    def reset(self):
+        for w in self._workers: w.send.put(None)
+        self._sync()
+        return self._ss.clone()
+
+    def step(self, act):
+        self._acs.copy_(torch.as_tensor(act))
+        for w in self._workers: w.send.put(True)
+        self._sync()
+        return self._ss.clone(), self._rs.clone(), self._ds.clone(), {}
+
+    def close(self):
+        for w in self._workers: w.p.terminate()
+
+    def _sync(self):
+        for w in self._workers: w.recv.get()
+
+if __name__ == '__main__':
+    S, A = rw.space.Image(shape=[1, 84, 84, 1]), rw.space.Categorical(n_acs=4)
+    acts = np.zeros((N_ENVS, 1), dtype='int32')
+    print(f'{"n_workers":>10} {"queue (steps/s)":>16} {"shared (steps/s)":>17}')
+    for n_workers in sorted({1, 2, min(8, mp.cpu_count())}):
+        res = []
+        for cls in [QueuePAAC, rw.runner.PAAC]:
+            runner = cls(env_fn=DummyEnv, n_envs=N_ENVS, n_workers=n_workers, s_sp=S, a_sp=A)
+            runner.reset()
+            start = time.perf_counter()
+            for _ in range(N_STEPS): runner.step(acts)
+            res.append(N_STEPS * N_ENVS / (time.perf_counter() - start))
+            runner.close()
+        print(f'{n_workers:>10} {res[0]:>16.0f} {res[1]:>17.0f}')
+
+    n_workers = max(2, mp.cpu_count() // 2 * 2)
+    print(f'\n{INFER_MS}ms inference, {ENV_US}us env step, {n_workers} workers')
+    print(f'{"mode":>10} {"steps/s":>10}')
+    for name, fn, n_groups in [('sync', run_sync, 1), ('halves', run_halves, 2)]:
+        runner = rw.runner.PAAC(env_fn=BusyEnv, n_envs=N_ENVS, n_workers=n_workers, s_sp=S, a_sp=A, n_groups=n_groups)
+        start = time.perf_counter()
+        fn(runner)
+        print(f'{name:>10} {N_STEPS * N_ENVS / (time.perf_counter() - start):>10.0f}')
+        runner.close()
@@ -0,0 +1,41 @@
+"""
+Target network updates (`weight=.005`, as in SAC): the previous per parameter loop vs `U.Polyak` with fused `_foreach` ops
+and with flattened parameters, for small MLPs and the atari conv net.
+"""
+import time
+import torch
+import torch.nn as nn
+from copy import deepcopy
+import reward.utils as U
+
+REPEAT, WEIGHT = 2000, .005
+
+
+def mlp(n_hidden, n_layers): return nn.Sequential(nn.Linear(17, n_hidden), *[nn.Linear(n_hidden, n_hidden) for _ in range(n_layers)], nn.Linear(n_hidden, 6))
+
+def atari():
+    return nn.Sequential(nn.Conv2d(4, 32, 8, stride=4), nn.ReLU(), nn.Conv2d(32, 64, 4, stride=2), nn.ReLU(), nn.Conv2d(64, 64, 3, stride=1),
+                         nn.ReLU(), nn.Flatten(), nn.Linear(3136, 512), nn.ReLU(), nn.Linear(512, 18))
+
+
+def loop(from_nn, to_nn, weight):
+    for fp, tp in zip(from_nn.parameters(), to_nn.parameters()):
+        v = weight * fp.data + (1 - weight) * tp.data
+        tp.data.copy_(v)
+
+
+def update_us(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat): fn(WEIGHT)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+if __name__ == '__main__':
+    torch.set_num_threads(1)
+    print(f'{"net":>14} {"params":>9} {"loop (us)":>10} {"foreach (us)":>13} {"flat (us)":>10}')
+    for name, net, repeat in [('mlp 2x64', mlp(64, 2), REPEAT), ('mlp 2x256', mlp(256, 2), REPEAT), ('mlp 4x256', mlp(256, 4), REPEAT),
+                              ('atari conv', atari(), REPEAT // 10)]:
+        fns = [lambda w, net=net, targ=deepcopy(net): loop(net, targ, w),
+               U.Polyak(from_nn=net, to_nn=deepcopy(net), flatten=False), U.Polyak(from_nn=net, to_nn=deepcopy(net))]
+        us = [update_us(fn, repeat) for fn in fns]
+        print(f'{name:>14} {sum(p.numel() for p in net.parameters()):>9} {us[0]:>10.1f} {us[1]:>13.1f} {us[2]:>10.1f}')
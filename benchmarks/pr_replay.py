@@ -0,0 +1,42 @@
+"Prioritized replay: O(N) priority vector (previous implementation) vs sum/min-tree, priority bookkeeping only."
+import timeit
+import numpy as np
+from reward.utils.buffers import SumTree, MinTree
+
+BS, ALPHA, BETA, REPEAT = 32, .6, .4, 50
+
+
+class ArrayPr:
+    def __init__(self, maxlen): self.probs = np.ones(maxlen)
+
+    def step(self, i):
+        self.probs[i] = np.max(self.probs)
+        probs = self.probs / np.sum(self.probs)
+        idxs = np.random.choice(len(self.probs), BS, replace=False, p=probs)
+        is_ws = (self.probs[idxs] / np.sum(self.probs)) ** -BETA
+        is_ws /= is_ws.max()
+        self.probs[idxs] = (np.random.random(BS) + .01) ** ALPHA
+
+
+class TreePr:
+    def __init__(self, maxlen):
+        self.st, self.mt, self.max_pr = SumTree(maxlen), MinTree(maxlen), 1.
+        self.st[np.arange(maxlen)], self.mt[np.arange(maxlen)] = 1., 1.
+
+    def step(self, i):
+        self.st[i], self.mt[i] = self.max_pr, self.max_pr
+        idxs = self.st.sample(bs=BS)
+        is_ws = (self.st[idxs] / self.mt.reduce()) ** -BETA
+        pr = (np.random.random(BS) + .01) ** ALPHA
+        self.st[idxs], self.mt[idxs] = pr, pr
+        self.max_pr = max(self.max_pr, pr.max())
+
+
+if __name__ == '__main__':
+    print(f'{"maxlen":>10} {"array (us/step)":>18} {"tree (us/step)":>18}')
+    for maxlen in [int(1e4), int(1e5), int(1e6)]:
+        res = []
+        for cls in [ArrayPr, TreePr]:
+            b, i = cls(maxlen), iter(range(REPEAT))
+            res.append(timeit.timeit(lambda: b.step(next(i)), number=REPEAT) / REPEAT * 1e6)
+        print(f'{maxlen:>10} {res[0]:>18.1f} {res[1]:>18.1f}')
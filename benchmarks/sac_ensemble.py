@@ -0,0 +1,69 @@
+"""
+SAC updates on cpu (batch 256, 17 state features, 6 actions, 2x256 MLPs, as for mujoco): two separate critic nets vs
+`rw.nn.EnsembleQ` with K critics evaluated by batched matmuls. K=10 uses REDQ targets (minimum over 2 random critics).
+"""
+import time
+import torch
+import torch.nn as nn
+import reward as rw, reward.utils as U
+
+BS, N_S, N_A, HIDDEN, REPEAT = 256, 17, 6, 256, 50
+
+
+class PolicyNN(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.layers = nn.Sequential(nn.Linear(N_S, HIDDEN), nn.ReLU(), nn.Linear(HIDDEN, HIDDEN), nn.ReLU())
+        self.mean, self.log_std = nn.Linear(HIDDEN, N_A), nn.Linear(HIDDEN, N_A)
+
+    def forward(self, x):
+        x = self.layers(x)
+        return self.mean(x), self.log_std(x).clamp(-20, 2)
+
+
+class QValueNN(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.layers = nn.Sequential(nn.Linear(N_S + N_A, HIDDEN), nn.ReLU(), nn.Linear(HIDDEN, HIDDEN), nn.ReLU(), nn.Linear(HIDDEN, 1))
+
+    def forward(self, s, a): return self.layers(torch.cat([s, a], dim=1))
+
+
+class Policy:
+    def __init__(self, nn): self.nn = nn
+
+    def get_dist(self, s):
+        mean, log_std = self.nn(s)
+        return rw.dist.TanhNormal(loc=mean, scale=log_std.exp())
+
+    def get_act_pre(self, s=None, dist=None): return (dist or self.get_dist(s=s)).rsample_with_pre()
+    def logprob_pre(self, dist, acs): return dist.log_prob_pre(acs).sum(-1, keepdim=True)
+    def mean(self, dist): return dist.loc
+    def std(self, dist): return dist.scale
+
+
+def make_sac(k):
+    pnn = PolicyNN()
+    opt = lambda nn: torch.optim.Adam(nn.parameters(), lr=3e-4)
+    if k is None:
+        q1nn, q2nn = QValueNN(), QValueNN()
+        return rw.model.SAC(policy=Policy(pnn), q1nn=q1nn, q2nn=q2nn, p_opt=opt(pnn), q1_opt=opt(q1nn), q2_opt=opt(q2nn), entropy=-N_A)
+    qnn = rw.nn.EnsembleQ(n_in=N_S, n_acs=N_A, k=k, hidden=HIDDEN)
+    return rw.model.SAC(policy=Policy(pnn), qnn=qnn, p_opt=opt(pnn), q_opt=opt(qnn), entropy=-N_A, n_min=None if k == 2 else 2)
+
+
+def updates_s(md):
+    b = dict(ss=[torch.randn(BS, 1, N_S)], sns=[torch.randn(BS, 1, N_S)], acs=[torch.rand(BS, 1, N_A) * 2 - 1],
+             rs=torch.randn(BS, 1), ds=torch.zeros(BS, 1))
+    md.train(**b)
+    start = time.perf_counter()
+    for _ in range(REPEAT): md.train(**b)
+    return REPEAT / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    U.device.set_device(torch.device('cpu'))
+    print(f'{torch.get_num_threads()} threads')
+    print(f'{"critics":>18} {"updates/s":>10}')
+    for name, k in [('2 separate nets', None), ('ensemble K=2', 2), ('ensemble K=10', 10)]:
+        print(f'{name:>18} {updates_s(make_sac(k)):>10.1f}')
@@ -0,0 +1,35 @@
+"Replay sampling + `to_tensor` of atari batches (32 x 84x84x4 uint8): fresh arrays (previous implementation) vs gathering into staging buffers (pinned on gpu)."
+import timeit, torch
+import numpy as np
+import reward as rw, reward.utils as U
+
+MAXLEN, BS, REPEAT = 100000, 32, 200
+
+
+def fill(b, n):
+    S, A = rw.space.Image(shape=[1, 84, 84, 1]), rw.space.Categorical(n_acs=4)
+    stack = rw.tfm.img.Stack(n=4)
+    for i in range(n):
+        s = S(np.random.randint(0, 256, size=(1, 84, 84, 1), dtype='uint8')).apply_tfms(stack)
+        b.add_transition(s=[s], a=[A(np.array([0]))], r=np.array([0.]), d=np.array([i % 1000 == 999]))
+    return rw.space.Image(shape=[1, 84, 84, 4]), A
+
+
+def sample(b, S, A):
+    bt = b.sample(bs=BS)
+    x = [S.from_arr(bt.ss[0]).to_tensor(), S.from_arr(bt.sns[0]).to_tensor(), A.from_arr(bt.acs[0]).to_tensor(),
+         U.tensor(bt.rs, dtype=torch.float32), U.tensor(bt.ds, dtype=torch.float32)]
+    if torch.cuda.is_available(): torch.cuda.synchronize()
+    return x
+
+
+if __name__ == '__main__':
+    b = rw.mem.ReplayBuffer(maxlen=MAXLEN)
+    S, A = fill(b, n=MAXLEN)
+    print(f'device: {U.device.get()}')
+    res = []
+    for staging in [None, U.Staging()]:
+        b.staging = staging
+        res.append(timeit.timeit(lambda: sample(b, S, A), number=REPEAT) / REPEAT * 1e6)
+    print(f'{"fresh (us)":>12} {"staging (us)":>13}')
+    print(f'{res[0]:>12.1f} {res[1]:>13.1f}')
@@ -0,0 +1,33 @@
+"""
+Overhead of the timing instrumentation (`U.timing`) per timed call: a plain function vs the same function decorated with
+`U.timing.timed` with timing off and on, and a `U.timing.timeit` block.
+"""
+import time
+import reward.utils as U
+
+REPEAT = 200000
+
+
+def f(x): return x
+
+timed_f = U.timing.timed('f')(f)
+
+def block(x):
+    with U.timing.timeit('block'): return x
+
+
+def call_us(fn):
+    start = time.perf_counter()
+    for i in range(REPEAT): fn(i)
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+
+if __name__ == '__main__':
+    print(f'{"":>12} {"off (us)":>9} {"on (us)":>9}')
+    for name, fn in [('plain', f), ('timed', timed_f), ('timeit', block)]:
+        U.timing.disable()
+        off = call_us(fn)
+        U.timing.enable()
+        on = call_us(fn)
+        U.timing.clear()
+        print(f'{name:>12} {off:>9.3f} {on:>9.3f}')
@@ -1,6 +1,6 @@
 import gym, torch
 import numpy as np, torch.nn as nn, reward as rw, reward.utils as U
-from reward.tfm.img import Gray, Resize, Stack
+from reward.tfm.img import GrayResize, Stack
 
 maxsteps = 40e6
 device = U.device.get()
@@ -54,7 +54,7 @@ class Policy:
 env = U.wrapper.gym.wrap_atari(gym.make('BreakoutNoFrameskip-v4'), clip_rewards=False)
 S = rw.space.Image(shape=[1, 84, 84, 4])
 A = rw.space.Categorical(n_acs=env.action_space.n)
-tfms = [Gray(), Resize(sz=[84, 84]), Stack(n=4)]
+tfms = [GrayResize(sz=[84, 84], reuse=True), Stack(n=4)]
 exp_rate = U.scheds.PieceLinear(values=[1., .1, .01], bounds=[int(1e6), int(24e6)])
 rw.logger.set_logdir('logs/breakout/dddqn-v5-0')
 rw.logger.set_maxsteps(maxsteps)
@@ -76,6 +76,7 @@ for i in range(int(maxsteps)):
     r_sum += r
     agent.report(r=np.array(np.sign(r))[None], d=np.array(d)[None])
     if d:
+        tfms[-1].reset()
         if env.env.was_real_done:
             rw.logger.add_log('reward_unclipped', r_sum, force=True)
             r_sum = 0
@@ -1,7 +1,7 @@
 import gym, torch
 import torch.multiprocessing as mp
 import numpy as np, torch.nn as nn, reward as rw, reward.utils as U
-from reward.tfm.img import Gray, Resize, Stack
+from reward.tfm.img import GrayResize, Stack
 
 maxsteps = 40e6
 device = U.device.get()
@@ -55,7 +55,7 @@ env_fn = lambda: U.wrapper.gym.wrap_atari(gym.make('PongNoFrameskip-v4'), clip_r
 env = env_fn()
 S = rw.space.Image(shape=[1, 84, 84, 4])
 A = rw.space.Categorical(n_acs=env.action_space.n)
-tfms = [Gray(), Resize(sz=[84, 84]), Stack(n=4)]
+tfms = [GrayResize(sz=[84, 84], reuse=True), Stack(n=4)]
 exp_rate = U.scheds.PieceLinear(values=[1., .1, .01], bounds=[int(1e6), int(24e6)])
 rw.logger.set_logdir('logs/pong/breakout/dddqn-parallel-targ1k-500kbuffer-v6-2')
 rw.logger.set_maxsteps(maxsteps)
@@ -1,4 +1,5 @@
 from .agent import Agent
 from .rollout import Rollout
 from .replay import Replay
+from .pr_replay import PrReplay
 from .replay_continual import ReplayContinual
\ No newline at end of file
@@ -1,13 +1,23 @@
+import numpy as np
 import reward as rw, reward.utils as U
 from abc import ABC, abstractmethod
 
 class Agent(ABC):
-    def __init__(self, model, *, s_sp, a_sp):
-        self.md, self.s_sp, self.a_sp = model, U.listify(s_sp), U.listify(a_sp)
-        self._rsum, self._rs, self._eplen = None, [], None
+    """
+    With `fast` the per step overhead is kept low: spaces are only checked on the first step, the global step
+    is increased once per step (by the number of envs) and the returned actions reuse the same containers,
+    copy them if they need to be kept.
+    """
+    # Agents that keep references to the actions instead of copying them should not reuse the containers
+    _reuse_acs = True
+
+    def __init__(self, model, *, s_sp, a_sp, fast=False):
+        self.md, self.s_sp, self.a_sp, self.fast = model, U.listify(s_sp), U.listify(a_sp), fast
+        self.eps, self._acs = U.EpisodeTracker(), None
 
     @abstractmethod
     def register_sa(self, s, a):
+        if self.fast: return U.global_step.add(s[0].shape[0])
         for _ in range(s[0].shape[0]): U.global_step.add(1)
         s, a = U.listify(s), U.listify(a)
         self._check_s(s)
@@ -16,13 +26,12 @@ class Agent(ABC):
     @abstractmethod
     def report(self, r, d):
         assert r.shape == d.shape
-        if self._rsum is None: self._rsum = r
-        else:                  self._rsum += r
-        if self._eplen is None: self._eplen = r * 0.
-        self._eplen += 1
-        self.write_ep_logs(d=d)
+        n = len(self.eps.step(r=r, d=d))
+        if n: self.write_ep_logs(rs=self.eps.rs[-n:], lens=self.eps.lens[-n:])
 
+    @U.timing.timed('agent/get_act')
     def get_act(self, s):
+        if self.fast: return self._get_act_fast(s)
         s = U.listify(s)
         self._check_s(s)
         st = [o.to_tensor() for o in s]
@@ -31,15 +40,25 @@ class Agent(ABC):
         self.register_sa(s=s, a=a)
         return a
 
-    def write_ep_logs(self, d):
-        for i in range(len(d)):
-            if d[i]:
-                self._rs.append(self._rsum[i])
-                rw.logger.add_log('episode/reward', self._rsum[i], force=True)
-                rw.logger.add_log('episode/len', self._eplen[i], force=True)
-                self._rsum[i] = 0
-                self._eplen[i] = 0
-        rw.logger.add_header('Episode', len(self._rs))
+    def _get_act_fast(self, s):
+        s = s if isinstance(s, list) else [s]
+        first = self._acs is None
+        if first: self._check_s(s)
+        acs = self.md.get_act([o.to_tensor() for o in s])
+        acs = [U.to_np(o) for o in (acs if isinstance(acs, list) else [acs])]
+        if first or not self._reuse_acs: self._acs = [sp(np.array(o)) for o, sp in zip(acs, self.a_sp)]
+        else:
+            for o, x in zip(self._acs, acs): o.set(x)
+        if first: self._check_a(self._acs)
+        self.register_sa(s=s, a=self._acs)
+        return self._acs
+
+    def write_ep_logs(self, rs, lens):
+        "Logs the episodes that just finished."
+        for r, l in zip(rs, lens):
+            rw.logger.add_log('episode/reward', r, force=True)
+            rw.logger.add_log('episode/len', l, force=True)
+        rw.logger.add_header('Episode', len(self.eps))
     
     def _check_s(self, s): self._check_space(expected=self.s_sp, recv=s, name='State')
     def _check_a(self, a): self._check_space(expected=self.a_sp, recv=a, name='Action')
@@ -48,4 +67,4 @@ class Agent(ABC):
         if not len(expected) == len(recv): raise ValueError(f'Declared {name} has {len(expected)} inputs but received has {len(recv)}')
         for v1, v2 in zip(expected, recv):            
             if not hasattr(v2, 'sig'): raise TypeError(f'{name} must have a signature. (Image, Continuous or Categorical)')
-            if not isinstance(v1, v2.sig): raise TypeError(f'{name} and Declared space dont match. Expected {v1} got {v2.sig}')
\ No newline at end of file
+            if not isinstance(v1, v2.sig): raise TypeError(f'{name} and Declared space dont match. Expected {v1} got {v2.sig}')
@@ -0,0 +1,32 @@
+import torch
+import reward.utils as U
+from .replay import Replay
+from reward.mem import PrReplayBuffer
+
+
+class PrReplay(Replay):
+    "Prioritized replay, the model `train` should accept `is_ws` and return the new priorities (e.g. TD errors)."
+    def __init__(self, model, *, s_sp, a_sp, bs, maxlen, pr_factor=.6, is_factor=1., min_pr=.01, learn_freq=1., learn_start=0,
+                 prefetch=0, deterministic=False, n_step=1, n_updates=1, fast=False):
+        super().__init__(model=model, s_sp=s_sp, a_sp=a_sp, bs=bs, maxlen=maxlen, learn_freq=learn_freq, learn_start=learn_start,
+                         prefetch=prefetch, deterministic=deterministic, n_step=n_step, n_updates=n_updates, fast=fast)
+        self.b = PrReplayBuffer(maxlen=maxlen, pr_factor=pr_factor, is_factor=is_factor, min_pr=min_pr, staging=self.staging,
+                                n_step=n_step, gamma=model.gamma)
+
+    def add_segment(self, **kwargs):
+        "Inserts a segment of transitions collected elsewhere, see `PrReplayBuffer.add_segment`."
+        with self._lock: self.b.add_segment(**kwargs)
+
+    def learn(self):
+        b = self._next_batch()
+        idxs, nwritten = b.pop('idxs'), b.pop('nwritten')
+        with U.timing.timeit('model/train'):
+            if self.n_updates == 1: pr = self.md.train(**b)
+            else:                   pr = torch.cat([o.reshape(-1) for o in self.md.train_many(**self._split(b))])
+        # Prefetched batches can be a few steps old, their transitions may have been replaced since
+        with self._lock: self.b.update_pr(idxs=idxs, pr=U.to_np(pr), nwritten=nwritten)
+
+    def _get_batch(self):
+        b = super()._get_batch()
+        b['is_ws'] = U.tensor(b['is_ws'], dtype=torch.float32)
+        return b
@@ -1,31 +1,65 @@
-import torch
+import torch, threading
 import reward.utils as U
 from .agent import Agent
 from reward.mem import ReplayBuffer
 
 
 class Replay(Agent):
-    def __init__(self, model, *, s_sp, a_sp, bs, maxlen, learn_freq=1., learn_start=0):
-        super().__init__(model=model, s_sp=s_sp, a_sp=a_sp)
-        self.bs, self.learn_freq, self.learn_start = bs, learn_freq, learn_start
-        self.b = ReplayBuffer(maxlen=maxlen)
+    """
+    Trains the model with batches sampled from a replay buffer. With `prefetch > 0` up to `prefetch`
+    batches are sampled and sent to the device in a background thread while the model trains,
+    `deterministic` keeps sampling in the main thread (see `U.Prefetcher`).
+    With `n_step > 1` the model is trained on n-step transitions discounted by its `gamma` (see `rw.mem.ReplayBuffer`).
+    With `n_updates > 1` each training step samples `n_updates` batches in a single gather, sent to the device at once,
+    and the model trains on each of them (see `Model.train_many`), for high update-to-data ratios.
+    """
+    def __init__(self, model, *, s_sp, a_sp, bs, maxlen, learn_freq=1., learn_start=0, prefetch=0, deterministic=False, n_step=1,
+                 n_updates=1, fast=False):
+        super().__init__(model=model, s_sp=s_sp, a_sp=a_sp, fast=fast)
+        self.bs, self.learn_freq, self.learn_start, self.n_updates = bs, learn_freq, learn_start, n_updates
+        # Guards the buffer, batches are sampled from a consistent view even when prefetching
+        self._lock = threading.Lock()
+        self.prefetcher = U.Prefetcher(self._get_batch, n=prefetch, deterministic=deterministic) if prefetch else None
+        # Batches are gathered into pinned memory when training on the gpu
+        self.staging = U.Staging() if U.device.get().type == 'cuda' else None
+        self.b = ReplayBuffer(maxlen=maxlen, staging=self.staging, n_step=n_step, gamma=model.gamma)
         
     def register_sa(self, s, a):
         super().register_sa(s=s, a=a)
-        self.b.add_sa(s=U.listify(s), a=U.listify(a))
+        with self._lock: self.b.add_sa(s=U.listify(s), a=U.listify(a))
 
+    @U.timing.timed('agent/report')
     def report(self, r, d):
         super().report(r=r, d=d)
-        self.b.add_rd(r=r, d=d)
+        with self._lock: self.b.add_rd(r=r, d=d)
         gstep = U.global_step.get()
-        if len(self.b) > self.bs and gstep % self.learn_freq == 0 and gstep > self.learn_start:
-            self.md.train(**self._get_batch())
+        if self.b.n_sampleable >= self.bs and gstep % self.learn_freq == 0 and gstep > self.learn_start: self.learn()
 
+    def learn(self):
+        "Trains the model with a single batch, or with `n_updates` batches."
+        b = self._next_batch()
+        with U.timing.timeit('model/train'):
+            if self.n_updates == 1: return self.md.train(**b)
+            return self.md.train_many(**self._split(b))
+
+    def _next_batch(self): return self._get_batch() if self.prefetcher is None else self.prefetcher.get()
+
+    @U.timing.timed('agent/get_batch')
     def _get_batch(self):
-        b = self.b.sample(bs=self.bs)            
-        b['ss'] = [sp.from_list(o).to_tensor() for o, sp in zip(b['ss'], self.s_sp)]
-        b['sns'] = [sp.from_list(o).to_tensor() for o, sp in zip(b['sns'], self.s_sp)]
-        b['acs'] = [sp.from_list(o).to_tensor() for o, sp in zip(b['acs'], self.a_sp)]
+        with self._lock: b = self.b.sample(bs=self.bs * self.n_updates)
+        return self._to_tensor(b)
+
+    def _split(self, b):
+        "Batches of `n_updates * bs` samples to super-batches of shape (n_updates, bs, ...)."
+        split = lambda o: o.reshape(self.n_updates, -1, *o.shape[1:])
+        return {k: [split(o) for o in v] if isinstance(v, list) else split(v) for k, v in b.items()}
+
+    @U.timing.timed('agent/to_tensor')
+    def _to_tensor(self, b):
+        b['ss'] = [sp.from_arr(o).to_tensor() for o, sp in zip(b['ss'], self.s_sp)]
+        b['sns'] = [sp.from_arr(o).to_tensor() for o, sp in zip(b['sns'], self.s_sp)]
+        b['acs'] = [sp.from_arr(o).to_tensor() for o, sp in zip(b['acs'], self.a_sp)]
         b['rs'] = U.tensor(b['rs'], dtype=torch.float32)
         b['ds'] = U.tensor(b['ds'], dtype=torch.float32)
+        if 'gammas' in b: b['gammas'] = U.tensor(b['gammas'], dtype=torch.float32)
         return b
@@ -4,8 +4,11 @@ from .agent import Agent
 
 
 class Rollout(Agent):
-    def __init__(self, model, *, s_sp, a_sp, bs):
-        super().__init__(model=model, s_sp=s_sp, a_sp=a_sp)
+    # The rollout keeps the actions objects
+    _reuse_acs = False
+
+    def __init__(self, model, *, s_sp, a_sp, bs, fast=False):
+        super().__init__(model=model, s_sp=s_sp, a_sp=a_sp, fast=fast)
         self.bs = bs
         self.b = RollBatch()
         
@@ -13,11 +16,17 @@ class Rollout(Agent):
         super().register_sa(s=s, a=a)
         self.b.add_sa(s=U.listify(s), a=U.listify(a))
     
+    @U.timing.timed('agent/report')
     def report(self, r, d):
         super().report(r=r, d=d)
         self.b.add_rd(r=r, d=d)
-        if len(self.b) > self.bs: self.md.train(**self._get_batch())
+        if len(self.b) > self.bs: self.learn()
+
+    def learn(self):
+        b = self._get_batch()
+        with U.timing.timeit('model/train'): self.md.train(**b)
 
+    @U.timing.timed('agent/get_batch')
     def _get_batch(self):
         b = self.b.get()            
         b['ss'] = [sp.from_list(o).to_tensor() for o, sp in zip(b['ss'], self.s_sp)]
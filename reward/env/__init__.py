@@ -8,6 +8,7 @@ from .base_env import BaseEnv
 from .gym_env import GymEnv
 from .atari_env import AtariEnv
 from .roboschool_env import RoboschoolEnv
+from .vec_env import VecEnv, SyncVecEnv, SubprocVecEnv
 import reward.env.wrappers
 
-__all__ = ["BaseEnv", "GymEnv", "RoboschoolEnv", "AtariEnv"]
+__all__ = ["BaseEnv", "GymEnv", "RoboschoolEnv", "AtariEnv", "VecEnv", "SyncVecEnv", "SubprocVecEnv"]
@@ -0,0 +1,298 @@
+import numpy as np
+import multiprocessing as mp
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from functools import partial
+
+RESET, STEP = 0, 1
+
+
+class VecEnv(ABC):
+    """
+    Steps a batch of envs with a single call, states, rewards and dones are returned
+    as arrays with the envs as first dimension.
+
+    Envs are reset automatically when an episode ends, the state returned for them is the
+    first state of the new episode and the last state of the finished one is kept in
+    `terminal_ss` (only valid where done).
+    """
+    @property
+    @abstractmethod
+    def n_envs(self): pass
+
+    @abstractmethod
+    def reset(self): pass
+
+    @abstractmethod
+    def step_async(self, acs): pass
+
+    @abstractmethod
+    def step_wait(self): pass
+
+    def step(self, acs):
+        self.step_async(acs)
+        return self.step_wait()
+
+    def close(self): pass
+
+
+class SyncVecEnv(VecEnv):
+    """
+    Steps all envs in the current process, useful for cheap envs where communicating
+    with other processes would cost more than stepping the envs.
+
+    Parameters
+    ----------
+    envs: list
+        Envs to be stepped.
+    s_fns: list
+        Optional function for each env, applied to all states returned by it (e.g. transforms). If it has a `reset`
+        method (e.g. `rw.runner.paac.StateTfms`) it's called before the first state of each episode, the terminal
+        state of an episode is transformed before that.
+    """
+    def __init__(self, envs, s_fns=None):
+        self.envs, self.s_fns = envs, s_fns
+        self.ss, self.rs, self.ds, self.terminal_ss = None, None, None, None
+        self._acs = None
+
+    @property
+    def n_envs(self): return len(self.envs)
+
+    def reset(self):
+        ss = [self._s(i, env.reset(), reset=True) for i, env in enumerate(self.envs)]
+        if self.ss is None: self._alloc(ss[0])
+        self.reset_into(self.ss, ss=ss)
+        return self.ss
+
+    def step_async(self, acs): self._acs = acs
+
+    def step_wait(self):
+        infos = self.step_into(self._acs, ss=self.ss, rs=self.rs, ds=self.ds, terminal_ss=self.terminal_ss)
+        return self.ss, self.rs, self.ds, infos
+
+    def reset_into(self, out, ss=None):
+        "Resets all envs writing the states into `out`."
+        ss = ss or [self._s(i, env.reset(), reset=True) for i, env in enumerate(self.envs)]
+        for i, s in enumerate(ss): out[i] = s
+
+    def step_into(self, acs, *, ss, rs, ds, terminal_ss):
+        "Steps all envs writing the results into the given arrays, returns the infos."
+        r_list, d_list, infos = [], [], []
+        for i, (env, a) in enumerate(zip(self.envs, acs)):
+            # TODO: Squeeze may cause problems
+            s, r, d, info = env.step(a.squeeze())
+            s = self._s(i, s)
+            if d:
+                terminal_ss[i] = s
+                s = self._s(i, env.reset(), reset=True)
+            ss[i] = s
+            r_list.append(r)
+            d_list.append(d)
+            infos.append(info)
+        rs[:], ds[:] = r_list, d_list
+        return infos
+
+    def close(self):
+        for env in self.envs: env.close()
+
+    def _s(self, i, s, reset=False):
+        if self.s_fns is None: return s
+        # Stateful functions (e.g. frame stacking) start over with each episode
+        if reset and hasattr(self.s_fns[i], 'reset'): self.s_fns[i].reset()
+        return self.s_fns[i](s)
+
+    def _alloc(self, s):
+        s = np.asarray(s)
+        self.ss, self.terminal_ss = np.zeros((2, self.n_envs, *s.shape), dtype=s.dtype)
+        self.rs, self.ds = np.zeros((2, self.n_envs), dtype=np.float32)
+
+
+def _worker(env_fns, s_fns, ss, terminal_ss, acs, rs, ds, infos, cmd, go, done, conn):
+    ss, terminal_ss, acs, rs, ds = ss.arr, terminal_ss.arr, acs.arr, rs.arr, ds.arr
+    infos = {k: v.arr for k, v in infos.items()}
+    venv = SyncVecEnv([fn() for fn in env_fns], s_fns=s_fns)
+    while True:
+        go.acquire()
+        c, slot = cmd
+        if c == RESET: venv.reset_into(ss[slot])
+        else:
+            step_infos = venv.step_into(acs, ss=ss[slot], rs=rs[slot], ds=ds[slot], terminal_ss=terminal_ss[slot])
+            # Only keys from the info schema are sent back, missing ones are NaN (0 for non float dtypes)
+            for k, v in infos.items():
+                missing = np.nan if v.dtype.kind == 'f' else 0
+                v[slot] = [info.get(k, missing) for info in step_infos]
+            if conn is not None: conn.send({i: step_infos[i] for i in np.flatnonzero(ds[slot])})
+        done.release()
+
+
+class SubprocVecEnv(VecEnv):
+    """
+    Steps envs split between `n_workers` processes, each of them stepping its envs with a `SyncVecEnv`.
+
+    Workers write directly into shared memory and are synchronized with semaphores.
+    States, rewards and dones can be multi-buffered (`n_bufs`): the returned arrays are views into
+    shared memory (no copies), they stay valid until `n_bufs - 1` further calls to `step`/`reset`,
+    copy them if they need to live longer.
+
+    Stepping can be split in `step_async`/`step_wait` so work can be done while the workers step.
+    With `n_groups > 1` the envs (and workers) are split into groups that are stepped independently.
+
+    Parameters
+    ----------
+    env_fns: list
+        Functions creating each env, called inside the worker processes.
+    s_shape, s_dtype, a_shape, a_dtype:
+        Shape and dtype of the state and action of a single env.
+    s_fns: list
+        Optional function for each env, applied (inside the workers) to all states returned by it.
+    info_schema: dict
+        Maps info keys to dtypes (e.g. `{'ale.lives': np.int32}`), these values are written to
+        shared arrays (multi-buffered like the states) at every step. Keys not in the schema are dropped,
+        keys missing from an info are NaN (0 for non float dtypes).
+    info_on_done: bool
+        If True, the full info of an env is also sent back when its episode ends.
+    d_dtype:
+        Dtype of the returned dones.
+    start_method: str
+        Start method of the worker processes ('fork', 'spawn' or 'forkserver'), the platform default if None.
+        Except with 'fork', `env_fns` and `s_fns` are pickled (e.g. module level functions or `functools.partial`).
+    """
+    def __init__(self, env_fns, s_shape, s_dtype, a_shape, a_dtype, n_workers=None, s_fns=None, n_bufs=1,
+                 n_groups=1, info_schema=None, info_on_done=False, d_dtype=np.float32, start_method=None):
+        self.env_fns, self.s_fns = env_fns, s_fns
+        self._ctx = mp.get_context(start_method)
+        self.n_workers = n_workers or mp.cpu_count()
+        if not self.n_workers % n_groups == 0: raise ValueError('n_workers should be divisible by n_groups')
+        self.n_bufs, self.n_groups, self.info_on_done = n_bufs, n_groups, info_on_done
+        self._slots, self._pending = [-1] * n_groups, [False] * n_groups
+        self._create_shared(s_shape=s_shape, s_dtype=s_dtype, a_shape=a_shape, a_dtype=a_dtype, info_schema=info_schema or {},
+                            d_dtype=d_dtype)
+        self._create_workers()
+
+    @property
+    def n_envs(self): return len(self.env_fns)
+
+    @property
+    def terminal_ss(self):
+        if self.n_groups == 1: return self._terminal_ss[self._slots[0]]
+        return np.concatenate([self._terminal_ss[self._slots[g], self._envs(g)] for g in range(self.n_groups)])
+
+    def reset(self, group=None):
+        "Resets all envs (concatenating groups if `n_groups > 1`) or only the envs of `group`."
+        if group is not None: return self._reset(group)
+        if self.n_groups == 1: return self._reset(group=0)
+        return np.concatenate([self._reset(group=g) for g in range(self.n_groups)])
+
+    def step(self, acs):
+        acs = np.asarray(acs)
+        for g in range(self.n_groups): self.step_async(acs[self._envs(g)], group=g)
+        res = [self._collect(g) for g in range(self.n_groups)]
+        if self.n_groups == 1: return res[0]
+        ss, rs, ds, infos = zip(*res)
+        return np.concatenate(ss), np.concatenate(rs), np.concatenate(ds), sum(infos, [])
+
+    def step_async(self, acs, group=0):
+        "Starts stepping the envs of `group` with `acs` and returns immediately, results are collected by `step_wait`."
+        self._acs[self._envs(group)] = acs
+        self._send(cmd=STEP, group=group)
+
+    def step_wait(self, group=0):
+        "Waits for the envs of `group` to finish the step started by `step_async`."
+        return self._collect(group)
+
+    def close(self):
+        for w in self._workers: w.p.terminate()
+
+    def _reset(self, group):
+        self._send(cmd=RESET, group=group)
+        self._wait(group)
+        return self._ss[self._slots[group], self._envs(group)]
+
+    def _collect(self, group):
+        self._wait(group)
+        slot, envs = self._slots[group], self._envs(group)
+        return self._ss[slot, envs], self._rs[slot, envs], self._ds[slot, envs], self._get_infos(group)
+
+    def _envs(self, group):
+        # Envs of a group are the ones from its workers, see `_create_workers`
+        n = self.n_workers // self.n_groups
+        return slice(self._starts[group * n], self._starts[(group + 1) * n])
+
+    def _group_workers(self, group):
+        n = self.n_workers // self.n_groups
+        return self._workers[group * n:(group + 1) * n]
+
+    def _send(self, cmd, group):
+        if self._pending[group]: raise RuntimeError(f'Group {group} is still stepping, step_wait should be called first')
+        self._pending[group] = True
+        self._slots[group] = slot = (self._slots[group] + 1) % self.n_bufs
+        self._cmds[group][0], self._cmds[group][1] = cmd, slot
+        for w in self._group_workers(group): w.go.release()
+
+    def _wait(self, group):
+        if not self._pending[group]: raise RuntimeError(f'Group {group} is not stepping, step_async should be called first')
+        for _ in self._group_workers(group): self._dones[group].acquire()
+        self._pending[group] = False
+
+    def _get_infos(self, group):
+        "Values from the info schema for each env, merged with full infos of finished episodes."
+        envs = self._envs(group)
+        values = {k: v[self._slots[group], envs].tolist() for k, v in self._infos.items()}
+        infos = [{k: v[i] for k, v in values.items()} for i in range(envs.stop - envs.start)]
+        if self.info_on_done:
+            for w in self._group_workers(group):
+                for i, info in w.conn.recv().items():
+                    i += w.start - envs.start
+                    infos[i] = {**info, **infos[i]}
+        return infos
+
+    def _create_shared(self, s_shape, s_dtype, a_shape, a_dtype, info_schema, d_dtype):
+        bufs, shared = (self.n_bufs, self.n_envs), partial(_Shared, ctx=self._ctx)
+        # Shared arrays by name, the returned arrays are views into them
+        self._shared = dict(ss=shared(bufs + tuple(s_shape), s_dtype), terminal_ss=shared(bufs + tuple(s_shape), s_dtype),
+                            rs=shared(bufs, np.float32), ds=shared(bufs, d_dtype), acs=shared((self.n_envs,) + tuple(a_shape), a_dtype))
+        self._shared_infos = {k: shared(bufs, dt) for k, dt in info_schema.items()}
+        self._ss, self._terminal_ss, self._rs, self._ds, self._acs = [self._shared[k].arr for k in ['ss', 'terminal_ss', 'rs', 'ds', 'acs']]
+        self._infos = {k: v.arr for k, v in self._shared_infos.items()}
+        # Command and buffer slot to be used by the workers of each group
+        self._cmds = [self._ctx.RawArray('i', 2) for _ in range(self.n_groups)]
+        self._dones = [self._ctx.Semaphore(0) for _ in range(self.n_groups)]
+
+    def _create_workers(self):
+        Worker = namedtuple('Worker', 'p go conn start')
+        q, r = divmod(self.n_envs, self.n_workers)
+        self._starts = [i*q + min(i, r) for i in range(self.n_workers + 1)]
+        self._workers = []
+        for i, (start, end) in enumerate(zip(self._starts[:-1], self._starts[1:])):
+            envs, g = slice(start, end), i // (self.n_workers // self.n_groups)
+            go = self._ctx.Semaphore(0)
+            conn, child_conn = self._ctx.Pipe() if self.info_on_done else (None, None)
+            # Shared states, rewards, dones and infos have the buffer slot as the first dim
+            sh = self._shared
+            args = (self.env_fns[envs], None if self.s_fns is None else self.s_fns[envs], sh['ss'][:, envs], sh['terminal_ss'][:, envs],
+                    sh['acs'][envs], sh['rs'][:, envs], sh['ds'][:, envs], {k: v[:, envs] for k, v in self._shared_infos.items()},
+                    self._cmds[g], go, self._dones[g], child_conn)
+            p = self._ctx.Process(target=_worker, args=args)
+            p.daemon = True
+            p.start()
+            self._workers.append(Worker(p=p, go=go, conn=conn, start=start))
+
+
+class _Shared:
+    """
+    Numpy array (`arr`) backed by shared memory. Indexing gives a `_Shared` view, pickled (e.g. as an argument of a worker
+    process) as the shared buffer and the index, so the view is rebuilt on the same memory whatever the start method.
+    """
+    def __init__(self, shape, dtype, ctx=mp, raw=None, key=()):
+        self.shape, self.dtype, self.key = tuple(shape), np.dtype(dtype), key
+        self.raw = ctx.RawArray('b', max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)) if raw is None else raw
+        self.arr = np.frombuffer(self.raw, dtype=self.dtype, count=int(np.prod(self.shape))).reshape(self.shape)[key]
+
+    def __getitem__(self, key):
+        if self.key != (): raise RuntimeError('Views of views are not supported')
+        return _Shared(self.shape, self.dtype, raw=self.raw, key=key)
+
+    def __getstate__(self): return self.shape, self.dtype, self.raw, self.key
+    def __setstate__(self, state):
+        shape, dtype, raw, key = state
+        self.__init__(shape, dtype, raw=raw, key=key)
@@ -7,6 +7,8 @@ def set_logdir(logdir): return _logger.set_logdir(logdir)
 def set_logfreq(logfreq): return _logger.set_logfreq(logfreq)
 def set_maxsteps(maxsteps): return _logger.set_maxsteps(maxsteps=maxsteps)
 def set_debug(debug=True): _logger.debug = debug
+def set_buffered(buffered=True, hist_rate=1., queue_len=16):
+    return _logger.set_buffered(buffered=buffered, hist_rate=hist_rate, queue_len=queue_len)
 
 def get_logdir(): return _logger.logdir
 
@@ -14,6 +16,8 @@ def subscribe_log(callback): return _logger.subscribe_log(callback=callback)
 
 def log(): return _logger.log()
 
+def flush(): return _logger.flush()
+
 def add_histogram(name, values): return _logger.add_histogram(name=name, values=values)
 
 def add_log(name, value, precision=2, hidden=False, force=False):
@@ -1,3 +1,4 @@
+import atexit, queue, random, threading, torch
 import numpy as np, reward.utils as U
 from collections import namedtuple, OrderedDict
 from tqdm.autonotebook import tqdm
@@ -6,13 +7,28 @@ from tensorboardX import SummaryWriter
 
 Log = namedtuple('Log', 'val prec hid')
 class Logger:
-    "Common logger used by all agents, writes to file and prints a pretty table."
+    """
+    Common logger used by all agents, writes to file and prints a pretty table.
+
+    In buffered mode (see `set_buffered`) logged tensors are kept as they are (e.g. on the gpu) and converted only when
+    logging, all at once, forced logs are kept until then too. Histograms are only recorded for a fraction `hist_rate`
+    of the calls and files are written by a background thread, fed by a queue of at most `queue_len` logs.
+    """
     def __init__(self, logfreq=1000, maxsteps=None):
         self.logfreq, self.pbar = int(logfreq), tqdm(total=maxsteps, dynamic_ncols=True, unit_scale=True)
         self.logs,self.hists,self.header,self.writer,self._next_log = {},{},OrderedDict(),None,U.global_step.get()+logfreq
         self.debug, self.callbacks = False, []
+        self.buffered, self.hist_rate, self._forced, self._q, self._writer_error = False, 1., [], None, None
         U.global_step.subscribe_add(self._gstep_callback)
 
+    def set_buffered(self, buffered=True, hist_rate=1., queue_len=16):
+        self.flush()
+        self.buffered, self.hist_rate = buffered, hist_rate
+        if buffered and self._q is None:
+            self._q = queue.Queue(maxsize=queue_len)
+            threading.Thread(target=self._run_writer, daemon=True).start()
+            atexit.register(self.flush)
+
     def subscribe_log(self, callback): self.callbacks.append(callback)
 
     def set_logfreq(self, logfreq): self.logfreq = logfreq
@@ -27,10 +43,16 @@ class Logger:
 
     def add_log(self, name, value, precision=2, hidden=False, force=False):
         self._check_writer()
+        if self.buffered and isinstance(value, torch.Tensor): value = value.detach()
         self.logs[name] = Log(val=value, prec=precision, hid=hidden)
-        if force: self.writer.add_scalar(name, U.to_np(value), global_step=U.global_step.get())
+        if not force: return
+        if self.buffered: self._forced.append((name, value, U.global_step.get()))
+        else:             self.writer.add_scalar(name, U.to_np(value), global_step=U.global_step.get())
 
-    def add_histogram(self, name, values): self.hists[name] = U.to_np(values)
+    def add_histogram(self, name, values):
+        if not self.buffered: self.hists[name] = U.to_np(values)
+        elif self.hist_rate >= 1. or random.random() < self.hist_rate:
+            self.hists[name] = values.detach() if isinstance(values, torch.Tensor) else values
 
     def add_header(self, name, value): self.header[name] = value
 
@@ -38,13 +60,43 @@ class Logger:
         self._check_writer()
         step, rate = U.global_step.get(), self.pbar.n/(self.pbar._time() - self.pbar.start_t)
         self.header.update(OrderedDict(Step=step, Rate=f'{rate:.2f} steps/s'))
-        for k, v in self.logs.items(): self.logs[k] = self.logs[k]._replace(val=U.to_np(self.logs[k].val))
+        vals = _to_np_all([v.val for v in self.logs.values()] + [v for _, v, _ in self._forced])
+        for k, v in zip(list(self.logs), vals): self.logs[k] = self.logs[k]._replace(val=v)
+        forced = [(k, v, s) for (k, _, s), v in zip(self._forced, vals[len(self.logs):])]
         logs = {k: f'{v.val:.{v.prec}f}' for k, v in self.logs.items() if not v.hid}
         if logs: print_table(logs, self.header)
         self.add_log(name='steps_second', value=rate, hidden=True)
-        for k, v in self.logs.items(): self.writer.add_scalar(k, v.val, global_step=step)
-        for k, v in self.hists.items(): self.writer.add_histogram(k, v, global_step=step)
-        self.logs, self.hists, self.header = {}, {}, OrderedDict()
+        scalars = [(k, v.val, step) for k, v in self.logs.items()] + forced
+        hists = [(k, U.to_np(v), step) for k, v in self.hists.items()]
+        if self.buffered: self._put(scalars, hists)
+        else:             self._write(scalars, hists)
+        self.logs, self.hists, self.header, self._forced = {}, {}, OrderedDict(), []
+
+    def flush(self):
+        "Waits for the background writes to finish."
+        if self._q is not None: self._q.join()
+        self._check_writer_error()
+
+    def _write(self, scalars, hists):
+        for k, v, step in scalars: self.writer.add_scalar(k, v, global_step=step)
+        for k, v, step in hists: self.writer.add_histogram(k, v, global_step=step)
+
+    def _put(self, scalars, hists):
+        self._check_writer_error()
+        # Blocks when the writer is behind by `queue_len` logs
+        self._q.put((scalars, hists))
+
+    def _run_writer(self):
+        while True:
+            scalars, hists = self._q.get()
+            try: self._write(scalars, hists)
+            except Exception as e: self._writer_error = e
+            finally: self._q.task_done()
+
+    def _check_writer_error(self):
+        if self._writer_error is not None:
+            e, self._writer_error = self._writer_error, None
+            raise RuntimeError('Exception raised by the logger writer thread') from e
 
     def close_pbar(self): self.pbar.close()
 
@@ -59,6 +111,17 @@ class Logger:
         if self.writer is None: self.writer = SummaryWriter(log_dir='/tmp/reward/logs')
 
 
+def _to_np_all(vals):
+    "Converts values to numpy, scalar tensors are gathered with a single copy (and sync) per device."
+    vals, devs = list(vals), {}
+    for i, v in enumerate(vals):
+        if isinstance(v, torch.Tensor) and v.numel() == 1: devs.setdefault(v.device, []).append(i)
+    for idxs in devs.values():
+        arr = torch.stack([vals[i].detach().reshape(()).float() for i in idxs]).cpu().numpy()
+        for i, v in zip(idxs, arr): vals[i] = v
+    return [U.to_np(v) for v in vals]
+
+
 def print_table(tags_values, header=None, width=60):
     "Prints a pretty table =). Expects keys and values of dict to be a string"
     tags_maxlen = max(len(tag) for tag in tags_values)
@@ -1,2 +1,5 @@
 from .replay_buffer import ReplayBuffer
-from .deque_buffer import DequeBuffer
\ No newline at end of file
+from .deque_buffer import DequeBuffer
+from .pr_replay_buffer import PrReplayBuffer
+from .memmap_buffer import MemmapReplayBuffer
+from .compressed_buffer import CompressedReplayBuffer
@@ -0,0 +1,47 @@
+import bz2, lzma, os, pickle, zlib
+import numpy as np
+from functools import partial
+
+# Soft dependencies
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+# Codec name: (compress, decompress), fast settings are used, replay data is mostly cheap to compress
+CODECS = {None: (bytes, bytes), 'zlib': (partial(zlib.compress, level=1), zlib.decompress),
+          'bz2': (partial(bz2.compress, compresslevel=1), bz2.decompress), 'lzma': (partial(lzma.compress, preset=0), lzma.decompress)}
+if lz4 is not None: CODECS['lz4'] = (lz4.compress, lz4.decompress)
+if zstd is not None: CODECS['zstd'] = (lambda b: zstd.ZstdCompressor(level=1).compress(b), lambda b: zstd.ZstdDecompressor().decompress(b))
+
+
+def get_codec(codec):
+    if codec not in CODECS: raise ValueError(f'Codec {codec} not available, available codecs are {list(CODECS)}')
+    return CODECS[codec]
+
+
+def write_chunk(path, cols, codec=None):
+    "Writes the arrays in `cols` (a dict) to a single file, replacing it atomically."
+    compress = get_codec(codec)[0]
+    data = {k: (v.dtype.str, v.shape, compress(np.ascontiguousarray(v).data)) for k, v in cols.items()}
+    dump(path, dict(codec=codec, data=data))
+
+
+def read_chunk(path):
+    chunk = load(path)
+    decompress = get_codec(chunk['codec'])[1]
+    return {k: np.frombuffer(decompress(b), dtype=dt).reshape(shape) for k, (dt, shape, b) in chunk['data'].items()}
+
+
+def dump(path, obj):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f: pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load(path):
+    with open(str(path), 'rb') as f: return pickle.load(f)
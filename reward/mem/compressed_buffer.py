@@ -0,0 +1,94 @@
+import os
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .replay_buffer import ReplayBuffer, _store_dtype
+from .checkpoint import get_codec
+
+
+class CompressedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer with each frame (the state of an env at a step) compressed on insertion with `codec`
+    (see `checkpoint.CODECS`), atari frames usually shrink several times. Same API as `ReplayBuffer`.
+
+    Sampled frames are decompressed by a pool of `n_threads` threads (codecs release the GIL),
+    the `cache_len` most recently used decompressed frames are kept in a LRU cache, e.g. frames
+    shared by consecutive stacks or by the states and next states of a batch.
+    """
+    def __init__(self, maxlen, num_envs=None, staging=None, n_step=1, gamma=.99, codec='zlib', cache_len=4096, n_threads=None):
+        super().__init__(maxlen=maxlen, num_envs=num_envs, staging=staging, n_step=n_step, gamma=gamma)
+        self.codec, self.cache_len = codec, cache_len
+        get_codec(codec)
+        self.n_threads = n_threads or min(4, os.cpu_count())
+        self.pool = ThreadPoolExecutor(self.n_threads) if self.n_threads > 1 else None
+
+    @property
+    def nbytes(self):
+        "Bytes used by the compressed frames."
+        return sum(col.nbytes for col in self.ss or [])
+
+    def _alloc(self, xs, name=None):
+        if not name == 'ss': return super()._alloc(xs, name=name)
+        return [Frames(shape=(self.nsteps, *np.shape(o)), dtype=_store_dtype(np.asarray(o).dtype), codec=self.codec,
+                       cache_len=self.cache_len, pool=self.pool, n_threads=self.n_threads) for o in xs]
+
+    def _take(self, col, idxs, key):
+        if not isinstance(col, Frames): return super()._take(col, idxs, key=key)
+        x = col.take(idxs)
+        if self.staging is None: return x
+        out = self.staging.get(key, shape=x.shape, dtype=x.dtype)
+        out[...] = x
+        return out
+
+
+class Frames:
+    "Column of frames compressed one by one, indexed like an array of shape (nsteps, num_envs, *shape)."
+    def __init__(self, shape, dtype, codec, cache_len=0, pool=None, n_threads=1):
+        self.shape, self.dtype, self.cache_len, self.pool, self.n_threads = tuple(shape), np.dtype(dtype), cache_len, pool, n_threads
+        self.compress, self.decompress = get_codec(codec)
+        self.data = np.full(self.shape[:2], None, dtype=object)
+        self._flat = np.arange(self.data.size).reshape(self.data.shape)
+        self._cache = OrderedDict()
+
+    @property
+    def nbytes(self): return sum(len(b) for b in self.data.reshape(-1) if b is not None)
+
+    def __len__(self): return self.shape[0]
+
+    def __setitem__(self, key, x):
+        idxs = self._flat[key].reshape(-1)
+        x = np.broadcast_to(np.asarray(x, dtype=self.dtype), (*self._flat[key].shape, *self.shape[2:]))
+        flat = self.data.reshape(-1)
+        for i, f in zip(idxs, x.reshape(-1, *self.shape[2:])):
+            flat[i] = self.compress(np.ascontiguousarray(f).data)
+            self._cache.pop(i, None)
+
+    # Bulk reads (e.g. saving) bypass the cache
+    def __getitem__(self, key): return self.take(self._flat[key], cache=False)
+
+    def take(self, idxs, cache=True):
+        "Frames at flat indexes (`step * num_envs + env`), with shape (*idxs.shape, *shape)."
+        idxs = np.asarray(idxs)
+        uidxs, inv = np.unique(idxs, return_inverse=True)
+        frames = np.empty((len(uidxs), *self.shape[2:]), dtype=self.dtype)
+        missing = []
+        for j, i in enumerate(uidxs.tolist()):
+            f = self._cache.get(i) if cache else None
+            if f is None: missing.append(j)
+            else:
+                frames[j] = f
+                self._cache.move_to_end(i)
+        if self.pool is None or len(missing) < 2: self._decompress(frames, uidxs, missing)
+        else: list(self.pool.map(lambda js: self._decompress(frames, uidxs, js), np.array_split(missing, self.n_threads)))
+        if cache and self.cache_len:
+            # Copies, views would keep the whole batch alive
+            for j in missing: self._cache[int(uidxs[j])] = frames[j].copy()
+            while len(self._cache) > self.cache_len: self._cache.popitem(last=False)
+        return frames[inv.reshape(idxs.shape)]
+
+    def _decompress(self, out, uidxs, js):
+        flat = self.data.reshape(-1)
+        for j in js:
+            b = flat[uidxs[j]]
+            # Frames never written are zeros
+            out[j] = 0 if b is None else np.frombuffer(self.decompress(b), dtype=self.dtype).reshape(self.shape[2:])
@@ -0,0 +1,77 @@
+import numpy as np
+from pathlib import Path
+from .replay_buffer import ReplayBuffer, _store_dtype
+
+
+class MemmapReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer with the states (the bulk of the memory, e.g. frames) stored in `np.memmap` files
+    (`.npy`, one per state space) inside `path`, so it can be larger than RAM. Actions, rewards and dones
+    stay in RAM. Same API as `ReplayBuffer`.
+
+    States are gathered with sorted (and deduplicated) indexes, reading the files in order. The `hot_len`
+    most recent steps are also kept in RAM and read from there, they're the most likely to be sampled
+    by prioritized replay and the ones being written by the OS.
+
+    Parameters
+    ----------
+    path: str
+        Directory for the memmap files, existing files are overwritten.
+    hot_len: int
+        Number of the most recent steps kept in RAM.
+    """
+    def __init__(self, maxlen, path, num_envs=None, staging=None, n_step=1, gamma=.99, hot_len=0):
+        super().__init__(maxlen=maxlen, num_envs=num_envs, staging=staging, n_step=n_step, gamma=gamma)
+        self.path, self.hot_len = Path(path), int(hot_len)
+        self.path.mkdir(exist_ok=True, parents=True)
+        # Hot copies of the state columns (by id) written as a ring, position of the newest step
+        self._hot, self._hot_pos = {}, -1
+
+    def _alloc(self, xs, name=None):
+        if not name == 'ss': return super()._alloc(xs, name=name)
+        if self.hot_len > self.nsteps: raise ValueError(f'hot_len ({self.hot_len}) should be at most maxlen // num_envs ({self.nsteps})')
+        arrs = [np.asarray(o) for o in xs]
+        cols = [np.lib.format.open_memmap(str(self.path/f'{name}_{i}.npy'), mode='w+', dtype=_store_dtype(o.dtype), shape=(self.nsteps, *o.shape))
+                for i, o in enumerate(arrs)]
+        self._hot = {id(col): np.empty((self.hot_len, *o.shape), dtype=col.dtype) for col, o in zip(cols, arrs)}
+        return cols
+
+    def add_sa(self, s, a, hs=None):
+        super().add_sa(s=s, a=a, hs=hs)
+        self._add_hot([np.asarray(o)[None] for o in self._frames(s)])
+
+    def add_rows(self, *, ss, acs, rs, ds):
+        super().add_rows(ss=ss, acs=acs, rs=rs, ds=ds)
+        self._add_hot([o[-min(len(rs), self.hot_len):] for o in ss])
+
+    def load(self, loaddir):
+        super().load(loaddir=loaddir)
+        self._add_hot([o[self._ordered_idxs()[-self.hot_len:]] for o in self.ss])
+
+    def _add_hot(self, xs):
+        "Writes the newest steps of each state column (with shape (#steps, num_envs, *shape)) to the hot ring."
+        if self.hot_len == 0: return
+        n = len(xs[0])
+        idxs = (self._hot_pos + 1 + np.arange(n)) % self.hot_len
+        for col, x in zip(self.ss, xs): self._hot[id(col)][idxs] = x
+        self._hot_pos = int(idxs[-1])
+
+    def _take(self, col, idxs, key):
+        if id(col) not in self._hot: return super()._take(col, idxs, key=key)
+        shape = (*idxs.shape, *col.shape[2:])
+        out = np.empty(shape, dtype=col.dtype) if self.staging is None else self.staging.get(key, shape=shape, dtype=col.dtype)
+        steps, envs = np.divmod(idxs, self.num_envs)
+        age = (self.position - steps) % self.nsteps
+        hot = age < min(self.hot_len, self._len)
+        if hot.all(): out[...] = self._hot[id(col)][(self._hot_pos - age) % self.hot_len, envs]
+        elif hot.any():
+            out[hot] = self._hot[id(col)][(self._hot_pos - age[hot]) % self.hot_len, envs[hot]]
+            out[~hot] = self._read(col, idxs[~hot])
+        else: out[...] = self._read(col, idxs)
+        return out
+
+    @staticmethod
+    def _read(col, idxs):
+        # Sorted and unique indexes, each page is read once and in file order
+        uidxs, inv = np.unique(idxs, return_inverse=True)
+        return col.reshape(-1, *col.shape[2:])[uidxs][inv.reshape(idxs.shape)]
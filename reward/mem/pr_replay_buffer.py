@@ -0,0 +1,117 @@
+import numpy as np
+import reward.utils as U
+from .replay_buffer import ReplayBuffer
+from reward.utils.buffers import SumTree, MinTree
+
+
+class PrReplayBuffer(ReplayBuffer):
+    """
+    Prioritized replay backed by a sum-tree (sampling) and a min-tree (importance sampling weights),
+    priorities are indexed by the flat indexes of the transitions (`step * num_envs + env`).
+
+    Parameters
+    ----------
+    pr_factor: float or schedule
+        Determines how much prioritization is used (alpha in the paper).
+    is_factor: float or schedule
+        Importance sampling weight for correcting the bias (beta in the paper).
+    min_pr: float or schedule
+        Minimum priority possible (epsilon in the paper).
+    """
+    def __init__(self, maxlen, num_envs=None, *, pr_factor=.6, is_factor=1., min_pr=.01, staging=None, n_step=1, gamma=.99):
+        super().__init__(maxlen=maxlen, num_envs=num_envs, staging=staging, n_step=n_step, gamma=gamma)
+        self._pr_factor, self._is_factor, self._min_pr = map(U.make_callable, (pr_factor, is_factor, min_pr))
+        self.sum_tree, self.min_tree = SumTree(self.maxlen), MinTree(self.maxlen)
+        self._max_pr = 1.
+
+    @property
+    def pr_factor(self): return self._pr_factor(U.global_step.get())
+    @property
+    def is_factor(self): return self._is_factor(U.global_step.get())
+    @property
+    def min_pr(self): return self._min_pr(U.global_step.get())
+
+    def add_sa(self, s, a, hs=None):
+        # Transitions of the previous step now have a next state and can be sampled
+        if len(self) > 0: self._set_pr(idxs=self._flat_idxs(self.position), pr=self._max_pr)
+        super().add_sa(s=s, a=a, hs=hs)
+        self._clear_pr(idxs=self._flat_idxs(self.position))
+
+    def add_rows(self, **kwargs):
+        if len(self) > 0: self._set_pr(idxs=self._flat_idxs(self.position), pr=self._max_pr)
+        super().add_rows(**kwargs)
+        self._set_pr(idxs=self._flat_idxs(self._ordered_idxs()[:-1]), pr=self._max_pr)
+        self._clear_pr(idxs=self._flat_idxs(self.position))
+
+    def add_segment(self, *, ss, acs, rs, ds, pr=None):
+        """
+        Inserts a segment of consecutive steps collected elsewhere (e.g. by an actor process),
+        `ss` has one more step than the other columns (the next states of the last step).
+        `pr` are the initial priorities (e.g. TD errors computed by the actor) with shape (#steps, num_envs),
+        the maximum priority if None.
+        The step holding the last next states is never sampled and n-step windows stop there (a cut),
+        segments can be interleaved freely.
+        """
+        n = len(rs)
+        if not all(len(o) == n + 1 for o in ss): raise ValueError(f'ss should have {n + 1} rows, one more than rs')
+        acs = [np.concatenate([o, o[-1:]]) for o in acs]
+        rs, ds = np.concatenate([rs, np.zeros_like(rs[-1:])]), np.concatenate([ds, np.ones_like(ds[-1:])])
+        # Not `self.add_rows`, the last row of the previous segment should stay unsampleable
+        super().add_rows(ss=ss, acs=acs, rs=rs, ds=ds)
+        if self._cuts is None: self._cuts = np.zeros((self.nsteps, self.num_envs), dtype=bool)
+        self._cuts[self.position] = True
+        idxs = self._flat_idxs(self._ordered_idxs()[-n - 1:])
+        if pr is None: self._set_pr(idxs=idxs[:-1], pr=self._max_pr)
+        else: self.update_pr(idxs=idxs[:-1].reshape(-1), pr=pr)
+        self._clear_pr(idxs=idxs[-1])
+
+    def load(self, loaddir):
+        "Priorities are not saved, loaded transitions get the maximum priority."
+        super().load(loaddir=loaddir)
+        self._set_pr(idxs=self._flat_idxs(self._ordered_idxs()[:-1]), pr=self._max_pr)
+        self._clear_pr(idxs=self._flat_idxs(self.position))
+        if self._cuts is not None: self._clear_pr(idxs=self._flat_idxs(np.flatnonzero(self._cuts.any(axis=1))))
+
+    def sample(self, bs):
+        self._check_sampleable()
+        idxs = self.sum_tree.sample(bs=bs)
+        b = self._get_batch(idxs=idxs[:, None])
+        b.idxs, b.is_ws, b.nwritten = idxs, self.get_is_weight(idxs=idxs), self._nwritten
+        return b
+
+    def _check_sampleable(self):
+        super()._check_sampleable()
+        if not self.sum_tree.reduce() > 0: raise ValueError('No transition with a priority to sample')
+
+    def get_is_weight(self, idxs):
+        # Normalized by the maximum weight, given by the minimum priority
+        return ((self.sum_tree[idxs] / self.min_tree.reduce()) ** -self.is_factor).astype(np.float32)
+
+    def update_pr(self, idxs, pr, nwritten=None):
+        """
+        Sets the priorities of the transitions at flat indexes `idxs`. With `nwritten` (of the sampled batch, e.g. prefetched)
+        the transitions written since sampling are skipped, as well as the ones that can't be sampled (the newest step and cuts).
+        """
+        idxs, pr = np.reshape(idxs, -1), (np.abs(pr).reshape(-1) + self.min_pr) ** self.pr_factor
+        self._max_pr = max(self._max_pr, pr.max())
+        if nwritten is not None:
+            keep = ~self._stale(idxs, nwritten=nwritten)
+            idxs, pr = idxs[keep], pr[keep]
+        self._set_pr(idxs=idxs, pr=pr)
+
+    def _stale(self, idxs, nwritten):
+        "Whether the transitions at `idxs` were overwritten since `nwritten` steps were written, or can't be sampled."
+        age = (self.position - idxs // self.num_envs) % self.nsteps
+        stale = age < max(self._nwritten - nwritten, 1)
+        if self._cuts is not None: stale |= self._cuts.reshape(-1)[idxs]
+        return stale
+
+    def _set_pr(self, idxs, pr):
+        idxs = np.reshape(idxs, -1)
+        self.sum_tree[idxs] = pr
+        self.min_tree[idxs] = pr
+
+    def _clear_pr(self, idxs):
+        idxs = np.reshape(idxs, -1)
+        self.sum_tree[idxs] = self.sum_tree.neutral
+        self.min_tree[idxs] = self.min_tree.neutral
@@ -1,79 +1,313 @@
 import numpy as np
-import torch, pickle
+import threading
 import reward.utils as U
 from pathlib import Path
+from functools import partial
+from reward.tfm.img.img import LazyStack
+from . import checkpoint
 
 
 class ReplayBuffer:
-    def __init__(self, maxlen, num_envs=1):
-        assert num_envs == 1, 'Only works with one env for now'
-        # Position intialized at -1 so the first updated position is 0
-        self.maxlen, self.buffer, self.position = int(maxlen), [], -1
+    """
+    Columnar replay buffer with (time, env) storage, each space (and rewards/dones) is stored in a single
+    preallocated numpy array of shape (maxlen // num_envs, num_envs, *shape), allocated on the first insertion.
+    A step of all envs is inserted with a single write per column, the next state of a transition
+    is the one of the same env in the following step.
+    Sampling returns arrays of shape (bs, 1, *shape) ready for `Space.from_arr`.
+
+    Stacked images (`LazyStack`, created by `rw.tfm.img.Stack`) only have their newest frame
+    stored, stacks are rebuilt at sample time with a single gather. Frames from before the
+    start of the episode (of the same env) are replaced by the first frame of the episode.
+
+    If `staging` is set (a `U.Staging`), samples are gathered straight into its buffers,
+    ready to be copied to the device without further allocations.
+
+    With `n_step > 1` samples hold n-step transitions: `rs` are the discounted sums of up to `n_step` rewards,
+    `sns` the states after them, `ds` whether the episode ended in between and `gammas` the discount to
+    apply to the value of `sns` (`gamma ** k`, k being the number of steps summed). Windows stop at the end
+    of an episode, at the newest step and at steps marked as cuts (see `PrReplayBuffer.add_segment`).
+
+    Contiguous sequences of a single env (e.g. for recurrent policies) are sampled with `sample_sequences`,
+    recurrent states can be stored along with the states (`hs` in `add_sa`).
+
+    Parameters
+    ----------
+    maxlen: int
+        Maximum number of transitions, summed over all envs.
+    num_envs: int
+        Number of envs inserted at each step, inferred from the first insertion if None.
+    n_step: int
+        Maximum number of steps of the sampled transitions.
+    gamma: float
+        Discount used for the n-step returns.
+
+    Examples
+    --------
+        Typical use for atari, with each frame being a 84x84 grayscale
+        image (uint8), storing 1M transitions should use about 7GiB of RAM.
+    """
+    def __init__(self, maxlen, num_envs=None, staging=None, n_step=1, gamma=.99):
+        if n_step < 1: raise ValueError(f'n_step should be at least 1, got {n_step}')
+        # Position (in steps) intialized at -1 so the first updated position is 0
+        self.maxlen, self.num_envs, self.position, self._len = int(maxlen), num_envs, -1, 0
+        self.n_step, self.gamma = n_step, gamma
+        self.ss, self.acs, self.rs, self.ds, self.hs = None, None, None, None, None
+        # Steps where n-step windows stop, only allocated once a cut is added
+        self._cuts = None
+        # Total number of steps written, (settings, steps written) of the last save, background save thread
+        self._nwritten, self._saved, self._saver, self._saver_error = 0, None, None, None
+        # Number of stacked frames of each state column, None if the full state is stored
+        self._nstack = None
         self._cycle = False
+        self.staging = staging
+
+    def __len__(self): return self._len * (self.num_envs or 0)
+
+    @property
+    def n_sampleable(self):
+        "Number of transitions that can be sampled, the newest step is excluded (its next states are not stored yet)."
+        return max(self._len - 1, 0) * (self.num_envs or 0)
 
-    def __len__(self): return len(self.buffer)
+    def __getitem__(self, key):
+        "Steps of all envs, `key` indexes steps."
+        return dict(ss=[o[key] for o in self.ss], acs=[o[key] for o in self.acs], rs=self.rs[key], ds=self.ds[key])
 
-    def __getitem__(self, key): return self.buffer[key]
+    @property
+    def nsteps(self): return self.maxlen // self.num_envs
 
     def _get_batch(self, idxs):
-        samples = [self[i] for i in idxs]
-        b = U.memories.SimpleMemory.from_dicts(samples)
-        # Add next state to batch
-        b.sns = [self[i + 1]["ss"] for i in idxs]
-        # Change shape from (#samples, #spaces) to (#spaces, #samples)
-        b.update({k: list(map(list, zip(*b[k]))) for k in ['ss', 'sns', 'acs']})
-        return b
-    
-    def add_sa(self, s, a):
+        "Transitions from flat indexes (`step * num_envs + env`), columns have shape (*idxs.shape, *shape)."
+        acs = [self._take(o, idxs, key=('acs', i)) for i, o in enumerate(self.acs)]
+        if self.n_step > 1:
+            rs, ds, gammas, nidxs = self._get_nstep(idxs)
+            return U.memories.SimpleMemory(ss=self._get_ss(idxs, key='ss'), sns=self._get_ss(nidxs, key='sns'), acs=acs,
+                                           rs=rs, ds=ds, gammas=gammas)
+        nidxs = (idxs + self.num_envs) % (self.nsteps * self.num_envs)
+        return U.memories.SimpleMemory(ss=self._get_ss(idxs, key='ss'), sns=self._get_ss(nidxs, key='sns'), acs=acs,
+                                       rs=self._take(self.rs, idxs, key='rs'), ds=self._take(self.ds, idxs, key='ds'))
+
+    def _get_nstep(self, idxs):
+        "Discounted returns, dones, discounts and flat indexes of the next states, over windows of `n_step` steps."
+        k, nenvs, size = np.arange(self.n_step), self.num_envs, self.nsteps * self.num_envs
+        # (*idxs.shape, n_step) windows of the same env
+        widxs = (idxs[..., None] + k * nenvs) % size
+        rs, ds = self.rs.reshape(-1)[widxs], self.ds.reshape(-1)[widxs].astype(bool)
+        # Steps before the newest one (its next states are not stored yet), not after a cut or the end of an episode
+        valid = k < ((self.position - idxs // nenvs) % self.nsteps)[..., None]
+        if self._cuts is not None: valid &= ~self._cuts.reshape(-1)[widxs]
+        valid[..., 1:] &= ~ds[..., :-1]
+        mask = np.cumprod(valid, axis=-1, dtype=bool)
+        n = mask.sum(axis=-1)
+        rs = (rs * mask * self.gamma ** k).sum(axis=-1, dtype=np.float32)
+        ds = (ds & mask).any(axis=-1).astype(np.float32)
+        return rs, ds, (self.gamma ** n).astype(np.float32), (idxs + n * nenvs) % size
+
+    def _take(self, col, idxs, key):
+        "Gathers `col` at flat indexes, straight into a staging buffer if there's one."
+        col = col.reshape(-1, *col.shape[2:])
+        if self.staging is None: return col[idxs]
+        out = self.staging.get(key, shape=(*idxs.shape, *col.shape[1:]), dtype=col.dtype)
+        return np.take(col, idxs, axis=0, out=out, mode='clip')
+
+    def _get_ss(self, idxs, key):
+        return [self._take(o, idxs, key=(key, i)) if n is None else self._get_stack(o, idxs=idxs, n=n, key=(key, i))
+                for i, (o, n) in enumerate(zip(self.ss, self._nstack))]
+
+    def _get_stack(self, frames, idxs, n, key):
+        "Rebuilds stacks of shape (*idxs.shape, *shape, n) from the frames column, without crossing episode boundaries."
+        # Number of previous frames of the same env that belong to the same episode (and are still stored)
+        k, nenvs, size = np.arange(1, n), self.num_envs, self.nsteps * self.num_envs
+        age = (idxs // nenvs - (self.position + 1) % self._len) % self._len
+        prev_ds = self.ds.reshape(-1)[(idxs[..., None] - k * nenvs) % size]
+        nvalid = np.minimum((np.cumsum(prev_ds, axis=-1) == 0).sum(axis=-1), age)
+        sidxs = (idxs[..., None] - np.minimum(k[::-1], nvalid[..., None]) * nenvs) % size
+        sidxs = np.concatenate([sidxs, idxs[..., None]], axis=-1)
+        # (*idxs.shape, n, *shape, 1) -> (*idxs.shape, *shape, n)
+        return np.moveaxis(self._take(frames, sidxs, key=key)[..., 0], idxs.ndim, -1)
+
+    def _ordered_idxs(self):
+        "Storage indexes from the oldest to the newest step."
+        return (self.position + 1 + np.arange(self._len)) % self._len
+
+    def _flat_idxs(self, steps):
+        "Flat indexes of all envs at `steps`, with shape (*steps.shape, num_envs)."
+        return np.asarray(steps)[..., None] * self.num_envs + np.arange(self.num_envs)
+
+    def _alloc(self, xs, name=None):
+        "Columns for `xs`, `name` ('ss', 'acs', 'rs', 'ds' or 'hs') lets subclasses store them elsewhere."
+        arrs = [np.asarray(o) for o in xs]
+        return [np.empty((self.nsteps, *o.shape), dtype=_store_dtype(o.dtype)) for o in arrs]
+
+    def _set_num_envs(self, num_envs):
+        if self.num_envs is None: self.num_envs = num_envs
+        if not self.num_envs == num_envs: raise ValueError(f'Expected {self.num_envs} envs, got {num_envs}')
+        if self.nsteps == 0: raise ValueError(f'maxlen ({self.maxlen}) should be at least the number of envs ({num_envs})')
+
+    def add_sa(self, s, a, hs=None):
+        "Inserts states, actions and optionally recurrent states (a list) of all envs, each with shape (num_envs, *shape)."
         if self._cycle: raise RuntimeError('add_sa and add_rd should be called sequentially')
         self._cycle = True
-        # If buffer is not full, add a new element
-        if len(self) < self.maxlen: self.buffer.append(None)
-        self.position = (self.position + 1) % self.maxlen
-        self.buffer[self.position] = dict(ss=s, acs=a)
-    
+        if self.ss is None:
+            self._nstack = [len(o.img.arr) if isinstance(getattr(o, 'img', None), LazyStack) else None for o in s]
+            self._set_num_envs(len(np.asarray(self._frames(s)[0])))
+            self.ss, self.acs = self._alloc(self._frames(s), name='ss'), self._alloc(a, name='acs')
+        self.position = (self.position + 1) % self.nsteps
+        self._len, self._nwritten = min(self._len + 1, self.nsteps), self._nwritten + 1
+        for col, o in zip(self.ss, self._frames(s)): col[self.position] = np.asarray(o)
+        for col, o in zip(self.acs, a): col[self.position] = np.asarray(o)
+        if hs is not None:
+            if self.hs is None: self.hs = self._alloc([U.to_np(o) for o in hs], name='hs')
+            for col, o in zip(self.hs, hs): col[self.position] = U.to_np(o)
+        if self._cuts is not None: self._cuts[self.position] = False
+
+    def _frames(self, s): return [o if n is None else o.img.arr[-1] for o, n in zip(s, self._nstack)]
+
     def add_rd(self, r, d):
         if not self._cycle: raise RuntimeError('add_sa and add_rd should be called sequentially')
         self._cycle = False
-        self.buffer[self.position].update(dict(rs=r, ds=d))
+        if self.rs is None: self.rs, self.ds = self._alloc([r], name='rs')[0], self._alloc([d], name='ds')[0]
+        self.rs[self.position], self.ds[self.position] = r, d
 
-    def add_transition(self, *, s, a, r, d):
-        self.add_sa(s=s, a=a)
+    def add_transition(self, *, s, a, r, d, hs=None):
+        self.add_sa(s=s, a=a, hs=hs)
         self.add_rd(r=r, d=d)
 
     def sample(self, bs):
-        idxs = np.random.choice(len(self) - 1, bs, replace=False)
-        return self._get_batch(idxs=idxs)
+        self._check_sampleable()
+        # The newest step is excluded because its next states are not stored yet
+        start = (self.position + 1) % self._len
+        steps = (start + np.random.randint(self._len - 1, size=bs)) % self._len
+        idxs = steps * self.num_envs + np.random.randint(self.num_envs, size=bs)
+        return self._get_batch(idxs=idxs[:, None])
+
+    def _check_sampleable(self):
+        if self.n_sampleable == 0: raise ValueError(f'Sampling needs at least 2 steps stored, got {self._len}')
+
+    def sample_sequences(self, bs, seq_len, burn_in=0):
+        """
+        Samples `bs` sequences of `burn_in + seq_len` consecutive steps of a single env, with a single gather per column.
+        Columns have shape (burn_in + seq_len, bs, *shape), `mask` is 0 for the burn-in steps and the steps after the end
+        of the episode. `hs` are the recurrent states stored for the first step, with shape (bs, *shape).
+        """
+        n = burn_in + seq_len
+        # Sequences end before the newest step, its next states are not stored yet
+        if not self._len > n: raise ValueError(f'Sequences of {n} steps need more than {n} steps stored, got {self._len}')
+        start = (self.position + 1) % self._len + np.random.randint(self._len - n, size=bs)
+        steps = (start + np.arange(n)[:, None]) % self._len
+        idxs = steps * self.num_envs + np.random.randint(self.num_envs, size=bs)
+        nidxs = (idxs + self.num_envs) % (self.nsteps * self.num_envs)
+        acs = [self._take(o, idxs, key=('seq_acs', i)) for i, o in enumerate(self.acs)]
+        rs, ds = self._take(self.rs, idxs, key='seq_rs'), self._take(self.ds, idxs, key='seq_ds')
+        # Steps after a done belong to the next episode
+        mask = (np.cumsum(ds, axis=0) - ds == 0).astype(np.float32)
+        mask[:burn_in] = 0
+        b = U.memories.SimpleMemory(ss=self._get_ss(idxs, key='seq_ss'), sns=self._get_ss(nidxs, key='seq_sns'), acs=acs,
+                                    rs=rs, ds=ds, mask=mask)
+        if self.hs is not None: b.hs = [self._take(o, idxs[0], key=('seq_hs', i)) for i, o in enumerate(self.hs)]
+        return b
+
+    def save(self, savedir, chunk_len=65536, codec=None, background=False):
+        """
+        Saves the buffer as chunks of `chunk_len` steps, optionally compressed with `codec` (see `checkpoint.CODECS`).
+        Saves are incremental, only the chunks written since the last save to `savedir` are written again.
 
-    def save(self, savedir):
+        With `background` the chunks are written by a thread and training can continue, the chunk being
+        written (and the next one) are copied first, the others are safe unless more than `chunk_len` steps
+        are added before the save finishes. Call `wait` to make sure a save is done.
+        """
+        self.wait()
+        if self.rs is None: raise RuntimeError('Cannot save a buffer without any complete step')
         path = Path(savedir)/'buffer'
         path.mkdir(exist_ok=True, parents=True)
-        mem = U.memories.SimpleMemory.from_dicts(self.buffer)
-        mem.update({k: list(zip(*mem[k])) for k in ['ss', 'acs']})
-        info = {}
-        info.update(self._save_space(mem.ss, name='state', savedir=path))
-        info.update(self._save_space(mem.acs, name='action', savedir=path))
-        np.save(path/'reward.npy', np.array(mem.rs))
-        np.save(path/'done.npy', np.array(mem.ds))
-        with open(str(path/'info.pkl'), 'wb') as f: pickle.dump(info, f)
+        cols, key = self._columns(), (str(path), chunk_len, codec)
+        # Steps written since the last save with the same settings, the newest one may have been completed since then
+        n = self._nwritten - self._saved[1] + 1 if self._saved is not None and self._saved[0] == key else self.nsteps
+        steps = (self.position - np.arange(min(n, self._len))) % self.nsteps
+        nchunks, head = -(-self.nsteps // chunk_len), self.position // chunk_len
+        chunks = {}
+        for c in np.unique(steps // chunk_len).tolist():
+            copy = background and c in [head, (head + 1) % nchunks]
+            chunks[c] = {k: v[c * chunk_len:(c + 1) * chunk_len] for k, v in cols.items()}
+            if copy: chunks[c] = {k: v.copy() for k, v in chunks[c].items()}
+        meta = dict(nsteps=self.nsteps, num_envs=self.num_envs, position=self.position, len=self._len, nstack=self._nstack,
+                    chunk_len=chunk_len, codec=codec, cols={k: (v.shape[1:], v.dtype) for k, v in cols.items()})
+        job = partial(_write_chunks, path=path, chunks=chunks, meta=meta, codec=codec)
+        # Chunks only count as saved once written, a failed save makes the next one write everything
+        saved, self._saved = (key, self._nwritten), None
+        if not background:
+            job()
+            self._saved = saved
+            return
+        self._saver = threading.Thread(target=self._run_saver, args=(job, saved), daemon=True)
+        self._saver.start()
+
+    def wait(self):
+        "Waits for a background save to finish."
+        if self._saver is None: return
+        self._saver.join()
+        self._saver, e = None, self._saver_error
+        self._saver_error = None
+        if e is not None: raise RuntimeError('Background save failed') from e
+
+    def _run_saver(self, job, saved):
+        try:
+            job()
+            self._saved = saved
+        except Exception as e: self._saver_error = e
 
     def load(self, loaddir):
-        loaddir = Path(loaddir)/'buffer'
-        with open(str(loaddir/'info.pkl'), 'rb') as f: info = pickle.load(f)
-        ss = self._load_space(loaddir=loaddir, info=info['state'])
-        acs = self._load_space(loaddir=loaddir, info=info['action'])
-        rs, ds = np.load(loaddir/'reward.npy'), np.load(loaddir/'done.npy')
-        assert len(ss) == len(acs) == len(rs) == len(ds)
-        for s, a, r, d in zip(ss, acs, rs, ds): self.add_transition(s=s, a=a, r=r, d=d)
-
-    def _save_space(self, x, name, savedir):
-        info = {name: []}
-        for i, o in enumerate(x):
-            postfix = f'{name}_{i}'
-            olist = o[0].from_list(o)
-            olist.save(savedir=savedir, postfix=postfix)
-            info[name].append(dict(name=postfix, cls=olist.__class__))
-        return info
-
-    def _load_space(self, loaddir, info):
-        return list(zip(*[o['cls'].load(loaddir=loaddir, postfix=o['name']).unpack() for o in info]))
\ No newline at end of file
+        "Restores a buffer saved by `save`, columns are copied in bulk chunk by chunk (the number of steps and envs should match)."
+        self.wait()
+        path = Path(loaddir)/'buffer'
+        meta = checkpoint.load(path/'meta.pkl')
+        if self._len > 0: raise RuntimeError('Buffers can only be loaded when empty')
+        self._set_num_envs(meta['num_envs'])
+        if not self.nsteps == meta['nsteps']: raise ValueError(f'Expected a buffer of {self.nsteps} steps, got {meta["nsteps"]}')
+        if self.ss is None: self._nstack = meta['nstack']
+        elif self._nstack != meta['nstack']: raise ValueError(f'Stacked frames do not match, expected {self._nstack} got {meta["nstack"]}')
+        cols = meta['cols']
+        def alloc(name):
+            n = sum(k.startswith(f'{name}_') for k in cols)
+            return self._alloc([np.empty(*cols[f'{name}_{i}']) for i in range(n)], name=name)
+        self.ss, self.acs, self.hs = alloc('ss'), alloc('acs'), alloc('hs') or None
+        self.rs, self.ds = self._alloc([np.empty(*cols['rs'])], name='rs')[0], self._alloc([np.empty(*cols['ds'])], name='ds')[0]
+        if 'cuts' in cols: self._cuts = np.zeros((self.nsteps, self.num_envs), dtype=bool)
+        dst, cl = self._columns(), meta['chunk_len']
+        for c in range(-(-self.nsteps // cl)):
+            if not (path/f'chunk_{c}.pkl').exists(): continue
+            for k, v in checkpoint.read_chunk(path/f'chunk_{c}.pkl').items(): dst[k][c * cl:c * cl + len(v)] = v
+        self.position, self._len = meta['position'], meta['len']
+        # Saving back to the same place only writes what's added from now on
+        self._saved = ((str(path), cl, meta['codec']), self._nwritten)
+
+    def _columns(self):
+        "All columns by name."
+        cols = {f'{name}_{i}': o for name in ['ss', 'acs', 'hs'] for i, o in enumerate(getattr(self, name) or [])}
+        cols.update(rs=self.rs, ds=self.ds)
+        if self._cuts is not None: cols['cuts'] = self._cuts
+        return cols
+
+    def add_rows(self, *, ss, acs, rs, ds):
+        "Bulk insertion of multiple steps, each column should have shape (#steps, num_envs, *shape), only the newest frame for stacked images."
+        if self._cycle: raise RuntimeError('add_rows cannot be called between add_sa and add_rd')
+        if self._nstack is None: self._nstack = [None] * len(ss)
+        self._set_num_envs(np.shape(rs)[1])
+        if self.ss is None: self.ss, self.acs = self._alloc([o[0] for o in ss], name='ss'), self._alloc([o[0] for o in acs], name='acs')
+        if self.rs is None: self.rs, self.ds = self._alloc([rs[0]], name='rs')[0], self._alloc([ds[0]], name='ds')[0]
+        n = min(len(rs), self.nsteps)
+        idxs = (self.position + 1 + np.arange(n)) % self.nsteps
+        for cols, xs in [(self.ss, ss), (self.acs, acs), ([self.rs, self.ds], [rs, ds])]:
+            for col, x in zip(cols, xs): col[idxs] = x[-n:]
+        if self._cuts is not None: self._cuts[idxs] = False
+        self.position, self._len, self._nwritten = int(idxs[-1]), min(self._len + n, self.nsteps), self._nwritten + n
+
+
+def _write_chunks(path, chunks, meta, codec):
+    for c, cols in chunks.items(): checkpoint.write_chunk(path/f'chunk_{c}.pkl', cols, codec=codec)
+    # Written last, a save is only visible once all its chunks are written
+    checkpoint.dump(path/'meta.pkl', meta)
+
+
+def _store_dtype(dtype):
+    # Tensors are created as float32, no need to keep double precision around
+    return np.float32 if dtype == np.float64 else dtype
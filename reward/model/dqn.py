@@ -1,3 +1,4 @@
+import torch
 import reward as rw, reward.utils as U
 import torch.nn.functional as F
 from .model import  Model
@@ -8,27 +9,45 @@ class DQN(Model):
         super().__init__(policy=policy, gamma=gamma)
         self.qnn,self.qnn_targ,self.q_opt = qnn,qnn_targ,self._wrap_opts(q_opt)
         self.double,self.targ_up_w,self.targ_up_freq = double,targ_up_w,targ_up_freq
-        U.copy_weights(from_nn=self.qnn, to_nn=self.qnn_targ, weight=1.)
+        self._targ_up = U.Polyak(from_nn=self.qnn, to_nn=self.qnn_targ)
+        self._targ_up(1.)
+        self._gstep = U.global_step.get()
         U.global_step.subscribe_add(self._update_target_callback)
 
-    def train(self, *, ss, sns, acs, rs, ds):
+    def train(self, *, ss, sns, acs, rs, ds, is_ws=None, gammas=None):
+        qb, select_qb, qtarg = self._qs(ss=ss, sns=sns, acs=acs, rs=rs, ds=ds, gammas=gammas)
+        ### DQN update ###
+        if is_ws is None: loss = F.smooth_l1_loss(input=select_qb, target=qtarg)
+        else:             loss = (is_ws.reshape(-1, 1) * F.smooth_l1_loss(input=select_qb, target=qtarg, reduction='none')).mean()
+        self.q_opt.optimize(loss=loss, nn=self.qnn)
+        rw.logger.add_log('loss', loss, precision=4)
+        rw.logger.add_log('q_mean', qb.mean(), hidden=True)
+        rw.logger.add_histogram('acs', acs[0].reshape(-1))
+        rw.logger.add_histogram('q', select_qb)
+        rw.logger.add_histogram('qtarg', qtarg)
+        # TD errors, used as new priorities by prioritized replay
+        return (qtarg - select_qb).detach()
+
+    def get_pr(self, *, ss, sns, acs, rs, ds, gammas=None):
+        with torch.no_grad(): _, select_qb, qtarg = self._qs(ss=ss, sns=sns, acs=acs, rs=rs, ds=ds, gammas=gammas)
+        return qtarg - select_qb
+
+    def _qs(self, *, ss, sns, acs, rs, ds, gammas=None):
+        "Q values, Q values of the selected actions and targets, `gammas` are the discounts of n-step transitions."
         # (#samples, #envs, #feats) -> (#samples + #envs, #feats)
         ss, sns, acs = [[o.reshape((-1, *o.shape[2:])) for o in l] for l in [ss, sns, acs]]
         rs, ds = [o.reshape((-1, *o.shape[2:]))[..., None] for o in [rs, ds]]
+        gamma = self.gamma if gammas is None else gammas.reshape(-1)[..., None]
         if not len(acs) == 1: raise RuntimeError('Multi action space not suported')
-        ### DQN update ###
         qb, qnb_targ = self.qnn(*ss), self.qnn_targ(*sns)
         if self.double: qnb_targ = qnb_targ.gather(dim=1, index=qb.argmax(dim=1, keepdim=True))
         else:           qnb_targ = qnb_targ.max(dim=1, keepdim=True)[0]
         select_qb = qb.gather(dim=1, index=acs[0][:, None])
-        qtarg = U.estim.td_target(rs=rs, ds=ds, vn=qnb_targ, gamma=self.gamma).detach()
-        loss = F.smooth_l1_loss(input=select_qb, target=qtarg)
-        self.q_opt.optimize(loss=loss, nn=self.qnn)
-        rw.logger.add_log('loss', loss, precision=4)
-        rw.logger.add_log('q_mean', qb.mean(), hidden=True)
-        rw.logger.add_histogram('acs', acs[0])
-        rw.logger.add_histogram('q', select_qb)
-        rw.logger.add_histogram('qtarg', qtarg)
+        qtarg = U.estim.td_target(rs=rs, ds=ds, vn=qnb_targ, gamma=gamma).detach()
+        return qb, select_qb, qtarg
 
     def _update_target_callback(self, gstep):
-        if gstep % self.targ_up_freq == 0: U.copy_weights(from_nn=self.qnn, to_nn=self.qnn_targ, weight=self.targ_up_w)
+        # The global step can increase by more than one at a time (e.g. by the number of envs with a fast agent)
+        prev, self._gstep = self._gstep, gstep
+        if prev < gstep and gstep // self.targ_up_freq > prev // self.targ_up_freq:
+            self._targ_up(self.targ_up_w)
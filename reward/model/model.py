@@ -9,9 +9,21 @@ class Model(ABC):
     @abstractmethod
     def train(self, *, ss, sns, acs, rs, ds): pass
     # TODO: carefull with shapes, probably want (num_samples, num_envs, feats)
+
+    def train_many(self, **b):
+        """
+        Trains on a super-batch, several batches stacked on a new first dimension (e.g. sampled with a single gather and
+        sent to the device at once), `train` is called on each of them in order. Returns the results of each `train`.
+        """
+        get = lambda v, i: [o[i] for o in v] if isinstance(v, list) else v[i]
+        return [self.train(**{k: get(v, i) for k, v in b.items()}) for i in range(len(b['rs']))]
             
     def get_act(self, ss): return self.p.get_act(*U.listify(ss))
 
+    def get_pr(self, *, ss, sns, acs, rs, ds, gammas=None):
+        "Priorities of the transitions (e.g. TD errors) for prioritized replay, None if not supported."
+        return None
+
     def save_nn_callback(self, nn, opt, name=None):
         rw.logger.subscribe_log(self._save_nn_callback_fn(nn=nn, opt=opt, name=name))
 
@@ -1,5 +1,5 @@
 from .model import Model
-import reward.utils as U
+import reward as rw, reward.utils as U
 
 
 class PG(Model):
@@ -1,50 +1,76 @@
 import torch, torch.nn as nn, torch.nn.functional as F
 import reward as rw, reward.utils as U
 from copy import deepcopy
+from contextlib import contextmanager
 from .model import Model
 
 
 class SAC(Model):
-    def __init__(self, *, policy, q1nn, q2nn, p_opt, q1_opt, q2_opt, entropy=None, r_scale=1.0, targ_smooth=0.005, gamma=0.99):
+    """
+    Soft actor critic with two critics (`q1nn`, `q2nn`), or with an ensemble of critics in a single net (`qnn`, e.g.
+    `rw.nn.EnsembleQ`) returning values with shape (#critics, #samples, 1), optimized by `q_opt`.
+
+    Targets use the minimum over `n_min` critics chosen at random (REDQ), all of them by default. The policy is trained
+    against the minimum (`p_q='min'`) or the mean (`p_q='mean'`) of all critics.
+    """
+    def __init__(self, *, policy, p_opt, q1nn=None, q2nn=None, q1_opt=None, q2_opt=None, qnn=None, q_opt=None, entropy=None,
+                 r_scale=1.0, targ_smooth=0.005, gamma=0.99, n_min=None, p_q='min'):
         super().__init__(policy=policy, gamma=gamma)
+        if (qnn is None) == (q1nn is None or q2nn is None): raise ValueError('Either q1nn and q2nn or qnn should be given')
+        if p_q not in ['min', 'mean']: raise ValueError(f'p_q should be min or mean, got {p_q}')
         self.q1nn,self.q2nn,self.ent_targ,self.r_scale,self.targ_smooth = q1nn,q2nn,entropy,r_scale,targ_smooth
-        self.p_opt,self.q1_opt,self.q2_opt = self._wrap_opts(p_opt,q1_opt,q2_opt)
+        self.qnn, self.n_min, self.p_q = qnn, n_min, p_q
+        self.p_opt = self._wrap_opts(p_opt)
         self.logtemp = nn.Parameter(torch.zeros(1).squeeze().to(U.device.get()))
         self.temp_opt = self._wrap_opts(torch.optim.Adam([self.logtemp], lr=self.p_opt.lr))
-        self.q1nn_targ, self.q2nn_targ = deepcopy(q1nn).eval(), deepcopy(q2nn).eval()
-        U.freeze_weights(self.q1nn_targ), U.freeze_weights(self.q2nn_targ)
+        if qnn is None:
+            self.q1_opt, self.q2_opt = self._wrap_opts(q1_opt, q2_opt)
+            self.q1nn_targ, self.q2nn_targ = deepcopy(q1nn).eval(), deepcopy(q2nn).eval()
+            self.qnns, self.qnns_targ, self.q_opts = [q1nn, q2nn], [self.q1nn_targ, self.q2nn_targ], [self.q1_opt, self.q2_opt]
+            self.q_names = ['q1', 'q2']
+        else:
+            self.q_opt = self._wrap_opts(q_opt)
+            self.qnn_targ = deepcopy(qnn).eval()
+            self.qnns, self.qnns_targ, self.q_opts, self.q_names = [qnn], [self.qnn_targ], [self.q_opt], ['q']
+        for o in self.qnns_targ: U.freeze_weights(o)
+        self._targ_ups = [U.Polyak(from_nn=o, to_nn=targ) for o, targ in zip(self.qnns, self.qnns_targ)]
         self._update_targ_nn(w=1.)
         self.save_nn_callback(nn=self.p.nn, opt=self.p_opt, name='pnn')
-        self.save_nn_callback(nn=self.q1nn, opt=self.q1_opt, name='q1nn')
-        self.save_nn_callback(nn=self.q2nn, opt=self.q2_opt, name='q2nn')
+        for o, opt, name in zip(self.qnns, self.q_opts, self.q_names): self.save_nn_callback(nn=o, opt=opt, name=f'{name}nn')
 
-    def train(self, *, ss, sns, acs, rs, ds):
+    def train(self, *, ss, sns, acs, rs, ds, gammas=None):
         # (#samples, #envs, #feats) -> (#samples + #envs, #feats)
         ss, sns, acs = [[o.reshape((-1, *o.shape[2:])) for o in l] for l in [ss, sns, acs]]
         rs, ds = [o.reshape((-1, *o.shape[2:]))[..., None] for o in [rs, ds]]
+        # Discounts of n-step transitions
+        gamma = self.gamma if gammas is None else gammas.reshape(-1)[..., None]
+        n = len(rs)
         ### Sac update ###
-        q1b, q2b = self.q1nn(*ss, *acs), self.q2nn(*ss, *acs)
-        dist, distn = self.p.get_dist(*ss), self.p.get_dist(*sns)
-        anew, anew_pre = map(U.listify, self.p.get_act_pre(dist=dist))
-        anewn, anew_pren = map(U.listify, self.p.get_act_pre(dist=distn))
-        logprob = self.p.logprob_pre(dist, *anew_pre) / float(self.r_scale)
-        logprobn = self.p.logprob_pre(distn, *anew_pren) / float(self.r_scale)
-        assert logprob.shape == logprobn.shape == q1b.shape == q2b.shape == rs.shape == ds.shape
+        # The policy runs once on the states and the next states
+        dist = self.p.get_dist(*[torch.cat([s, sn]) for s, sn in zip(ss, sns)])
+        anew_all, anew_pre = map(U.listify, self.p.get_act_pre(dist=dist))
+        logprob_all = self.p.logprob_pre(dist, *anew_pre) / float(self.r_scale)
+        anew, anewn = [o[:n] for o in anew_all], [o[n:] for o in anew_all]
+        logprob, logprobn = logprob_all[:n], logprob_all[n:]
+        mean, std = self.p.mean(dist=dist)[:n], self.p.std(dist=dist)[:n]
+        # Values of each critic net, with shape (#critics, #samples, 1)
+        qbs = [_qs(o, *ss, *acs) for o in self.qnns]
+        assert logprob.shape == logprobn.shape == qbs[0].shape[1:] == rs.shape == ds.shape
         # Q loss
-        q1targn, q2targn = self.q1nn_targ(*sns, *anewn), self.q2nn_targ(*sns, *anewn)
-        qtargn = torch.min(q1targn, q2targn) - self.temp.detach() * logprobn
-        q_tdtarg = U.estim.td_target(rs=rs, ds=ds, vn=qtargn, gamma=self.gamma)
-        q1_loss = (q1b - q_tdtarg.detach()).pow(2).mean()
-        q2_loss = (q2b - q_tdtarg.detach()).pow(2).mean()
-        # Policy loss
-        q1new, q2new = self.q1nn(*ss, *anew), self.q2nn(*ss, *anew)
-        qnew = torch.min(q1new, q2new)
-        p_loss = (self.temp.detach() * logprob - qnew).mean() 
-        p_loss += 1e-3 * self.p.mean(dist=dist).pow(2).mean() + 1e-3 * self.p.std(dist=dist).log().pow(2).mean()
-        # Optimize
-        self.q1_opt.optimize(loss=q1_loss, nn=self.q1nn)
-        self.q2_opt.optimize(loss=q2_loss, nn=self.q2nn)
+        with torch.no_grad():
+            qtargn = torch.cat([_qs(o, *sns, *anewn) for o in self.qnns_targ])
+            if self.n_min is not None: qtargn = qtargn[torch.randperm(len(qtargn), device=qtargn.device)[:self.n_min]]
+            qtargn = qtargn.min(dim=0)[0] - self.temp * logprobn
+            q_tdtarg = U.estim.td_target(rs=rs, ds=ds, vn=qtargn, gamma=gamma)
+        q_losses = [(qb - q_tdtarg).pow(2).mean(dim=(1, 2)).sum() for qb in qbs]
+        # Policy loss, no grads are needed for the critics
+        with _frozen(self.qnns): qnew = torch.cat([_qs(o, *ss, *anew) for o in self.qnns])
+        qnew = qnew.min(dim=0)[0] if self.p_q == 'min' else qnew.mean(dim=0)
+        p_loss = (self.temp.detach() * logprob - qnew).mean()
+        p_loss += 1e-3 * mean.pow(2).mean() + 1e-3 * std.log().pow(2).mean()
+        # Optimize, the policy goes first, its backward goes through the critics weights
         self.p_opt.optimize(loss=p_loss, nn=self.p.nn)
+        for o, opt, loss in zip(self.qnns, self.q_opts, q_losses): opt.optimize(loss=loss, nn=o)
         self._update_targ_nn(w=self.targ_smooth)
         if self.ent_targ is not None:
             temp_loss = -self.logtemp * (logprob + self.ent_targ).detach().mean()
@@ -52,18 +78,31 @@ class SAC(Model):
         # Write logs
         rw.logger.add_log("policy/loss", p_loss)
         rw.logger.add_log("policy/logprob_mean", logprob.mean(), hidden=False)
-        rw.logger.add_log("q1/loss", q1_loss)
-        rw.logger.add_log("q2/loss", q2_loss)
+        for name, loss in zip(self.q_names, q_losses): rw.logger.add_log(f"{name}/loss", loss)
         rw.logger.add_log('temperature', self.temp, precision=4)
         rw.logger.add_histogram("policy/logprob", logprob)
-        rw.logger.add_histogram("policy/mean", self.p.mean(dist=dist))
-        rw.logger.add_histogram("policy/std", self.p.std(dist=dist))
-        rw.logger.add_histogram("q1/value", q1b)
-        rw.logger.add_histogram("q2/value", q2b)
+        rw.logger.add_histogram("policy/mean", mean)
+        rw.logger.add_histogram("policy/std", std)
+        for name, qb in zip(self.q_names, qbs): rw.logger.add_histogram(f"{name}/value", qb)
 
     @property
     def temp(self): return self.logtemp.exp()
 
     def _update_targ_nn(self, w):
-        U.copy_weights(from_nn=self.q1nn, to_nn=self.q1nn_targ, weight=w)
-        U.copy_weights(from_nn=self.q2nn, to_nn=self.q2nn_targ, weight=w)
+        for up in self._targ_ups: up(w)
+
+
+def _qs(qnn, *xs):
+    "Values of a critic net with shape (#critics, #samples, 1), single critics return (#samples, 1)."
+    q = qnn(*xs)
+    return q.reshape(-1, *q.shape[-2:])
+
+
+@contextmanager
+def _frozen(nns):
+    "Parameters of `nns` don't require grads inside the block."
+    ps = [p for nn in nns for p in nn.parameters() if p.requires_grad]
+    for p in ps: p.requires_grad_(False)
+    try: yield
+    finally:
+        for p in ps: p.requires_grad_(True)
@@ -1 +1,2 @@
-from .container import Flatten
\ No newline at end of file
+from .container import Flatten
+from .ensemble import EnsembleLinear, EnsembleQ
@@ -0,0 +1,35 @@
+import math, torch
+import torch.nn as nn
+
+
+class EnsembleLinear(nn.Module):
+    "`k` independent linear layers evaluated with a single batched matmul, inputs are (#samples, n_in) (shared) or (k, #samples, n_in)."
+    def __init__(self, k, n_in, n_out):
+        super().__init__()
+        self.k = k
+        self.weight = nn.Parameter(torch.empty(k, n_in, n_out))
+        self.bias = nn.Parameter(torch.empty(k, 1, n_out))
+        # Same init as `nn.Linear`
+        bound = 1 / math.sqrt(n_in)
+        nn.init.uniform_(self.weight, -bound, bound)
+        nn.init.uniform_(self.bias, -bound, bound)
+
+    def forward(self, x):
+        if x.dim() == 2: x = x.expand(self.k, *x.shape)
+        return torch.baddbmm(self.bias, x, self.weight)
+
+
+class EnsembleQ(nn.Module):
+    """
+    `k` Q value MLPs of states and actions (concatenated) with their weights stacked, all critics are evaluated
+    together by batched matmuls, for about the cost of one. Returns values with shape (k, #samples, 1).
+    """
+    def __init__(self, n_in, n_acs, k=2, hidden=256, n_layers=2, activation=nn.ReLU):
+        super().__init__()
+        self.k = k
+        layers = [EnsembleLinear(k, n_in + n_acs, hidden), activation()]
+        for _ in range(n_layers - 1): layers += [EnsembleLinear(k, hidden, hidden), activation()]
+        layers += [EnsembleLinear(k, hidden, 1)]
+        self.layers = nn.Sequential(*layers)
+
+    def forward(self, s, a): return self.layers(torch.cat([s, a], dim=-1))
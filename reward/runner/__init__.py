@@ -1,7 +1,8 @@
 from .paac import PAAC
+from .apex import ApeX
 from .base_runner import BaseRunner
 from .single_runner import SingleRunner
 from .paac_runner import PAACRunner
 from .eval_runner import EvalRunner
 
-__all__ = ["BaseRunner", "SingleRunner", "PAACRunner"]
+__all__ = ["BaseRunner", "SingleRunner", "PAACRunner", "ApeX"]
@@ -0,0 +1,134 @@
+import time, queue, itertools
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.multiprocessing as mp
+import reward as rw, reward.utils as U
+from copy import deepcopy
+from reward.env.vec_env import SyncVecEnv
+from .paac import StateTfms
+
+
+class ApeX:
+    """
+    Distributed prioritized replay (Ape-X) on a single machine: `n_actors` processes step their own envs
+    with a cpu copy of the policy and send segments of transitions, with initial priorities computed by
+    the model `get_pr` (max priority if not supported), to a single learner training continuously.
+
+    The learner is `agent` (a `rw.agent.PrReplay`), it runs in the calling process (on the current device)
+    and only trains, transitions are added by the runner. Its networks are pushed to shared memory every
+    `push_freq` updates and actors reload them every `sync_freq` steps. Actors set `U.global_step` to the
+    total number of steps taken by all actors, so schedules (e.g. exploration) follow the training progress.
+
+    Parameters
+    ----------
+    env_fn: function
+        Creates an env, called inside the actor processes.
+    n_envs: int
+        Number of envs stepped by each actor, the policy should return one action for each of them.
+    seg_len: int
+        Number of steps collected by an actor before they are sent to the learner.
+    tfms: list
+        Transforms applied to the states inside the actors (each env gets its own copy).
+    max_segs: int
+        Maximum number of segments waiting for the learner, actors block when it falls behind.
+    """
+    def __init__(self, agent, env_fn, *, n_actors, n_envs=1, seg_len=50, sync_freq=400, push_freq=50, tfms=None, max_segs=64, seed=0):
+        self.agent, self.env_fn, self.n_actors, self.n_envs = agent, env_fn, n_actors, n_envs
+        self.seg_len, self.sync_freq, self.push_freq, self.tfms = seg_len, sync_freq, push_freq, tfms
+        self.max_segs, self.seed = max_segs, seed
+        self.s_sp, self.a_sp = agent.s_sp[0], agent.a_sp[0]
+        if not len(agent.s_sp) == len(agent.a_sp) == 1: raise RuntimeError('Multiple spaces not supported')
+        self._actors, self.stats = [], dict(actor_steps_s=0., learner_updates_s=0.)
+
+    def run(self, maxsteps):
+        "Trains until the actors took `maxsteps` steps, returns the throughput of the actors and the learner."
+        self._start()
+        try:
+            n_updates, start, learn_start = 0, time.perf_counter(), None
+            while U.global_step.get() < maxsteps:
+                learning = len(self.agent.b) > max(self.agent.bs, self.agent.learn_start)
+                self._receive(block=not learning)
+                if not learning: continue
+                learn_start = learn_start or time.perf_counter()
+                self.agent.learn()
+                n_updates += 1
+                if n_updates % self.push_freq == 0: self._push()
+                now = time.perf_counter()
+                self.stats = dict(actor_steps_s=self._steps.value / (now - start), learner_updates_s=n_updates / (now - learn_start))
+                for k, v in self.stats.items(): rw.logger.add_log(f'apex/{k}', v)
+        finally: self.close()
+        return self.stats
+
+    def close(self):
+        for p in self._actors: p.terminate()
+        self._actors = []
+
+    def _start(self):
+        # Networks are reached from the model and its policy, the same network is shared between them
+        self._nns = {k: deepcopy(m).cpu().share_memory() for k, m in _nns(self.agent.md).items()}
+        self._q, self._steps = mp.Queue(maxsize=self.max_segs), mp.Value('l', 0)
+        for i in range(self.n_actors):
+            args = (self.agent.md, self._nns, self.env_fn, self.n_envs, self.s_sp, self.a_sp, self.seg_len, self.sync_freq,
+                    self.tfms, self._q, self._steps, self.seed + i)
+            p = mp.Process(target=_actor, args=args)
+            p.daemon = True
+            p.start()
+            self._actors.append(p)
+
+    def _push(self):
+        for k, m in _nns(self.agent.md).items(): self._nns[k].load_state_dict(m.state_dict())
+
+    def _receive(self, block):
+        "Adds the segments sent by the actors, waiting for the first one if `block`."
+        for i in range(self.max_segs):
+            try: (ep_rs, ep_lens), seg = self._q.get(block=block and i == 0, timeout=1.)
+            except queue.Empty:
+                dead = [i for i, p in enumerate(self._actors) if not p.is_alive()]
+                if dead: raise RuntimeError(f'Actors {dead} stopped unexpectedly')
+                return
+            self.agent.add_segment(**seg)
+            U.global_step.add(seg['rs'].size)
+            for r, l in zip(ep_rs, ep_lens):
+                rw.logger.add_log('episode/reward', r, force=True)
+                rw.logger.add_log('episode/len', l, force=True)
+
+
+def _nns(md):
+    "Networks of the model and its policy, by attribute name."
+    nns = {f'p.{k}': v for k, v in vars(md.p).items() if isinstance(v, nn.Module)}
+    nns.update({k: v for k, v in vars(md).items() if isinstance(v, nn.Module)})
+    return nns
+
+
+def _actor(md, nns, env_fn, n_envs, s_sp, a_sp, seg_len, sync_freq, tfms, q, steps, seed):
+    torch.set_num_threads(1)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    U.device.set_device(torch.device('cpu'))
+    # The model networks are replaced by local copies, identity is kept for networks shared with the policy
+    local, copies = {}, {}
+    for k, m in nns.items():
+        obj, name = (md.p, k[2:]) if k.startswith('p.') else (md, k)
+        local[k] = copies.setdefault(id(getattr(obj, name)), deepcopy(m))
+        setattr(obj, name, local[k])
+    s_fns = None if tfms is None else [StateTfms(s_sp=s_sp, tfms=tfms) for _ in range(n_envs)]
+    venv = SyncVecEnv([env_fn() for _ in range(n_envs)], s_fns=s_fns)
+    ss, acs, rs, ds, eps = [venv.reset().copy()], [], [], [], U.EpisodeTracker()
+    for t in itertools.count():
+        if t % sync_freq == 0:
+            for k, m in local.items(): m.load_state_dict(nns[k].state_dict())
+            U.global_step.set(steps.value)
+        with torch.no_grad(): a = U.to_np(U.listify(md.get_act([s_sp(ss[-1]).to_tensor()]))[0])
+        s, r, d, _ = venv.step(a)
+        for l, o in zip([ss, acs, rs, ds], [s, a, r, d]): l.append(o.copy())
+        eps.step(r=r, d=d)
+        if len(rs) < seg_len: continue
+        ss, acs, rs, ds = np.array(ss), np.array(acs), np.array(rs), np.array(ds)
+        pr = md.get_pr(ss=[s_sp.from_arr(ss[:-1]).to_tensor()], sns=[s_sp.from_arr(ss[1:]).to_tensor()],
+                       acs=[a_sp.from_arr(acs).to_tensor()], rs=U.tensor(rs), ds=U.tensor(ds))
+        pr = None if pr is None else U.to_np(pr).reshape(seg_len, n_envs)
+        q.put(((eps.rs, eps.lens), dict(ss=[ss], acs=[acs], rs=rs, ds=ds, pr=pr)))
+        with steps.get_lock(): steps.value += seg_len * n_envs
+        # Episodes finished during the segment are sent with it
+        ss, acs, rs, ds, eps.rs, eps.lens = [ss[-1]], [], [], [], [], []
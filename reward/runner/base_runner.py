@@ -48,16 +48,23 @@ class BaseRunner(ABC):
 
     @property
     def num_episodes(self):
-        return len(self.rs)
+        return len(self.eps)
+
+    @property
+    def rs(self):
+        return self.eps.rs
+
+    @property
+    def ep_lens(self):
+        return self.eps.lens
 
     @property
     def is_best(self):
         return self._is_best
 
     def clean(self):
-        self.rs = []
+        self.eps = U.EpisodeTracker(maxlen=self.ep_maxlen)
         self.num_steps = 0
-        self.ep_lens = []
         self.new_ep = 0
         self._is_best = False
         self._last_logged_ep = 0
@@ -3,80 +3,67 @@ import numpy as np
 import torch
 import torch.multiprocessing as mp
 import reward.utils as U
-from collections import namedtuple
+from copy import deepcopy
+from reward.env.vec_env import SubprocVecEnv
 
 
-def run(env_fn, n_envs, ss, acs, rs, ds, inq, outq, s_sp, tfms):
-    envs = [env_fn() for _ in range(n_envs)]
-    while True:
-        signal = inq.get()
-        a = acs.numpy()
-        for i, env in enumerate(envs):
-            if signal is None:
-                s = np.array(s_sp(env.reset()[None]).apply_tfms(tfms))
-                ss[i] = torch.as_tensor(s, dtype=ss.dtype)[0]
-            else:
-                # TODO: Squeeze may cause problems
-                s, r, d, _ = env.step(a[i].squeeze())
-                if d: s = env.reset()
-                s = np.array(s_sp(s[None]).apply_tfms(tfms))
-                ss[i] = torch.as_tensor(s, dtype=ss.dtype)[0]
-                rs[i] = torch.as_tensor(r, dtype=rs.dtype)
-                ds[i] = torch.as_tensor(d, dtype=ds.dtype)
-        outq.put(None)
+def apply_tfms(s, s_sp, tfms): return np.asarray(s_sp(s[None]).apply_tfms(tfms))[0]
 
 
-class PAAC:
-    def __init__(self, env_fn, n_envs, s_sp, a_sp, n_workers=None, tfms=None):
-        # TODO: Verify implemenatation, works with images? dtype with images, torch support uint8? Dont work with multiple spaces
-        warnings.warn('Not tested with images')
-        self.n_workers = n_workers or mp.cpu_count()
-        if not n_envs % n_workers == 0 and n_envs > n_workers: raise ValueError('n_envs should be divisible by n_workers')
-        self.env_fn,self.n_envs=env_fn,n_envs
-        self._create_shared(s_sp=s_sp, a_sp=a_sp)
-        self._create_workers(s_sp=s_sp, tfms=tfms)
+class StateTfms:
+    "Converts the states of a single env to `s_sp` and applies (a copy of) `tfms`, reset at the start of each episode."
+    def __init__(self, s_sp, tfms): self.s_sp, self.tfms = s_sp, deepcopy(tfms)
+    def __call__(self, s): return apply_tfms(s, s_sp=self.s_sp, tfms=self.tfms)
 
     def reset(self):
-        for w in self._workers: w.send.put(None)
-        self._sync()
-        return self._ss.clone()
-
-    def step(self, act):
-        self._acs.copy_(torch.as_tensor(act))
-        for w in self._workers: w.send.put(True)
-        self._sync()
-        return self._ss.clone(), self._rs.clone(), self._ds.clone(), {}
-
-    def close(self):
-        for w in self._workers: w.p.terminate()
-
-    def _sync(self):
-        for w in self._workers: w.recv.get()
-
-    def _create_shared(self, s_sp, a_sp):
-        n_envs = (self.n_envs,)
-        self._ss = torch.as_tensor(np.zeros(n_envs+tuple(s_sp.shape), dtype=s_sp.dtype))
-        self._acs = torch.as_tensor(np.zeros(n_envs+tuple(a_sp.shape), dtype=a_sp.dtype))
-        self._rs = torch.zeros(n_envs, dtype=torch.float)
-        self._ds = torch.zeros(n_envs, dtype=torch.int)
-        for t in [self._ss, self._acs, self._rs, self._ds]: t.share_memory_()
-
-    def _create_workers(self, s_sp, tfms):
-        Worker = namedtuple('Worker', 'p send recv')
-        self._workers = []
-        for ss, acs, rs, ds in zip(*self._split(self._ss, self._acs, self._rs, self._ds)):
-            sendq, recvq = mp.Queue(), mp.Queue()
-            p = mp.Process(target=run, args=(self.env_fn, self.n_envs//self.n_workers, ss, acs, rs, ds, sendq, recvq, s_sp, tfms))
-            p.daemon = True
-            p.start()
-            self._workers.append(Worker(p=p, send=sendq, recv=recvq))
-
-    def _split(self, *ts):
-        # TODO: Asserting divisible, can simplify
-        q, r = divmod(self.n_envs, self.n_workers)
-        return [[t[i*q+min(i, r):(i+1)*q+min(i+1, r)] for i in range(self.n_workers)] for t in ts]
-
+        for tfm in U.listify(self.tfms): tfm.reset()
+
+
+class PAAC(SubprocVecEnv):
+    """
+    Steps `n_envs` environments split between `n_workers` processes, see `rw.env.SubprocVecEnv`.
+    States are converted to `s_sp` and transformed by `tfms` inside the workers. Except with `start_method='fork'`,
+    `env_fn` is pickled (e.g. a module level function or `functools.partial`).
+
+    States, rewards and dones are double-buffered: the returned tensors are views into
+    shared memory (no copies), they stay valid until `n_bufs - 1` further calls
+    to `step`/`reset`, clone them if they need to live longer.
+
+    Dones are int32. Infos hold the `info_schema` values of each env and, with `info_on_done`, the full infos
+    of finished episodes (see `rw.env.SubprocVecEnv`).
+
+    Stepping can be split in `step_async`/`step_wait` so the policy can run while
+    the workers step. With `n_groups > 1` the envs (and workers) are split into groups
+    that are stepped independently, e.g. with two halves, actions for half A can be
+    computed while half B is stepping:
+
+    Examples
+    --------
+        >>> runner = PAAC(env_fn, n_envs=16, n_workers=4, s_sp=S, a_sp=A, n_groups=2)
+        >>> ss = [runner.reset(group=g) for g in range(2)]
+        >>> for g in range(2): runner.step_async(policy(ss[g]), group=g)
+        >>> while True:
+        >>>     for g in range(2):
+        >>>         ss[g], rs, ds, _ = runner.step_wait(group=g)
+        >>>         runner.step_async(policy(ss[g]), group=g)
+    """
+    def __init__(self, env_fn, n_envs, s_sp, a_sp, n_workers=None, tfms=None, n_bufs=2, n_groups=1, info_schema=None, info_on_done=False,
+                 start_method=None):
+        # TODO: Verify implemenatation, works with images? dtype with images, torch support uint8? Dont work with multiple spaces
+        warnings.warn('Not tested with images')
+        # Transforms can hold state (e.g. frame stacking), each env needs its own copy
+        s_fns = None if tfms is None else [StateTfms(s_sp=s_sp, tfms=tfms) for _ in range(n_envs)]
+        super().__init__(env_fns=[env_fn] * n_envs, s_shape=s_sp.shape, s_dtype=s_sp.dtype, a_shape=a_sp.shape, a_dtype=a_sp.dtype,
+                         n_workers=n_workers or mp.cpu_count(), s_fns=s_fns, n_bufs=n_bufs, n_groups=n_groups,
+                         info_schema=info_schema, info_on_done=info_on_done, d_dtype=np.int32, start_method=start_method)
 
+    def reset(self, group=None): return torch.from_numpy(super().reset(group=group))
 
+    @U.timing.timed('env/step')
+    def step(self, act): return self._to_tensor(*super().step(act))
 
+    @U.timing.timed('env/step_wait')
+    def step_wait(self, group=0): return self._to_tensor(*super().step_wait(group=group))
 
+    @staticmethod
+    def _to_tensor(ss, rs, ds, infos): return torch.from_numpy(ss), torch.from_numpy(rs), torch.from_numpy(ds), infos
@@ -6,8 +6,6 @@ from boltons.cacheutils import cachedproperty
 class SingleRunner(BaseRunner):
     def __init__(self, env, ep_maxlen=None):
         super().__init__(env=env, ep_maxlen=ep_maxlen)
-        self._ep_r_sum = 0
-        self._ep_num_steps = 0
 
     @property
     def env_name(self):
@@ -28,9 +26,7 @@ class SingleRunner(BaseRunner):
         return self.env.ac_space
 
     def reset(self):
-        self._ep_r_sum = 0
-        self._ep_num_steps = 0
-
+        self.eps.reset()
         s = self.env.reset()
         return s[None]
 
@@ -40,12 +36,8 @@ class SingleRunner(BaseRunner):
         s, r, d, info = self.env.step(ac)
         s = s[None]
 
-        self._ep_r_sum += r
         self.num_steps += 1
-        self._ep_num_steps += 1
-        if d or self._ep_num_steps >= self.ep_maxlen:
-            self.rs.append(self._ep_r_sum)
-            self.ep_lens.append(self._ep_num_steps)
+        if len(self.eps.step(r=r, d=d)):
             s = self.reset()
 
         return s, np.array(r)[None], np.array(d)[None], info
@@ -17,6 +17,7 @@ class Continuous(Space):
 
     def __call__(self, arr): return ContinuousObj(arr=arr)
     def from_list(self, arrs): return ContinuousObj.from_list(arrs=arrs)
+    def from_arr(self, arr): return ContinuousList.from_arr(arr=arr)
 
     def sample(self): return np.random.uniform(low=self.low, high=self.high, size=self.shape)
 
@@ -30,6 +31,7 @@ class ContinuousObj:
     
     def __array__(self): return np.array(self.arr, dtype='float', copy=False)
     def to_tensor(self): return U.tensor(np.array(self), dtype=torch.float)
+    def set(self, arr): self.arr[...] = arr
 
     def apply_tfms(self, tfms, priority=True):
         if priority: tfms = sorted(U.listify(tfms), key=lambda o: o.priority, reverse=True)
@@ -43,12 +45,17 @@ class ContinuousObj:
 
 class ContinuousList:
     sig = Continuous
-    def __init__(self, arrs): self.arrs = arrs
+    def __init__(self, arrs, arr=None): self.arrs, self._arr = arrs, arr
 
-    def __array__(self): return np.array([o.arr for o in self.arrs], dtype='float', copy=False)
+    def __array__(self):
+        if self._arr is not None: return self._arr
+        return np.array([o.arr for o in self.arrs], dtype='float', copy=False)
     def to_tensor(self): return U.tensor(np.array(self), dtype=torch.float)
 
-    def unpack(self): return self.arrs
+    def unpack(self): return self.arrs if self.arrs is not None else [ContinuousObj(o) for o in self._arr]
+
+    @classmethod
+    def from_arr(cls, arr): return cls(arrs=None, arr=arr)
 
     def save(self, savedir, postfix=''):
         np.save(Path(savedir)/f'cont_{postfix}.npy', np.array(self))
@@ -17,6 +17,7 @@ class Image(Space):
         return ImageObj(img=self._fix_dims(img))
 
     def from_list(self, imgs): return ImageObj.from_list(imgs=imgs)
+    def from_arr(self, arr): return ImageList.from_arr(arr=arr)
 
     def _fix_dims(self, img): return img if self.order == 'NHWC' else img.transpose([0, 2, 3, 1])
 
@@ -34,44 +35,53 @@ class ImageObj:
         if isinstance(x, (torch.ByteTensor, torch.cuda.ByteTensor)): x = x.float() / 255.
         return x
     
+    @U.timing.timed('space/tfms')
     def apply_tfms(self, tfms):
         tfms = sorted(U.listify(tfms), key=lambda o: o.priority, reverse=True)
-        img = self.img.copy()
+        # Transforms don't modify their inputs, no need to copy
+        img = self.img
         for tfm in tfms: img = tfm(img)
+        # The output buffer of the last transform is overwritten by its next call
+        if tfms and getattr(tfms[-1], 'reuse', False): img = img.copy()
         return self.__class__(img=img)
 
     @staticmethod
     def from_list(imgs): return ImageList(imgs=imgs)
 
     @property
-    def shape(self): raise NotImplementedError
+    def shape(self): return self.img.shape
 
 class ImageList:
     sig = Image
-    def __init__(self, imgs): self.imgs = imgs
+    def __init__(self, imgs, arr=None): self.imgs, self._arr = imgs, arr
 
     def __array__(self): 
+        if self._arr is not None: return self._arr
         x = [o.img for o in self.imgs]
         # StackFrames Hack
         if isinstance(self.imgs[0].img, LazyStack): x = LazyStack.from_lists(x)
         return np.array(x)
 
     def to_tensor(self, transpose=True):
-        arr = np.array(self).transpose([0, 1, 4, 2, 3]) if transpose else np.array(self)
-        x = U.tensor(arr)
-        if isinstance(x, (torch.ByteTensor, torch.cuda.ByteTensor)): x = x.float() / 255.
+        # Sent to the device as is (e.g. from pinned memory), transposed and converted to float there
+        x = U.tensor(np.array(self))
+        if transpose: x = x.permute(0, 1, 4, 2, 3)
+        if x.dtype == torch.uint8: x = x.float().div_(255.)
         return x
 
-    def unpack(self): return self.imgs
+    def unpack(self): return self.imgs if self.imgs is not None else [ImageObj(o) for o in self._arr]
+
+    @classmethod
+    def from_arr(cls, arr): return cls(imgs=None, arr=arr)
 
     def save(self, savedir, postfix=''):
         savedir = Path(savedir)
         # StackFrames Hack
-        if isinstance(self.imgs[0].img, LazyStack):
+        if self.imgs is not None and isinstance(self.imgs[0].img, LazyStack):
             x = np.array([np.array(o.img, copy=False)[..., -1, None] for o in self.imgs])
             with open(str(savedir/(f'lazystack_{postfix}.json')), 'w') as f: json.dump(dict(n=np.array(self.imgs[0]).shape[-1]), f)
         else:
-             x = np.array([o.img for o in self.imgs])
+             x = np.array(self)
         np.save(savedir/f'img_{postfix}.npy', x)
 
     @classmethod
@@ -1 +1 @@
-from .img import Gray, Resize, Stack
\ No newline at end of file
+from .img import Gray, Resize, GrayResize, Stack
\ No newline at end of file
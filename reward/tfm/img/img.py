@@ -11,6 +11,10 @@ class Transform(ABC):
     @abstractmethod
     def apply(self, x): pass
 
+    def reset(self):
+        "Clears the state of stateful transforms, called at the start of each episode."
+        pass
+
 class Gray(Transform):
     priority = 8
     def apply(self, x): return np.dot(x[..., :3], [0.299, 0.587, 0.114])[..., None].astype(x.dtype)
@@ -25,15 +29,47 @@ class Resize(Transform):
         img = np.array([cv2.resize(o, self.sz[::-1], interpolation=cv2.INTER_AREA) for o in x])
         return img.reshape((x.shape[0], *self.sz, x.shape[3]))
 
+class GrayResize(Transform):
+    """
+    Fused `Gray` and `Resize`, (N, H, W, 3) uint8 -> (N, *sz, 1) uint8 in a single pass per image.
+    Luma is computed by opencv with fixed-point integer weights.
+
+    With `reuse` results are written into a buffer allocated on the first call, the returned array is
+    overwritten by the next call. Meant to be followed by transforms that copy what they keep (e.g. `Stack`),
+    `ImageObj.apply_tfms` copies it when it's the last transform.
+    """
+    priority = 8
+    def __init__(self, sz, reuse=False):
+        if len(sz) != 2: raise ValueError(f'sz should be (x, y), got {sz}')
+        self.sz, self.reuse, self._gray, self._out = tuple(sz), reuse, None, None
+
+    def apply(self, x):
+        if x.dtype != np.uint8: raise ValueError(f'Expected uint8 images, got {x.dtype}')
+        if x.shape[-1] not in (3, 4): raise ValueError(f'Expected RGB or RGBA images (last dim = 3 or 4), got {x.shape}')
+        if self._gray is None or self._gray.shape != x.shape[:3]:
+            self._gray, self._out = np.empty(x.shape[:3], dtype=np.uint8), np.empty((len(x), *self.sz), dtype=np.uint8)
+        out = self._out if self.reuse else np.empty_like(self._out)
+        code = cv2.COLOR_RGB2GRAY if x.shape[-1] == 3 else cv2.COLOR_RGBA2GRAY
+        for o, gray, dst in zip(x, self._gray, out):
+            cv2.cvtColor(o, code, dst=gray)
+            cv2.resize(gray, self.sz[::-1], dst=dst, interpolation=cv2.INTER_AREA)
+        return out[..., None]
+
 class Stack(Transform):   
     priority = 1
     def __init__(self, n):
         self.n, self.deque = n, deque(maxlen=n)
 
     def get(self): return LazyStack(list(self.deque))
-        
+
+    def reset(self):
+        "Clears the stack, the next frame is going to fill all the stack positions."
+        self.deque.clear()
+
     def apply(self, x):
         if x.shape[-1] != 1: raise ValueError(f'Can only stack grayscale images (last dim = 1), got {x.shape}')
+        # Frames are kept around, previous transforms may reuse their output buffers
+        x = x.copy()
         if len(self.deque) == 0:
             for _ in range(self.n-1): self.deque.append(x)
         self.deque.append(x)
@@ -43,6 +79,9 @@ class LazyStack:
     def __init__(self, arr): self.arr = arr        
     def __array__(self): return np.array(self.arr).transpose((4, 1, 2, 3, 0))[0]
 
+    @property
+    def shape(self): return (*self.arr[0].shape[:-1], len(self.arr))
+
     @staticmethod
     def from_lists(x): return LazyStackList(x=x)
 
@@ -17,6 +17,7 @@ from .torch_utils import (
     to_tensor,
     tensor,
     copy_weights,
+    Polyak,
     mean_grad,
     change_lr,
     save_model,
@@ -24,8 +25,11 @@ from .torch_utils import (
     freeze_weights,
     optimize,
     OptimWrap,
+    Staging,
 )
 from .batch import Batch
+from .prefetch import Prefetcher
+from .episode_tracker import EpisodeTracker
 
 import reward.utils.scheds
 import reward.utils.estim
@@ -34,6 +38,7 @@ import reward.utils.buffers
 import reward.utils.device
 import reward.utils.wrapper
 import reward.utils.global_step
+import reward.utils.timing
 
 __all__ = [
     "EPSILON",
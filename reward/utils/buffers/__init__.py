@@ -1,4 +1,5 @@
 from .ring_buffer import RingBuffer
+from .segment_tree import SegmentTree, SumTree, MinTree
 from .replay_buffer import ReplayBuffer, DictReplayBuffer
 from .prioritized_replay_buffer import PrReplayBuffer
 from .demo_replay_buffer import DemoReplayBuffer
@@ -9,4 +10,7 @@ __all__ = [
     "PrReplayBuffer",
     "DemoReplayBuffer",
     "DictReplayBuffer",
+    "SegmentTree",
+    "SumTree",
+    "MinTree",
 ]
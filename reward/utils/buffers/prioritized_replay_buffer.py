@@ -1,11 +1,9 @@
-import pdb
 import numpy as np
-import reward
 from reward.utils.buffers import ReplayBuffer
+from reward.utils.buffers.segment_tree import SumTree, MinTree
 from reward.utils import make_callable
 
 
-# TODO: Why paper suggest using SumTree instead of this approach I did?
 class PrReplayBuffer(ReplayBuffer):
     def __init__(self, maxlen, num_envs, *, pr_factor, is_factor, min_pr=0.01):
         """
@@ -23,11 +21,12 @@ class PrReplayBuffer(ReplayBuffer):
         self._pr_factor = make_callable(pr_factor)
         self._is_factor = make_callable(is_factor)
 
-        self._probs = np.ones(self.maxlen)
+        self._sum_tree, self._min_tree = SumTree(self.maxlen), MinTree(self.maxlen)
+        self._max_pr = 1.
 
     @property
     def probs(self):
-        return self._probs[: len(self)]
+        return self._sum_tree[np.arange(len(self))]
 
     def get_min_pr(self, step):
         return self._min_pr(step)
@@ -40,26 +39,30 @@ class PrReplayBuffer(ReplayBuffer):
 
     def add_sample(self, **kwargs):
         super().add_sample(**kwargs)
-        # New transition start with max probability
-        prob = np.max(self.probs)
-        self.probs[self.current_idx] = prob
+        # New transitions start with max priority
+        idxs = self.idx * self.num_envs + np.arange(self.num_envs)
+        self._set_pr(idxs=idxs, pr=self._max_pr)
 
-    def sample(self, batch_size):
-        # The sum of all probs should be 1
-        probs = self.probs[: self.available_idxs]
-        probs = probs / np.sum(probs)
-        idxs = np.random.choice(self.available_idxs, batch_size, replace=False, p=probs)
+    def add_samples(self, ss, **kwargs):
+        rows = (self.idx + 1 + np.arange(ss.shape[0])) % self.real_maxlen
+        super().add_samples(ss=ss, **kwargs)
+        self._set_pr(idxs=(rows[:, None] * self.num_envs + np.arange(self.num_envs)).reshape(-1), pr=self._max_pr)
 
+    def sample(self, batch_size):
+        idxs = self._sum_tree.sample(bs=batch_size, end=self.available_idxs)
         return self._get_batch(idxs=idxs)
 
     def get_is_weight(self, idx, step):
-        probs = self.probs[idx]
-        probs = probs / np.sum(self.probs[: self.available_idxs])
-        is_weights = probs ** -self.get_is_factor(step)
-        is_weights /= is_weights.max()
-
+        # Normalized by the maximum weight, given by the minimum priority
+        pr_min = self._min_tree.reduce(0, self.available_idxs)
+        is_weights = (self._sum_tree[idx] / pr_min) ** -self.get_is_factor(step)
         return is_weights[:, None]
 
     def update_pr(self, idx, pr, step):
-        pr = pr.squeeze()
-        self.probs[idx] = (pr + self.get_min_pr(step)) ** self.get_pr_factor(step)
+        pr = (pr.squeeze() + self.get_min_pr(step)) ** self.get_pr_factor(step)
+        self._set_pr(idxs=idx, pr=pr)
+        self._max_pr = max(self._max_pr, np.max(pr))
+
+    def _set_pr(self, idxs, pr):
+        self._sum_tree[idxs] = pr
+        self._min_tree[idxs] = pr
@@ -47,7 +47,7 @@ class ReplayBuffer:
         if self.sn is not None:
             snb = self.stp1_stride[idxs]
         else:
-            snb = self.s_stride[idxs + self.n_step]
+            snb = self.s_stride[idxs + self.n_step * self.num_envs]
         acs = self.a_stride[idxs, -1:]
         rs = self.r_stride[idxs, -self.n_step :]
         ds = self.d_stride[idxs, -self.n_step :]
@@ -61,7 +61,7 @@ class ReplayBuffer:
         return Batch(s=sb, sn=snb, ac=acs, r=rs, d=ds, idx=idxs)
 
     @property
-    def available_idxs(self): return self.num_envs * (len(self) - self.stack - self.n_step + 1)
+    def available_idxs(self): return self.num_envs * (self._len - self.stack - self.n_step + 1)
 
     def _initialize(self, s, ac, r, d, sn=None):
         self.initialized = True
@@ -70,7 +70,7 @@ class ReplayBuffer:
         self.ss = np.empty((maxlen,) + s.shape, dtype=s.dtype)
         self.acs = np.empty((maxlen,) + ac.shape, dtype=ac.dtype)
         self.rs = np.empty((maxlen,) + r.shape, dtype=r.dtype)
-        self.ds = np.empty((maxlen,) + d.shape, dtype=np.bool)
+        self.ds = np.empty((maxlen,) + d.shape, dtype=bool)
         if sn is not None:
             assert s.shape == sn.shape
             self.sn = np.empty((maxlen,) + s.shape, dtype=s.dtype)
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class SegmentTree:
+    """
+    Array backed binary segment tree, every operation is vectorized over a batch of indexes.
+
+    Parameters
+    ----------
+    maxlen: int
+        Number of leaves.
+    op: numpy.ufunc
+        Associative operation used for reducing two children into their parent.
+    neutral: float
+        Neutral element of `op`, unused leaves are filled with it.
+    """
+    def __init__(self, maxlen, op, neutral):
+        self.maxlen, self.op, self.neutral = int(maxlen), op, neutral
+        self.depth = max(self.maxlen - 1, 0).bit_length()
+        self.size = 1 << self.depth
+        self._shifts = np.arange(1, self.depth + 1)[:, None]
+        self.tree = np.full(2 * self.size, neutral, dtype=np.float64)
+
+    def __getitem__(self, idxs): return self.tree[self.size + np.asarray(idxs)]
+
+    def __setitem__(self, idxs, vals):
+        idxs = np.atleast_1d(np.asarray(idxs)) + self.size
+        self.tree[idxs] = vals
+        # Update all the parents one level at a time, O(bs * log(N)), repeated parents are harmless
+        parents = idxs >> self._shifts
+        for p, l, r in zip(parents, parents << 1, (parents << 1) + 1):
+            self.tree[p] = self.op(self.tree[l], self.tree[r])
+
+    def reduce(self, start=0, end=None):
+        "Applies `op` over the leaves in [start, end), O(1) for the full range and O(log(N)) otherwise."
+        end = self.maxlen if end is None else end
+        if start == 0 and end >= self.maxlen: return self.tree[1]
+        res, l, r = self.neutral, start + self.size, end + self.size
+        while l < r:
+            if l & 1: res, l = self.op(res, self.tree[l]), l + 1
+            if r & 1: r, res = r - 1, self.op(res, self.tree[r - 1])
+            l, r = l >> 1, r >> 1
+        return res
+
+
+class SumTree(SegmentTree):
+    def __init__(self, maxlen): super().__init__(maxlen=maxlen, op=np.add, neutral=0.)
+
+    def find_prefixsum_idx(self, mass):
+        "Finds the highest indexes `i` such that sum(leaves[:i]) <= mass, descends the tree for all masses at once."
+        mass, idxs = np.array(mass, dtype=np.float64), np.ones(len(mass), dtype=np.int64)
+        for _ in range(self.depth):
+            idxs <<= 1
+            lsum = self.tree[idxs]
+            go_right = mass >= lsum
+            mass -= np.where(go_right, lsum, 0.)
+            idxs += go_right
+        return np.minimum(idxs - self.size, self.maxlen - 1)
+
+    def sample(self, bs, end=None):
+        "Stratified sampling, one index from each of `bs` equal segments of the total priority mass."
+        total = self.reduce(0, end)
+        mass = (np.arange(bs) + np.random.random(bs)) * (total / bs)
+        return self.find_prefixsum_idx(np.minimum(mass, total * (1 - 1e-12)))
+
+
+class MinTree(SegmentTree):
+    def __init__(self, maxlen): super().__init__(maxlen=maxlen, op=np.minimum, neutral=float('inf'))
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+class EpisodeTracker:
+    """
+    Keeps the return and length of the running episode of each env in arrays, updated with vector ops.
+    Finished episodes are appended to `rs` and `lens`.
+
+    Parameters
+    ----------
+    maxlen: int
+        Episodes reaching this length are counted as finished (their env should be reset by the caller).
+    """
+    def __init__(self, maxlen=None):
+        self.maxlen = maxlen or float('inf')
+        self.rs, self.lens = [], []
+        self.rsum, self.eplen, self._none = None, None, np.zeros(0, dtype=int)
+
+    def __len__(self): return len(self.rs)
+
+    def step(self, r, d):
+        "Adds a step with rewards `r` and dones `d` of all envs, returns the indexes of the envs whose episode ended."
+        r, d = np.asarray(r), np.asarray(d)
+        if self.rsum is None: self.rsum, self.eplen = np.zeros(r.shape), np.zeros(r.shape, dtype=int)
+        self.rsum += r
+        self.eplen += 1
+        if self.maxlen != float('inf'): d = np.logical_or(d, self.eplen >= self.maxlen)
+        if not d.any(): return self._none
+        idxs = np.flatnonzero(d)
+        self.rs.extend(self.rsum.reshape(-1)[idxs].tolist())
+        self.lens.extend(self.eplen.reshape(-1)[idxs].tolist())
+        self.reset(idxs)
+        return idxs
+
+    def reset(self, idxs=None):
+        "Starts new episodes for the envs at `idxs` (all by default) without counting the running ones."
+        if self.rsum is None: return
+        if idxs is None: idxs = slice(None)
+        self.rsum.reshape(-1)[idxs], self.eplen.reshape(-1)[idxs] = 0, 0
@@ -1,4 +1,5 @@
 from .estimation_funcs import (
+    disc_cumsum,
     disc_sum_rs,
     td_target,
     qlearn_targ,
@@ -1,38 +1,38 @@
 import torch
 import numpy as np
-from reward.utils import to_tensor
-from copy import deepcopy
 
 
+def disc_cumsum(xs, cs):
+    """
+    Reverse discounted cumulative sum over the first dimension, `y[t] = xs[t] + cs[t] * y[t+1]`.
+    Computed as a parallel scan in log2(#samples) vectorized steps, works with numpy arrays
+    and torch tensors (on any device).
+
+    Parameters
+    ----------
+    xs: numpy.ndarray or torch.Tensor
+        Values to be summed, shape (num_samples, num_envs).
+    cs: numpy.ndarray or torch.Tensor
+        Discount applied between steps t and t+1 (e.g. gamma * (1 - done)), same shape as `xs`.
+    """
+    assert xs.shape == cs.shape
+    ys, cs, shift = xs * 1, cs * 1, 1
+    while shift < len(ys):
+        # Each step doubles the horizon summed by every position
+        ys[:-shift] = ys[:-shift] + cs[:-shift] * ys[shift:]
+        cs[:-shift] = cs[:-shift] * cs[shift:]
+        shift *= 2
+    return ys
+
 def disc_sum_rs(rs, ds, vt_last=None, gamma=0.99):
     "Expected shape: (num_samples, num_envs)"
     assert rs.shape == ds.shape
-    rs = deepcopy(rs)
-
-    # TODO: This works but is messy
-    # TODO: I think tensor should be always be in CPU here (faster?)
-    is_tensor = lambda x: isinstance(x, torch.Tensor)
-    if any(map(is_tensor, (rs, ds, vt_last))):
-        rs, ds = to_tensor(rs), to_tensor(ds)
-        v_last = to_tensor(vt_last) if vt_last is not None else vt_last
-        tensor = True
-    else: tensor = False
-
-    # if vt_last is None and not all(ds[-1]):
-    #     raise AssertionError('If one episode is not finished you must'
-    #                          'pass a value to vt_last to bootstrap from.')
-
-    if vt_last is not None: rs[-1][ds[-1] == 0] = vt_last[ds[-1] == 0]
-
-    returns = np.zeros(rs.shape, dtype="float32")
-    returns_sum = np.zeros(rs.shape[-1], dtype="float32")
-    if tensor: returns, returns_sum = map(to_tensor, (returns, returns_sum))
-
-    for i in reversed(range(rs.shape[0])):
-        returns_sum = rs[i] + gamma * returns_sum * (1 - ds[i])
-        returns[i] = returns_sum
-
-    return returns
+    rs, ds, vt_last = _same_type(rs, ds, vt_last)
+    # Unfinished episodes bootstrap from the value of the last state
+    if vt_last is not None:
+        rs = rs * 1
+        rs[-1] = _where(ds[-1] == 0, vt_last, rs[-1])
+    return disc_cumsum(xs=rs, cs=gamma * (1 - ds))
 
 # TODO: Name change td_target -> td_targ
 def td_target(*, rs, ds, vn, gamma):
@@ -45,9 +45,15 @@ def qlearn_targ(*, rs, ds, qn, gamma):
     return td_target(rs=rs, ds=ds, vn=qn_max, gamma=gamma)
 
 def gae_estimation(rs, ds, v_t, v_tp1, *, gamma, gae_lambda):
-    td_target_value = td_target(rs=rs, ds=ds, v_tp1=v_tp1, gamma=gamma)
-    td_residual = td_target_value - v_t
-
-    advantages = disc_sum_rs(rs=td_residual, ds=ds, vt_last=None, gamma=gamma * gae_lambda)
-
-    return advantages
+    rs, ds, v_t, v_tp1 = _same_type(rs, ds, v_t, v_tp1)
+    td_residual = td_target(rs=rs, ds=ds, vn=v_tp1, gamma=gamma) - v_t
+    return disc_cumsum(xs=td_residual, cs=gamma * gae_lambda * (1 - ds))
+
+def _same_type(*xs):
+    "Converts all inputs to float tensors on the device of the first tensor found, or to float32 arrays if there's none."
+    t = next((o for o in xs if isinstance(o, torch.Tensor)), None)
+    if t is None: return [o if o is None else np.asarray(o, dtype=np.float32) for o in xs]
+    dtype = t.dtype if t.is_floating_point() else torch.float32
+    return [o if o is None else torch.as_tensor(o, device=t.device).to(dtype) for o in xs]
+
+def _where(cond, x, y): return torch.where(cond, x, y) if isinstance(cond, torch.Tensor) else np.where(cond, x, y)
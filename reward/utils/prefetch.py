@@ -0,0 +1,49 @@
+import queue, threading
+
+
+class Prefetcher:
+    """
+    Calls `fn` in a background thread, keeping up to `n` results ready in a bounded queue,
+    `get` returns them in the order they were produced.
+
+    Parameters
+    ----------
+    fn: function
+        Called without arguments, e.g. a function sampling and preparing a batch.
+    n: int
+        Maximum number of results waiting to be consumed.
+    deterministic: bool
+        If True, no thread is used and `fn` is called by `get`, so results only depend on
+        the state at the time of the call (useful for tests).
+    """
+    def __init__(self, fn, n=2, deterministic=False):
+        if n < 1: raise ValueError(f'n should be at least 1, got {n}')
+        self.fn, self.n, self.deterministic = fn, n, deterministic
+        self._q, self._thread, self._stop = queue.Queue(maxsize=n), None, threading.Event()
+
+    def get(self):
+        if self.deterministic: return self.fn()
+        if self._thread is None: self._start()
+        res = self._q.get()
+        if isinstance(res, _Error): raise RuntimeError('Exception raised by prefetching thread') from res.e
+        return res
+
+    def close(self):
+        self._stop.set()
+        # Unblocks the thread if it's waiting for space in the queue
+        while not self._q.empty(): self._q.get_nowait()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try: res = self.fn()
+            except Exception as e: res = _Error(e)
+            self._q.put(res)
+            if isinstance(res, _Error): return
+
+
+class _Error:
+    def __init__(self, e): self.e = e
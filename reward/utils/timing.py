@@ -0,0 +1,115 @@
+"""
+Per stage timing of the hot paths (acting, replay, training, env stepping, transforms).
+
+Off by default, timed blocks then cost a single flag check. Once `enable`d the wall-clock durations of each
+stage are recorded (and optionally the gpu time, measured with cuda events) and, every log interval,
+logged as `timing/<stage>` (mean in ms) with their histograms, then cleared.
+
+Examples
+--------
+    >>> U.timing.enable()
+    >>> with U.timing.timeit('env/step'): s, r, d, _ = env.step(a)
+    >>> @U.timing.timed('model/forward')
+    >>> def forward(self, x): ...
+
+For a full picture `profile` dumps `cProfile` stats of the next steps, an external sampling profiler
+(e.g. `py-spy record --pid <pid>`) can also be attached to a running process.
+"""
+import cProfile, time, torch
+import numpy as np
+from collections import defaultdict, deque
+from functools import wraps
+import reward.utils.global_step as global_step
+
+CONFIG = dict(on=False, cuda=False, maxlen=100000, subscribed=False)
+# Stage name: durations in seconds, the oldest are dropped after `maxlen` (e.g. forked workers that never log)
+TIMES = defaultdict(lambda: deque(maxlen=CONFIG['maxlen']))
+# Stage name: (start, end) cuda events, resolved when logging
+EVENTS = defaultdict(lambda: deque(maxlen=CONFIG['maxlen']))
+
+
+def enable(on=True, cuda=False):
+    "Turns timing on (or off), with `cuda` the gpu time of each stage is also measured (synchronizing when logging)."
+    CONFIG['on'], CONFIG['cuda'] = on, cuda and torch.cuda.is_available()
+    if on and not CONFIG['subscribed']:
+        import reward as rw
+        rw.logger.subscribe_log(log)
+        CONFIG['subscribed'] = True
+
+def disable(): enable(on=False)
+
+def is_on(): return CONFIG['on']
+
+
+class timeit:
+    "Context manager recording the duration of its block as stage `name`, does nothing when timing is off."
+    __slots__ = ('name', 'start', 'ev')
+    def __init__(self, name): self.name, self.start = name, None
+
+    def __enter__(self):
+        if not CONFIG['on']: return self
+        if CONFIG['cuda']:
+            self.ev = torch.cuda.Event(enable_timing=True)
+            self.ev.record()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is None: return
+        TIMES[self.name].append(time.perf_counter() - self.start)
+        if CONFIG['cuda']:
+            end = torch.cuda.Event(enable_timing=True)
+            end.record()
+            EVENTS[self.name].append((self.ev, end))
+        self.start = None
+
+
+def timed(name):
+    "Decorator recording the duration of each call as stage `name`, see `timeit`."
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not CONFIG['on']: return fn(*args, **kwargs)
+            with timeit(name): return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats():
+    "Recorded durations (in ms) of each stage, gpu times are named `<stage>/cuda`."
+    res = {k: 1e3 * np.fromiter(v, dtype='float64', count=len(v)) for k, v in TIMES.items() if v}
+    if EVENTS: torch.cuda.synchronize()
+    for k, v in EVENTS.items():
+        if v: res[f'{k}/cuda'] = np.array([s.elapsed_time(e) for s, e in v])
+    return res
+
+def clear():
+    TIMES.clear()
+    EVENTS.clear()
+
+
+def log():
+    "Logs the mean and histogram of each stage as `timing/<stage>` and clears them, called by the logger every log interval."
+    if not CONFIG['on']: return
+    import reward as rw
+    for k, v in stats().items():
+        rw.logger.add_log(f'timing/{k}', v.mean(), precision=4, hidden=True)
+        rw.logger.add_histogram(f'timing/{k}', v)
+    clear()
+
+
+def profile(path, steps):
+    """
+    Profiles (with `cProfile`) the calling thread for the next `steps` global steps, then dumps the stats to `path`
+    (read them with `pstats` or e.g. `snakeviz`). Returns the `cProfile.Profile`.
+    """
+    prof, end = cProfile.Profile(), global_step.get() + steps
+    def callback(gstep):
+        nonlocal prof
+        if prof is None or gstep < end: return
+        prof.disable()
+        prof.dump_stats(str(path))
+        prof = None
+    global_step.subscribe_add(callback)
+    prof.enable()
+    return prof
@@ -5,6 +5,7 @@ from tqdm import tqdm
 from pathlib import Path
 from reward.utils import is_np, listify
 from reward.utils.device import get
+import reward.utils.timing as timing
 
 TDTYPE = dict(float=torch.float, float32=torch.float, double=torch.double, uint8=torch.uint8, int=torch.int, long=torch.long)
 
@@ -16,13 +17,13 @@ class OptimWrap:
     def optimize(self, loss, nn=None):
         # TODO: nn can be passed on init
         self.zero_grad()
-        loss.backward()
+        with timing.timeit('model/backward'): loss.backward()
         for cb in self.callbacks: cb(nn.parameters())
         if self.clip_grad_norm != float('inf') or rw.logger.is_debug():
             assert nn is not None
             gnorm = torch.nn.utils.clip_grad_norm_(nn.parameters(), self.clip_grad_norm)
             rw.logger.add_log(f'{nn.__class__.__name__}/grad_norm', gnorm, hidden=True)
-        self.step()
+        with timing.timeit('model/opt_step'): self.step()
 
     @property
     def lr(self): return self.opt.param_groups[-1]['lr']
@@ -35,6 +36,38 @@ class OptimWrap:
     def zero_grad(self): return self.opt.zero_grad()
 
 
+class Staging:
+    """
+    Reusable host buffers used for sending batches to the device, pinned if the device is a gpu
+    so the copies made by `tensor` don't block.
+
+    Each key alternates between two buffers, a buffer is only handed out again after the copies
+    queued before its previous use have finished. Arrays returned by `get` are overwritten two calls
+    later, they should only be used for creating device tensors.
+    """
+    def __init__(self, pin=None):
+        self.pin = get().type == 'cuda' if pin is None else pin
+        self._bufs, self._events, self._i = {}, {}, {}
+
+    def get(self, key, shape, dtype):
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        bufs = self._bufs.get(key)
+        if bufs is None or bufs[0].shape != shape or bufs[0].dtype != dtype:
+            self._bufs[key] = bufs = [self._alloc(shape, dtype) for _ in range(2)]
+            self._events[key], self._i[key] = [None, None], 1
+        i = self._i[key] = 1 - self._i[key]
+        if self.pin:
+            if self._events[key][i] is not None: self._events[key][i].synchronize()
+            # The other buffer was handed out on the last call, copies from it are already queued
+            self._events[key][1 - i] = torch.cuda.Event()
+            self._events[key][1 - i].record()
+        return bufs[i]
+
+    def _alloc(self, shape, dtype):
+        x = torch.from_numpy(np.empty(shape, dtype=dtype))
+        return (x.pin_memory() if self.pin else x).numpy()
+
+
 # TODO: Deprecated
 def to_tensor(x, dtype='float32', device=None):
     warnings.warn('to_tensor is probably going to be deprecated', DeprecationWarning, stacklevel=2)
@@ -45,7 +78,9 @@ def to_tensor(x, dtype='float32', device=None):
 
 def tensor(x, device=None, **kwargs):
     device = device or get()
-    return torch.as_tensor(x, **kwargs).to(device)
+    x = torch.as_tensor(x, **kwargs)
+    # Copies from host memory are only asynchronous if the memory is pinned (e.g. from `Staging`)
+    return x.to(device, non_blocking=x.device.type == 'cpu')
 
 def optimize(loss, opt):
     opt.zero_grad()
@@ -53,9 +88,64 @@ def optimize(loss, opt):
     opt.step()
 
 def copy_weights(from_nn, to_nn, weight):
-    for fp, tp in zip(from_nn.parameters(), to_nn.parameters()):
-        v = weight * fp.data + (1 - weight) * tp.data
-        tp.data.copy_(v)
+    "Moves the parameters and buffers of `to_nn` towards the ones of `from_nn`, use `Polyak` for repeated updates."
+    Polyak(from_nn=from_nn, to_nn=to_nn, flatten=False)(weight)
+
+
+class Polyak:
+    """
+    Updates the parameters and buffers of `to_nn` in place towards the ones of `from_nn`: `to = weight * from + (1 - weight) * to`,
+    `weight=1.` is a hard copy. Integer buffers (e.g. batchnorm counters) are always copied.
+
+    With `flatten` the parameters of both nets are moved once into contiguous buffers (one per dtype and device),
+    parameters become views of them, so an update is a single `lerp_` per buffer. Otherwise fused `_foreach` ops are
+    used, there's no allocation in both cases. Nets moved afterwards (e.g. with `.to`) are flattened again.
+    """
+    def __init__(self, from_nn, to_nn, flatten=True):
+        self.from_nn, self.to_nn, self.flatten = from_nn, to_nn, flatten
+        self._build()
+
+    def __call__(self, weight):
+        if self._moved(): self._build()
+        with torch.no_grad():
+            for f, t in self._flats: t.copy_(f) if weight == 1. else t.lerp_(f, weight)
+            if self._froms and weight == 1.: torch._foreach_copy_(self._tos, self._froms)
+            elif self._froms:                torch._foreach_lerp_(self._tos, self._froms, weight)
+            if self._int_froms: torch._foreach_copy_(self._int_tos, self._int_froms)
+
+    def _build(self):
+        fps, tps = list(self.from_nn.parameters()), list(self.to_nn.parameters())
+        fbs, tbs = list(self.from_nn.buffers()), list(self.to_nn.buffers())
+        if not len(fps) == len(tps) or not len(fbs) == len(tbs): raise ValueError('Both nets should have the same parameters and buffers')
+        for f, t in zip(fps + fbs, tps + tbs):
+            if not f.shape == t.shape: raise ValueError(f'Shapes do not match, {f.shape} and {t.shape}')
+        self._flats, firsts = [], fps[:1] + tps[:1]
+        if self.flatten:
+            groups = {}
+            for f, t in zip(fps, tps): groups.setdefault((f.dtype, f.device, t.dtype, t.device), []).append((f, t))
+            for pairs in groups.values():
+                self._flats.append((_flatten([f for f, _ in pairs]), _flatten([t for _, t in pairs])))
+            fps, tps = [], []
+        # A moved net gets new tensors, the first parameters of each net are enough to detect it
+        self._firsts = [(o, o.data_ptr()) for o in firsts]
+        fbs, tbs = [o.detach() for o in fbs], [o.detach() for o in tbs]
+        is_float = [o.is_floating_point() for o in tbs]
+        self._froms = [f.detach() for f in fps] + [f for f, fl in zip(fbs, is_float) if fl]
+        self._tos = [t.detach() for t in tps] + [t for t, fl in zip(tbs, is_float) if fl]
+        self._int_froms = [f for f, fl in zip(fbs, is_float) if not fl]
+        self._int_tos = [t for t, fl in zip(tbs, is_float) if not fl]
+
+    def _moved(self): return any(o.data_ptr() != ptr for o, ptr in self._firsts)
+
+
+def _flatten(params):
+    "Moves `params` into a single contiguous buffer, returns the buffer, the parameters become views of it."
+    flat = torch.cat([p.detach().reshape(-1) for p in params])
+    i = 0
+    for p in params:
+        p.data = flat[i:i + p.numel()].view_as(p)
+        i += p.numel()
+    return flat
 
 def mean_grad(nn):
     return torch.stack([p.grad.mean() for p in nn.parameters()]).mean()
@@ -0,0 +1,80 @@
+import pytest, torch
+import numpy as np
+import reward as rw, reward.utils as U
+
+
+class Model:
+    gamma = .99
+    def get_act(self, ss): return (ss[0][:, 0] > 0).long()
+    def train(self, **kwargs): pass
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_agent_fast(fast):
+    S, A = rw.space.Continuous(low=-np.ones(4), high=np.ones(4)), rw.space.Categorical(n_acs=2)
+    agents = [rw.agent.Replay(model=Model(), s_sp=S, a_sp=A, bs=8, maxlen=64, learn_start=1e9, fast=o) for o in [False, fast]]
+    steps = []
+    for i in range(20):
+        s, d = S(np.random.normal(size=(3, 4))), np.random.random(3) < .2
+        acs = []
+        for agent in agents:
+            steps.append(U.global_step.get())
+            acs.append(np.array(agent.get_act(s)[0]))
+            agent.report(r=np.full(3, float(i)), d=d)
+        np.testing.assert_equal(*acs)
+    assert steps[1] - steps[0] == 3
+    b1, b2 = [agent.b[agent.b._ordered_idxs()] for agent in agents]
+    for k in ['ss', 'acs', 'rs', 'ds']: np.testing.assert_equal(b1[k], b2[k])
+    assert agents[0].eps.rs == agents[1].eps.rs and agents[0].eps.lens == agents[1].eps.lens
+
+def test_agent_fast_checks_spaces():
+    S, A = rw.space.Continuous(low=-np.ones(4), high=np.ones(4)), rw.space.Categorical(n_acs=2)
+    agent = rw.agent.Replay(model=Model(), s_sp=S, a_sp=A, bs=8, maxlen=64, fast=True)
+    with pytest.raises(TypeError): agent.get_act(rw.space.Categorical(n_acs=2)(np.zeros(3)))
+
+@pytest.mark.parametrize("pr", [False, True])
+def test_replay_n_updates(pr):
+    class Recorder(Model):
+        train_many = rw.model.Model.train_many
+        def __init__(self): self.bs = []
+        def train(self, *, ss, sns, acs, rs, ds, gammas=None, is_ws=None):
+            self.bs.append([tuple(o.shape) for o in [ss[0], acs[0], rs, is_ws] if o is not None])
+            return torch.ones(len(rs))
+    S, A = rw.space.Continuous(low=-np.ones(4), high=np.ones(4)), rw.space.Categorical(n_acs=2)
+    md = Recorder()
+    agent = (rw.agent.PrReplay if pr else rw.agent.Replay)(model=md, s_sp=S, a_sp=A, bs=8, maxlen=64, n_updates=3, learn_start=1e9)
+    for i in range(10):
+        agent.get_act(S(np.random.normal(size=(1, 4))))
+        agent.report(r=np.ones(1), d=np.zeros(1))
+    agent.learn()
+    assert md.bs == [[(8, 1, 4), (8, 1), (8, 1)] + ([(8,)] if pr else [])] * 3
+
+@pytest.mark.parametrize("pr", [False, True])
+def test_replay_more_envs_than_bs(pr):
+    class Recorder(Model):
+        def __init__(self): self.is_ws = []
+        def train(self, *, ss, sns, acs, rs, ds, gammas=None, is_ws=None):
+            self.is_ws.append(is_ws)
+            return torch.ones(len(rs))
+    S, A = rw.space.Continuous(low=-np.ones(4), high=np.ones(4)), rw.space.Categorical(n_acs=2)
+    md = Recorder()
+    agent = (rw.agent.PrReplay if pr else rw.agent.Replay)(model=md, s_sp=S, a_sp=A, bs=4, maxlen=64)
+    # A single step of 8 envs holds no complete transition yet
+    agent.get_act(S(np.random.normal(size=(8, 4))))
+    agent.report(r=np.ones(8), d=np.zeros(8))
+    assert md.is_ws == []
+    agent.get_act(S(np.random.normal(size=(8, 4))))
+    agent.report(r=np.ones(8), d=np.zeros(8))
+    assert len(md.is_ws) == 1
+    if pr: assert torch.isfinite(md.is_ws[0]).all()
+    with pytest.raises(ValueError): rw.mem.ReplayBuffer(maxlen=8).sample(bs=4)
+
+def test_pr_replay_prefetch():
+    S, A = rw.space.Continuous(low=-np.ones(4), high=np.ones(4)), rw.space.Categorical(n_acs=2)
+    class Big(Model):
+        def train(self, *, rs, **kwargs): return torch.full((len(rs),), 10.)
+    agent = rw.agent.PrReplay(model=Big(), s_sp=S, a_sp=A, bs=8, maxlen=32, prefetch=2)
+    for i in range(60):
+        agent.get_act(S(np.random.normal(size=(2, 4))))
+        agent.report(r=np.ones(2), d=np.zeros(2))
+        # Prefetched batches never give a priority to the newest step, it has no next state yet
+        with agent._lock: assert (agent.b.sum_tree[agent.b._flat_idxs(agent.b.position)] == 0).all()
@@ -0,0 +1,44 @@
+import pytest, torch
+import numpy as np
+import reward.utils as U
+
+
+def ref_disc_sum_rs(rs, ds, vt_last, gamma):
+    rs = rs.copy()
+    if vt_last is not None: rs[-1][ds[-1] == 0] = vt_last[ds[-1] == 0]
+    rets, ret = np.zeros(rs.shape), np.zeros(rs.shape[-1])
+    for i in reversed(range(rs.shape[0])):
+        ret = rs[i] + gamma * ret * (1 - ds[i])
+        rets[i] = ret
+    return rets
+
+def ref_gae(rs, ds, v_t, v_tp1, gamma, gae_lambda):
+    res = rs + (1 - ds) * gamma * v_tp1 - v_t
+    return ref_disc_sum_rs(res, ds, vt_last=None, gamma=gamma * gae_lambda)
+
+def data(horizon, n_envs):
+    rs = np.random.normal(size=(horizon, n_envs))
+    ds = (np.random.random(size=(horizon, n_envs)) < .05).astype('float')
+    vs = np.random.normal(size=(horizon + 1, n_envs))
+    return rs, ds, vs
+
+@pytest.mark.parametrize("horizon, n_envs", [(1, 1), (8, 2), (37, 4), (256, 16)])
+@pytest.mark.parametrize("tensor", [False, True])
+@pytest.mark.parametrize("bootstrap", [False, True])
+def test_disc_sum_rs(horizon, n_envs, tensor, bootstrap):
+    rs, ds, vs = data(horizon, n_envs)
+    vt_last = vs[-1] if bootstrap else None
+    expected = ref_disc_sum_rs(rs, ds, vt_last=vt_last, gamma=.99)
+    if tensor: rs, ds = torch.as_tensor(rs), torch.as_tensor(ds)
+    res = U.estim.disc_sum_rs(rs=rs, ds=ds, vt_last=vt_last, gamma=.99)
+    assert isinstance(res, torch.Tensor) == tensor
+    np.testing.assert_allclose(U.to_np(res), expected, rtol=1e-4, atol=1e-4)
+
+@pytest.mark.parametrize("horizon, n_envs", [(1, 1), (8, 2), (256, 16)])
+@pytest.mark.parametrize("tensor", [False, True])
+def test_gae_estimation(horizon, n_envs, tensor):
+    rs, ds, vs = data(horizon, n_envs)
+    expected = ref_gae(rs, ds, v_t=vs[:-1], v_tp1=vs[1:], gamma=.99, gae_lambda=.95)
+    if tensor: vs = torch.as_tensor(vs)
+    res = U.estim.gae_estimation(rs=rs, ds=ds, v_t=vs[:-1], v_tp1=vs[1:], gamma=.99, gae_lambda=.95)
+    np.testing.assert_allclose(U.to_np(res), expected, rtol=1e-4, atol=1e-4)
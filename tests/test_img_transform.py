@@ -30,3 +30,28 @@ def test_stack_mem():
     s1t = s1.apply_tfms(tfms)
     s2t = s2.apply_tfms(tfms)
     assert np.shares_memory(s1t.img.arr[0], s2t.img.arr[0])
+
+def test_gray_resize():
+    S = rw.space.Image(shape=[3, 210, 160, 3])
+    x = np.random.randint(0, 256, size=(3, 210, 160, 3), dtype='uint8')
+    tfm = rw.tfm.img.GrayResize(sz=[84, 84])
+    expected = np.array(S(x).apply_tfms([rw.tfm.img.Gray(), rw.tfm.img.Resize(sz=[84, 84])]))
+    out = np.array(S(x).apply_tfms(tfm))
+    assert out.shape == (3, 84, 84, 1) and out.dtype == np.uint8
+    # Gray truncates while opencv rounds, the difference can build up when resizing
+    assert np.abs(out.astype('int') - expected).max() <= 2
+    # Outputs are only reused when asked, apply_tfms copies them when nothing follows
+    assert not np.shares_memory(tfm(x), tfm(x))
+    tfm = rw.tfm.img.GrayResize(sz=[84, 84], reuse=True)
+    assert np.shares_memory(tfm(x), tfm(x))
+    s1, s2 = S(x).apply_tfms(tfm), S(255 - x).apply_tfms(tfm)
+    assert not np.shares_memory(s1.img, s2.img) and not np.array_equal(s1.img, s2.img)
+
+def test_gray_resize_stack():
+    S = rw.space.Image(shape=[1, 210, 160, 3])
+    tfms = [rw.tfm.img.Stack(n=2), rw.tfm.img.GrayResize(sz=[84, 84], reuse=True)]
+    xs = [np.full((1, 210, 160, 3), i, dtype='uint8') for i in [10, 20]]
+    s1, s2 = [np.array(S(x).apply_tfms(tfms)) for x in xs]
+    np.testing.assert_equal(s1[..., 0], 10)
+    np.testing.assert_equal(s2[..., 0], 10)
+    np.testing.assert_equal(s2[..., 1], 20)
@@ -0,0 +1,28 @@
+import pytest, torch
+import numpy as np
+import reward.utils as U
+from reward.logger.logger import Logger
+
+
+class Writer:
+    def __init__(self): self.scalars, self.hists = [], []
+    def add_scalar(self, name, value, global_step): self.scalars.append((name, float(value), global_step))
+    def add_histogram(self, name, values, global_step): self.hists.append((name, np.array(values).shape, global_step))
+
+@pytest.mark.parametrize("buffered", [False, True])
+def test_logger(buffered):
+    logger = Logger(logfreq=1e12)
+    logger.writer = Writer()
+    if buffered: logger.set_buffered(hist_rate=0.)
+    step = U.global_step.get()
+    logger.add_log('loss', torch.tensor(2., requires_grad=True) * 2)
+    logger.add_log('ep', torch.tensor(3), force=True)
+    logger.add_histogram('q', torch.zeros(5))
+    U.global_step.set(step + 1)
+    logger.add_log('ep', 4., force=True)
+    logger.log()
+    logger.flush()
+    scalars = [o for o in logger.writer.scalars if o[0] != 'steps_second']
+    # Forced logs keep their step, the last value is logged as well
+    assert sorted(scalars) == [('ep', 3., step), ('ep', 4., step + 1), ('ep', 4., step + 1), ('loss', 4., step + 1)]
+    assert logger.writer.hists == ([] if buffered else [('q', (5,), step + 1)])
@@ -0,0 +1,322 @@
+import pytest
+import numpy as np, reward as rw, reward.utils as U
+
+
+def fill(b, n, s_sp, a_sp):
+    for i in range(n):
+        s, a = s_sp(np.full((1, 3), i, dtype='float32')), a_sp(np.array([i]))
+        b.add_transition(s=[s], a=[a], r=np.array([i], dtype='float'), d=np.array([i % 5 == 4]))
+
+@pytest.mark.parametrize("maxlen", [10, 32])
+def test_replay_buffer_columns(maxlen):
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.ReplayBuffer(maxlen=maxlen)
+    fill(b, 20, S, A)
+    assert len(b) == min(20, maxlen)
+    assert b.ss[0].shape == (maxlen, 1, 3) and b.ss[0].dtype == np.float32
+    bt = b.sample(bs=64)
+    ss, sns, acs, rs = bt.ss[0], bt.sns[0], bt.acs[0], bt.rs
+    assert ss.shape == (64, 1, 3) and acs.shape == (64, 1) and rs.shape == (64, 1)
+    # Next state is always the following transition and the newest transition is never sampled
+    np.testing.assert_equal(sns[:, 0, 0], ss[:, 0, 0] + 1)
+    np.testing.assert_equal(acs[:, 0], ss[:, 0, 0])
+    np.testing.assert_equal(rs[:, 0], ss[:, 0, 0])
+    assert ss.min() >= 20 - min(20, maxlen)
+    t = S.from_arr(ss).to_tensor()
+    assert tuple(t.shape) == (64, 1, 3)
+
+def test_deque_buffer_order():
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.DequeBuffer(maxlen=6)
+    fill(b, 9, S, A)
+    bt = b.get()
+    np.testing.assert_equal(bt.ss[0][:, 0, 0], [3, 4, 5, 6, 7])
+    np.testing.assert_equal(bt.sns[0][:, 0, 0], [4, 5, 6, 7, 8])
+
+def fill_envs(b, n, s_sp, a_sp, n_envs=3):
+    "States hold (step, env), env `e` ends its episodes every `e + 2` steps."
+    envs = np.arange(n_envs)
+    for i in range(n):
+        s = s_sp(np.stack([np.full(n_envs, i), envs, np.zeros(n_envs)], axis=1))
+        b.add_transition(s=[s], a=[a_sp(envs)], r=np.full(n_envs, float(i)), d=(i % (envs + 2) == envs + 1))
+
+@pytest.mark.parametrize("pr", [False, True])
+def test_replay_buffer_multi_env(pr):
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.PrReplayBuffer(maxlen=30) if pr else rw.mem.ReplayBuffer(maxlen=30)
+    fill_envs(b, 14, S, A)
+    assert len(b) == 30 and b.ss[0].shape == (10, 3, 3) and b.rs.shape == (10, 3)
+    bt = b.sample(bs=500)
+    ss, sns, acs = bt.ss[0][:, 0], bt.sns[0][:, 0], bt.acs[0][:, 0]
+    assert ss.shape == (500, 3) and bt.rs.shape == (500, 1)
+    # Next state is the one of the same env in the following step, the newest step is never sampled
+    np.testing.assert_equal(sns[:, 0], ss[:, 0] + 1)
+    np.testing.assert_equal(sns[:, 1], ss[:, 1])
+    np.testing.assert_equal(acs, ss[:, 1])
+    assert set(ss[:, 0]) == set(range(4, 13)) and set(ss[:, 1]) == {0, 1, 2}
+    if pr: np.testing.assert_equal(bt.idxs % 3, ss[:, 1])
+
+def test_deque_buffer_multi_env():
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.DequeBuffer(maxlen=12)
+    fill_envs(b, 6, S, A)
+    bt = b.get()
+    assert bt.ss[0].shape == (3, 3, 3) and bt.rs.shape == (3, 3)
+    np.testing.assert_equal(bt.ss[0][..., 0], [[2] * 3, [3] * 3, [4] * 3])
+    np.testing.assert_equal(bt.sns[0][..., 1], [[0, 1, 2]] * 3)
+
+def test_replay_buffer_frame_stack_multi_env():
+    S, A = rw.space.Image(shape=[2, 1, 1, 3]), rw.space.Categorical(n_acs=2)
+    stack, b = rw.tfm.img.Stack(n=3), rw.mem.ReplayBuffer(maxlen=20)
+    for i in range(6):
+        # Only the second env ends an episode (at step 2), frames hold the step
+        s = S(np.full((2, 1, 1, 1), i, dtype='uint8')).apply_tfms(stack)
+        b.add_transition(s=[s], a=[A(np.zeros(2))], r=np.zeros(2), d=np.array([False, i == 2]))
+    bt = b._get_batch(idxs=b._flat_idxs(np.arange(5)))
+    np.testing.assert_equal(bt.ss[0][:, 0, 0, 0], [[0, 0, 0], [0, 0, 1], [0, 1, 2], [1, 2, 3], [2, 3, 4]])
+    np.testing.assert_equal(bt.ss[0][:, 1, 0, 0], [[0, 0, 0], [0, 0, 1], [0, 1, 2], [3, 3, 3], [3, 3, 4]])
+
+@pytest.mark.parametrize("n_step", [1, 3])
+def test_replay_buffer_nstep(n_step, gamma=.9):
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.ReplayBuffer(maxlen=30, n_step=n_step, gamma=gamma)
+    fill_envs(b, 14, S, A)
+    bt = b._get_batch(idxs=b._flat_idxs(np.arange(4, 13) % 10))
+    rs, ds = b[np.arange(14) % 10]['rs'], b[np.arange(14) % 10]['ds']
+    for i, t in enumerate(range(4, 13)):
+        for e in range(3):
+            # Reference, summing rewards until the end of the episode or the newest step
+            ret, k = 0., 0
+            while True:
+                ret, k = ret + gamma ** k * (t + k), k + 1
+                if ds[t + k - 1, e] or k == n_step or t + k == 13: break
+            np.testing.assert_allclose(bt.rs[i, e], ret, rtol=1e-6)
+            assert bt.sns[0][i, e, 0] == t + k and bt.ds[i, e] == ds[t + k - 1, e]
+            if n_step > 1: np.testing.assert_allclose(bt.gammas[i, e], gamma ** k, rtol=1e-6)
+
+def test_pr_replay_buffer_nstep_segments():
+    b = rw.mem.PrReplayBuffer(maxlen=20, n_step=3, gamma=1.)
+    for k in range(2):
+        ss = np.arange(5, dtype='float32')[:, None, None] + 10 * k
+        b.add_segment(ss=[ss], acs=[np.zeros((4, 1))], rs=np.ones((4, 1)), ds=np.zeros((4, 1)))
+    bt = b._get_batch(idxs=np.arange(10)[:, None])
+    # Windows stop at the end of each segment without ending the episode
+    np.testing.assert_equal(bt.rs[:, 0], [3, 3, 2, 1, 0, 3, 3, 2, 1, 0])
+    np.testing.assert_equal(bt.sns[0][:4, 0, 0], [3, 4, 4, 4])
+    np.testing.assert_equal(bt.ds[:4, 0], 0)
+
+def test_replay_buffer_sequences():
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.ReplayBuffer(maxlen=30)
+    for i in range(14):
+        envs = np.arange(3)
+        s = S(np.stack([np.full(3, i), envs, np.zeros(3)], axis=1))
+        # Recurrent states hold (step, env)
+        hs = [np.stack([np.full(3, i), envs], axis=1)]
+        b.add_transition(s=[s], a=[A(envs)], r=np.full(3, float(i)), d=(i % (envs + 2) == envs + 1), hs=hs)
+    with pytest.raises(ValueError): b.sample_sequences(bs=4, seq_len=8, burn_in=2)
+    bt = b.sample_sequences(bs=200, seq_len=4, burn_in=2)
+    ss, sns, ds = bt.ss[0], bt.sns[0], bt.ds
+    assert ss.shape == (6, 200, 3) and bt.rs.shape == (6, 200) and bt.hs[0].shape == (200, 2)
+    # Consecutive steps of a single env, starting after the oldest step and ending before the newest one
+    np.testing.assert_equal(np.diff(ss[..., 0], axis=0), 1)
+    np.testing.assert_equal(sns[..., 0], ss[..., 0] + 1)
+    assert (ss[..., 1] == ss[:1, :, 1]).all() and ss[..., 0].min() >= 4 and ss[..., 0].max() <= 12
+    np.testing.assert_equal(bt.hs[0], ss[0, :, :2])
+    # Burn-in and steps after the end of the episode are masked
+    ended = np.cumsum(ds, axis=0) - ds > 0
+    np.testing.assert_equal(bt.mask[:2], 0)
+    np.testing.assert_equal(bt.mask[2:], ~ended[2:])
+
+@pytest.mark.parametrize("hot_len", [0, 4, 10])
+def test_memmap_replay_buffer(tmpdir, hot_len):
+    S, A = rw.space.Image(shape=[2, 4, 5, 3]), rw.space.Categorical(n_acs=2)
+    stack = rw.tfm.img.Stack(n=3)
+    bs = [rw.mem.ReplayBuffer(maxlen=20), rw.mem.MemmapReplayBuffer(maxlen=20, path=str(tmpdir), hot_len=hot_len)]
+    for i in range(27):
+        s = S(np.random.randint(0, 256, size=(2, 4, 5, 1), dtype='uint8')).apply_tfms(stack)
+        for b in bs: b.add_transition(s=[s], a=[A(np.array([0, 1]))], r=np.full(2, i), d=np.array([i % 7 == 6, i % 4 == 3]))
+    assert isinstance(bs[1].ss[0], np.memmap) and (tmpdir/'ss_0.npy').exists()
+    # Repeated indexes, both from the hot window and from disk
+    idxs = np.random.randint(18, size=(16, 1))
+    b1, b2 = [b._get_batch(idxs=idxs) for b in bs]
+    for k in ['ss', 'sns', 'acs']: np.testing.assert_equal(b1[k], b2[k])
+    s1, s2 = [b.sample_sequences(bs=4, seq_len=3) for b in bs]
+    assert s2.ss[0].shape == s1.ss[0].shape == (3, 4, 4, 5, 3)
+
+@pytest.mark.parametrize("cache_len, n_threads", [(0, 1), (8, 1), (64, 3)])
+def test_compressed_replay_buffer(tmpdir, cache_len, n_threads):
+    S, A = rw.space.Image(shape=[2, 4, 5, 3]), rw.space.Categorical(n_acs=2)
+    stack = rw.tfm.img.Stack(n=3)
+    bs = [rw.mem.ReplayBuffer(maxlen=20), rw.mem.CompressedReplayBuffer(maxlen=20, cache_len=cache_len, n_threads=n_threads)]
+    for i in range(27):
+        s = S(np.random.randint(0, 256, size=(2, 4, 5, 1), dtype='uint8')).apply_tfms(stack)
+        for b in bs: b.add_transition(s=[s], a=[A(np.array([0, 1]))], r=np.full(2, i), d=np.array([i % 7 == 6, i % 4 == 3]))
+        # Overwritten frames are not served from the cache
+        if i % 5 == 0: bs[1]._get_batch(idxs=np.arange(18)[:, None])
+    assert 0 < bs[1].nbytes
+    for _ in range(3):
+        idxs = np.random.randint(18, size=(16, 1))
+        b1, b2 = [b._get_batch(idxs=idxs) for b in bs]
+        for k in ['ss', 'sns', 'acs']: np.testing.assert_equal(b1[k], b2[k])
+    # Cached frames don't keep the decompressed batches alive
+    assert all(f.base is None for f in bs[1].ss[0]._cache.values())
+    bs[1].save(savedir=str(tmpdir), chunk_len=4)
+    b3 = rw.mem.CompressedReplayBuffer(maxlen=20)
+    b3.load(loaddir=str(tmpdir))
+    np.testing.assert_equal(bs[0][bs[0]._ordered_idxs()]['ss'], b3[b3._ordered_idxs()]['ss'])
+
+def test_replay_buffer_save_load(tmpdir):
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b1, b2 = rw.mem.ReplayBuffer(maxlen=16), rw.mem.ReplayBuffer(maxlen=16)
+    fill(b1, 20, S, A)
+    b1.save(savedir=str(tmpdir))
+    b2.load(loaddir=str(tmpdir))
+    assert len(b1) == len(b2)
+    for k in ['ss', 'acs', 'rs', 'ds']:
+        np.testing.assert_equal(b1[b1._ordered_idxs()][k], b2[b2._ordered_idxs()][k])
+
+def test_replay_buffer_save_empty(tmpdir):
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.ReplayBuffer(maxlen=16)
+    with pytest.raises(RuntimeError): b.save(savedir=str(tmpdir))
+    b.add_sa(s=[S(np.zeros((1, 3)))], a=[A(np.zeros(1))])
+    with pytest.raises(RuntimeError): b.save(savedir=str(tmpdir))
+    assert not tmpdir.join('buffer').check()
+
+@pytest.mark.parametrize("background", [False, True])
+def test_replay_buffer_save_failed(tmpdir, monkeypatch, background):
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.ReplayBuffer(maxlen=16)
+    fill(b, 20, S, A)
+    b.save(savedir=str(tmpdir), chunk_len=4)
+    fill(b, 2, S, A)
+    def fail(*args, **kwargs): raise OSError('disk full')
+    with monkeypatch.context() as m:
+        m.setattr(rw.mem.checkpoint, 'write_chunk', fail)
+        with pytest.raises((OSError, RuntimeError)):
+            b.save(savedir=str(tmpdir), chunk_len=4, background=background)
+            b.wait()
+    for f in tmpdir.join('buffer').listdir('chunk_*'): f.remove()
+    # Nothing counts as saved after a failure, all the chunks are written again
+    b.save(savedir=str(tmpdir), chunk_len=4)
+    assert len(tmpdir.join('buffer').listdir('chunk_*')) == 4
+
+@pytest.mark.parametrize("codec, background", [(None, False), ('zlib', True), ('lzma', False)])
+def test_replay_buffer_save_load_chunks(tmpdir, codec, background):
+    S, A = rw.space.Image(shape=[2, 4, 5, 3]), rw.space.Categorical(n_acs=2)
+    stack, b1, b2 = rw.tfm.img.Stack(n=3), rw.mem.PrReplayBuffer(maxlen=40), rw.mem.PrReplayBuffer(maxlen=40)
+    def add(n):
+        for i in range(n):
+            s = S(np.random.randint(0, 256, size=(2, 4, 5, 1), dtype='uint8')).apply_tfms(stack)
+            b1.add_transition(s=[s], a=[A(np.array([0, 1]))], r=np.random.normal(size=2), d=np.random.random(2) < .2)
+    add(27)
+    b1.save(savedir=str(tmpdir), chunk_len=6, codec=codec, background=background)
+    b1.wait()
+    for f in tmpdir.join('buffer').listdir('chunk_*'): f.remove()
+    # Only the chunks written since the last save are written again
+    add(6)
+    b1.save(savedir=str(tmpdir), chunk_len=6, codec=codec, background=background)
+    b1.wait()
+    assert sorted(f.basename for f in tmpdir.join('buffer').listdir('chunk_*')) == ['chunk_1.pkl', 'chunk_2.pkl']
+    b1.save(savedir=str(tmpdir/'full'), chunk_len=6, codec=codec, background=background)
+    b1.wait()
+    b2.load(loaddir=str(tmpdir/'full'))
+    assert len(b1) == len(b2) and b1.position == b2.position
+    idxs = b1._flat_idxs(b1._ordered_idxs()[:-1])
+    bt1, bt2 = b1._get_batch(idxs=idxs), b2._get_batch(idxs=idxs)
+    for k in ['ss', 'sns', 'acs', 'rs', 'ds']: np.testing.assert_equal(bt1[k], bt2[k])
+    # Loaded transitions can be sampled, except the newest step
+    np.testing.assert_equal(b2.sum_tree[idxs.reshape(-1)], 1)
+    np.testing.assert_equal(b2.sum_tree[b2._flat_idxs(b2.position)], 0)
+
+@pytest.mark.parametrize("maxlen", [1, 7, 64])
+def test_segment_tree(maxlen):
+    pr = np.random.uniform(size=maxlen)
+    st, mt = U.buffers.SumTree(maxlen), U.buffers.MinTree(maxlen)
+    st[np.arange(maxlen)], mt[np.arange(maxlen)] = pr, pr
+    np.testing.assert_allclose(st.reduce(), pr.sum())
+    np.testing.assert_allclose(mt.reduce(), pr.min())
+    for start, end in [(0, maxlen // 2 + 1), (maxlen // 3, maxlen)]:
+        np.testing.assert_allclose(st.reduce(start, end), pr[start:end].sum())
+        np.testing.assert_allclose(mt.reduce(start, end), pr[start:end].min())
+    mass = np.random.uniform(high=pr.sum(), size=100)
+    np.testing.assert_equal(st.find_prefixsum_idx(mass), np.searchsorted(np.cumsum(pr), mass, side='right'))
+
+def test_pr_replay_buffer():
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.PrReplayBuffer(maxlen=10, pr_factor=1., is_factor=1., min_pr=0.)
+    fill(b, 15, S, A)
+    # Newest transition has no next state and can't be sampled
+    idxs = b.sample(bs=1000).idxs
+    assert b.position not in idxs and len(set(idxs)) == 9
+    pr = np.zeros(10)
+    pr[3] = 1.
+    b.update_pr(idxs=np.arange(10), pr=pr + 1e-6)
+    bt = b.sample(bs=32)
+    assert (bt.idxs == 3).all()
+    np.testing.assert_allclose(bt.is_ws, 1e-6, rtol=1e-5)
+
+def test_pr_replay_buffer_stale_update():
+    S, A = rw.space.Continuous(low=np.zeros(3), high=np.ones(3)), rw.space.Categorical(n_acs=100)
+    b = rw.mem.PrReplayBuffer(maxlen=10, pr_factor=1., is_factor=1., min_pr=0.)
+    fill(b, 15, S, A)
+    bt = b.sample(bs=1000)
+    # The batch is updated after 2 more steps, their transitions were overwritten and the newest can't be sampled,
+    # the newest step when sampling had no priority yet
+    fill(b, 2, S, A)
+    b.update_pr(idxs=bt.idxs, pr=np.full(1000, 5.), nwritten=bt.nwritten)
+    new = [(b.position - k) % 10 for k in [2, 1, 0]]
+    np.testing.assert_equal(b.sum_tree[np.array(new)], [1., 1., 0.])
+    np.testing.assert_equal(b.sum_tree[np.setdiff1d(np.arange(10), new)], 5.)
+
+def test_pr_replay_buffer_segments():
+    b = rw.mem.PrReplayBuffer(maxlen=12, pr_factor=1., is_factor=1., min_pr=0.)
+    for k in range(3):
+        # Segments of 4 transitions, states hold (segment, step)
+        ss = np.stack([np.full(4 + 1, k), np.arange(4 + 1)], axis=1)[:, None].astype('float32')
+        b.add_segment(ss=[ss], acs=[np.zeros((4, 1))], rs=np.ones((4, 1)), ds=np.zeros((4, 1)), pr=None if k == 0 else np.full(4, k))
+    bt = b.sample(bs=1000)
+    # Next states never cross segments, last rows of the segments are never sampled
+    np.testing.assert_equal(bt.sns[0][..., 0], bt.ss[0][..., 0])
+    np.testing.assert_equal(bt.sns[0][..., 1], bt.ss[0][..., 1] + 1)
+    assert set(bt.ss[0][:, 0, 1]) == {0, 1, 2, 3}
+    # The last segment wraps around, overwriting the start of the first one
+    np.testing.assert_allclose(b.sum_tree[np.arange(12)], [2, 2, 0, 1, 0, 1, 1, 1, 1, 0, 2, 2])
+
+def test_replay_buffer_frame_stack():
+    S, A = rw.space.Image(shape=[1, 4, 5, 3]), rw.space.Categorical(n_acs=2)
+    stack, b = rw.tfm.img.Stack(n=3), rw.mem.ReplayBuffer(maxlen=20)
+    ss, ds = [], []
+    for i in range(33):
+        s = S(np.full((1, 4, 5, 1), i, dtype='uint8')).apply_tfms(stack)
+        d = np.array([i % 7 == 6])
+        b.add_transition(s=[s], a=[A(np.array([0]))], r=np.array([0.]), d=d)
+        ss.append(np.array(s))
+        if d[0]: stack.reset()
+    # Only the newest frame of each transition is stored
+    assert b.ss[0].shape == (20, 1, 4, 5, 1)
+    bt = b._get_batch(idxs=b._flat_idxs(b._ordered_idxs()[:-1]))
+    assert bt.ss[0].shape == (19, 1, 4, 5, 3)
+    # The oldest transitions have their stack truncated by the ring, from then on stacks match
+    np.testing.assert_equal(bt.ss[0][2:], np.array(ss[-20:-1])[2:])
+    np.testing.assert_equal(bt.sns[0][2:], np.array(ss[-19:])[2:])
+    np.testing.assert_equal(bt.ss[0][0, 0, 0, 0], [13, 13, 13])
+    t = S.from_arr(bt.ss[0]).to_tensor()
+    assert tuple(t.shape) == (19, 1, 3, 4, 5)
+
+def test_replay_buffer_staging():
+    S, A = rw.space.Image(shape=[1, 4, 5, 3]), rw.space.Categorical(n_acs=2)
+    staging = U.Staging(pin=False)
+    stack, bs = rw.tfm.img.Stack(n=3), [rw.mem.ReplayBuffer(maxlen=20), rw.mem.ReplayBuffer(maxlen=20, staging=staging)]
+    for i in range(25):
+        s = S(np.full((1, 4, 5, 1), i, dtype='uint8')).apply_tfms(stack)
+        for b in bs: b.add_transition(s=[s], a=[A(np.array([i % 2]))], r=np.array([i]), d=np.array([i % 7 == 6]))
+    idxs = np.random.randint(19, size=8)
+    b1, b2 = [b._get_batch(idxs=idxs) for b in bs]
+    for k in ['ss', 'sns', 'acs']: np.testing.assert_equal(b1[k], b2[k])
+    for k in ['rs', 'ds']: np.testing.assert_equal(b1[k], b2[k])
+    # Buffers alternate, a batch is only overwritten two calls later
+    b3 = bs[1]._get_batch(idxs=idxs)
+    assert not np.shares_memory(b2.rs, b3.rs)
+    assert np.shares_memory(b2.rs, bs[1]._get_batch(idxs=idxs).rs)
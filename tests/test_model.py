@@ -0,0 +1,55 @@
+import pytest, torch
+import torch.nn as nn
+import reward as rw, reward.utils as U
+
+
+class PolicyNN(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.mean, self.log_std = nn.Linear(5, 2), nn.Linear(5, 2)
+    def forward(self, x): return self.mean(x), self.log_std(x).clamp(-20, 2)
+
+class QValueNN(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.layers = nn.Sequential(nn.Linear(7, 16), nn.ReLU(), nn.Linear(16, 1))
+    def forward(self, s, a): return self.layers(torch.cat([s, a], dim=1))
+
+class Policy:
+    def __init__(self, nn): self.nn = nn
+    def get_dist(self, s):
+        mean, log_std = self.nn(s)
+        return rw.dist.TanhNormal(loc=mean, scale=log_std.exp())
+    def get_act_pre(self, s=None, dist=None): return (dist or self.get_dist(s=s)).rsample_with_pre()
+    def logprob_pre(self, dist, acs): return dist.log_prob_pre(acs).sum(-1, keepdim=True)
+    def mean(self, dist): return dist.loc
+    def std(self, dist): return dist.scale
+
+def test_ensemble_q():
+    qnns, ens = [QValueNN(), QValueNN()], rw.nn.EnsembleQ(n_in=5, n_acs=2, k=2, hidden=16, n_layers=1)
+    for i, qnn in enumerate(qnns):
+        for l, el in zip(qnn.layers[::2], ens.layers[::2]):
+            el.weight.data[i], el.bias.data[i, 0] = l.weight.data.t(), l.bias.data
+    s, a = torch.randn(8, 5), torch.randn(8, 2)
+    q = ens(s, a)
+    assert q.shape == (2, 8, 1)
+    for i, qnn in enumerate(qnns): assert torch.allclose(q[i], qnn(s, a), atol=1e-6)
+
+@pytest.mark.parametrize("k, n_min, p_q", [(None, None, 'min'), (2, None, 'min'), (5, 2, 'mean')])
+def test_sac_train(k, n_min, p_q):
+    U.device.set_device(torch.device('cpu'))
+    pnn = PolicyNN()
+    opt = lambda nn: torch.optim.Adam(nn.parameters(), lr=1e-3)
+    if k is None:
+        q1nn, q2nn = QValueNN(), QValueNN()
+        md, qnns = rw.model.SAC(policy=Policy(pnn), q1nn=q1nn, q2nn=q2nn, p_opt=opt(pnn), q1_opt=opt(q1nn), q2_opt=opt(q2nn), entropy=-2), [q1nn, q2nn]
+    else:
+        qnn = rw.nn.EnsembleQ(n_in=5, n_acs=2, k=k, hidden=16)
+        md, qnns = rw.model.SAC(policy=Policy(pnn), qnn=qnn, p_opt=opt(pnn), q_opt=opt(qnn), entropy=-2, n_min=n_min, p_q=p_q), [qnn]
+    before = [[p.detach().clone() for p in o.parameters()] for o in [pnn, *qnns]]
+    md.train(ss=[torch.randn(8, 2, 5)], sns=[torch.randn(8, 2, 5)], acs=[torch.rand(8, 2, 2)], rs=torch.randn(8, 2), ds=torch.zeros(8, 2))
+    # Super-batch of 3 updates
+    md.train_many(ss=[torch.randn(3, 8, 1, 5)], sns=[torch.randn(3, 8, 1, 5)], acs=[torch.rand(3, 8, 1, 2)], rs=torch.randn(3, 8, 1),
+                  ds=torch.zeros(3, 8, 1))
+    for o, ps in zip([pnn, *qnns], before): assert all(not torch.equal(p, p0) for p, p0 in zip(o.parameters(), ps))
+    assert all(p.requires_grad for o in qnns for p in o.parameters())
@@ -1,4 +1,4 @@
-import pytest
+import pytest, time
 import numpy as np
 import reward.utils as U
 
@@ -8,4 +8,81 @@ def test_map_range():
 
     np.testing.assert_allclose(1.25, a_map(.5))
     np.testing.assert_allclose(np.array([1.25, 0.5, -1, 1.625]), a_map(np.array([.5, 0, -1, .75])))
-    np.testing.assert_allclose(np.array([[-1, 0.5], [2, 1.25]]), a_map(np.array([[-1, 0], [1, .5]])))
\ No newline at end of file
+    np.testing.assert_allclose(np.array([[-1, 0.5], [2, 1.25]]), a_map(np.array([[-1, 0], [1, .5]])))
+
+def test_prefetcher():
+    calls = []
+    def fn():
+        calls.append(len(calls))
+        return calls[-1]
+    p = U.Prefetcher(fn, n=3)
+    assert [p.get() for _ in range(5)] == list(range(5))
+    # At most n results are waiting (plus the one being produced)
+    time.sleep(.1)
+    assert len(calls) <= 5 + 3 + 1
+    p.close()
+
+def test_prefetcher_deterministic():
+    calls = []
+    p = U.Prefetcher(lambda: calls.append(1) or len(calls), n=3, deterministic=True)
+    assert len(calls) == 0
+    assert [p.get() for _ in range(3)] == [1, 2, 3]
+    assert len(calls) == 3
+
+def test_prefetcher_error():
+    def fn(): raise ValueError('failed')
+    p = U.Prefetcher(fn, n=2)
+    with pytest.raises(RuntimeError): p.get()
+
+def test_episode_tracker():
+    eps = U.EpisodeTracker(maxlen=4)
+    rs, ds = np.arange(12).reshape(6, 2), np.array([[0, 0], [1, 0], [0, 0], [0, 1], [1, 0], [0, 0]])
+    ended = [eps.step(r=r, d=d).tolist() for r, d in zip(rs, ds)]
+    assert ended == [[], [0], [], [1], [0], []]
+    # Env 1 reaches maxlen at step 3, env 0 ends at steps 1 and 4
+    assert eps.rs == [0 + 2, 1 + 3 + 5 + 7, 4 + 6 + 8] and eps.lens == [2, 4, 3]
+    eps.reset(idxs=[1])
+    eps.step(r=[1, 1], d=[1, 1])
+    assert eps.rs[-2:] == [11, 1] and eps.lens[-2:] == [2, 1]
+
+@pytest.mark.parametrize("flatten", [False, True])
+def test_polyak(flatten):
+    import torch, torch.nn as nn
+    from copy import deepcopy
+    nn1 = nn.Sequential(nn.Linear(3, 5), nn.BatchNorm1d(5), nn.Linear(5, 2))
+    nn2 = deepcopy(nn1)
+    for p in nn2.parameters(): p.data.normal_()
+    nn1(torch.randn(8, 3))
+    expected = [.3 * p1 + .7 * p2 for p1, p2 in zip(nn1.parameters(), nn2.parameters())]
+    up = U.Polyak(from_nn=nn1, to_nn=nn2, flatten=flatten)
+    up(.3)
+    for p, e in zip(nn2.parameters(), expected): assert torch.allclose(p, e)
+    assert torch.allclose(nn2[1].running_mean, .3 * nn1[1].running_mean) and nn2[1].num_batches_tracked == 1
+    # The source net can still be trained and moved
+    opt = torch.optim.SGD(nn1.parameters(), lr=.1)
+    nn1(torch.randn(8, 3)).pow(2).sum().backward()
+    opt.step()
+    nn1.double(), nn2.double()
+    up(1.)
+    for p1, p2 in zip(nn1.state_dict().values(), nn2.state_dict().values()): assert torch.equal(p1, p2)
+
+
+def test_timing(tmp_path):
+    import reward as rw
+    @U.timing.timed('f')
+    def f(x): return x + 1
+    U.timing.clear()
+    assert f(1) == 2 and not U.timing.stats()
+    U.timing.enable()
+    try:
+        for _ in range(3): f(1)
+        with U.timing.timeit('g'): time.sleep(.01)
+        st = U.timing.stats()
+        assert len(st['f']) == 3 and st['g'][0] >= 10
+        U.timing.log()
+        assert 'timing/g' in rw.logger.interface._logger.logs and not U.timing.stats()
+    finally: U.timing.disable()
+    U.timing.profile(tmp_path/'prof', steps=2)
+    f(1)
+    U.global_step.add(2)
+    assert (tmp_path/'prof').exists()
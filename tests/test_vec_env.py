@@ -0,0 +1,147 @@
+import pytest, torch
+import numpy as np, reward as rw
+from types import SimpleNamespace
+
+
+class CountEnv:
+    "Episode of `length` steps, state is (step, last action)."
+    def __init__(self, length=3): self.length, self.t = length, 0
+    def reset(self):
+        self.t = 0
+        return np.zeros(2, dtype='float32')
+    def step(self, a):
+        self.t += 1
+        return np.array([self.t, a], dtype='float32'), float(self.t), self.t == self.length, dict(t=self.t, extra='x')
+    def close(self): pass
+
+def make_subproc(n_envs=4, **kwargs):
+    return rw.env.SubprocVecEnv(env_fns=[CountEnv] * n_envs, s_shape=(2,), s_dtype='float32', a_shape=(1,), a_dtype='float32', **kwargs)
+
+def check_auto_reset(venv, n_envs):
+    acs = np.arange(n_envs, dtype='float32')[:, None]
+    np.testing.assert_equal(venv.reset(), np.zeros((n_envs, 2)))
+    for t in [1, 2, 3, 1]:
+        ss, rs, ds, infos = venv.step(acs)
+        np.testing.assert_equal(rs, np.full(n_envs, t))
+        np.testing.assert_equal(ds, np.full(n_envs, t == 3))
+        if t == 3:
+            # Envs are reset and the last state is kept
+            np.testing.assert_equal(ss, np.zeros((n_envs, 2)))
+            np.testing.assert_equal(venv.terminal_ss, np.stack([np.full(n_envs, 3), acs[:, 0]], axis=1))
+        else: np.testing.assert_equal(ss, np.stack([np.full(n_envs, t), acs[:, 0]], axis=1))
+    return infos
+
+def test_sync_vec_env():
+    infos = check_auto_reset(rw.env.SyncVecEnv([CountEnv() for _ in range(3)]), n_envs=3)
+    assert infos == [dict(t=1, extra='x')] * 3
+
+@pytest.mark.parametrize("n_workers, n_groups, n_bufs", [(2, 1, 1), (3, 1, 2), (2, 2, 2)])
+def test_subproc_vec_env(n_workers, n_groups, n_bufs):
+    venv = make_subproc(n_envs=5, n_workers=n_workers, n_groups=n_groups, n_bufs=n_bufs)
+    infos = check_auto_reset(venv, n_envs=5)
+    # Infos are dropped without a schema
+    assert infos == [{}] * 5
+    venv.close()
+
+@pytest.mark.parametrize("start_method", ['spawn', 'forkserver'])
+def test_subproc_vec_env_start_method(start_method):
+    # Workers write into the same shared memory whatever the start method
+    venv = make_subproc(n_envs=4, n_workers=2, n_bufs=2, start_method=start_method)
+    check_auto_reset(venv, n_envs=4)
+    venv.close()
+
+def test_subproc_vec_env_infos():
+    venv = make_subproc(n_envs=4, n_workers=2, info_schema=dict(t=np.int32), info_on_done=True)
+    venv.reset()
+    for t in [1, 2, 3]:
+        *_, infos = venv.step(np.zeros((4, 1)))
+        if t < 3: assert infos == [dict(t=t)] * 4
+        else: assert infos == [dict(t=3, extra='x')] * 4
+    venv.close()
+
+class OddInfoEnv(CountEnv):
+    "Infos only have `odd` (and `odd_i`) on odd steps."
+    def step(self, a):
+        s, r, d, info = super().step(a)
+        return s, r, d, dict(odd=self.t, odd_i=self.t) if self.t % 2 else {}
+
+def test_subproc_vec_env_infos_bufs():
+    venv = rw.env.SubprocVecEnv(env_fns=[OddInfoEnv] * 4, s_shape=(2,), s_dtype='float32', a_shape=(1,), a_dtype='float32',
+                                n_workers=2, n_groups=2, n_bufs=2, info_schema=dict(odd=np.float32, odd_i=np.int32))
+    for g in range(2): venv.reset(group=g)
+    venv.step_async(np.zeros((2, 1)), group=0)
+    *_, infos0 = venv.step_wait(group=0)
+    assert infos0 == [dict(odd=1., odd_i=1)] * 2
+    venv.step_async(np.zeros((2, 1)), group=0)
+    *_, infos1 = venv.step_wait(group=0)
+    # Missing keys are not carried over from the previous step
+    assert np.isnan([o['odd'] for o in infos1]).all() and [o['odd_i'] for o in infos1] == [0, 0]
+    venv.close()
+
+class RunnerEnv(CountEnv):
+    "CountEnv with the interface expected by `PAACRunner`, infos also have float `lives`."
+    env_name = 'count'
+    def __init__(self, length=3):
+        super().__init__(length=length)
+        self.s_space, self.ac_space = SimpleNamespace(shape=(2,), dtype=np.float32), None
+    def step(self, a):
+        s, r, d, info = super().step(a)
+        return s, r, d, dict(info, lives=self.length - self.t + .5)
+
+class PAACRunner(rw.runner.PAACRunner):
+    # The action space helpers of the runners use the old spaces, actions are a single float
+    def _get_ac_array(self): return np.zeros((self.num_envs, 1), dtype=np.float32)
+
+@pytest.mark.parametrize("info_on_done", [False, True])
+def test_paac_runner_infos(info_on_done):
+    runner = PAACRunner(env=[RunnerEnv() for _ in range(4)], num_workers=2, info_schema=dict(t=np.int32, lives=np.float32),
+                        info_on_done=info_on_done)
+    runner.reset()
+    for t in [1, 2, 3]:
+        *_, infos = runner.act(np.zeros((4, 1), dtype=np.float32))
+        assert [type(o['t']) for o in infos] == [int] * 4 and [type(o['lives']) for o in infos] == [float] * 4
+        # Full infos are only sent for finished episodes, values from the schema are kept
+        extra = dict(extra='x') if info_on_done and t == 3 else {}
+        assert infos == [dict(t=t, lives=3 - t + .5, **extra)] * 4
+    runner.close()
+
+def test_subproc_vec_env_async():
+    venv = make_subproc(n_envs=4, n_workers=2, n_groups=2)
+    venv.reset()
+    venv.step_async(np.ones((2, 1)), group=1)
+    with pytest.raises(RuntimeError): venv.step_wait(group=0)
+    with pytest.raises(RuntimeError): venv.step_async(np.ones((2, 1)), group=1)
+    ss, *_ = venv.step_wait(group=1)
+    np.testing.assert_equal(ss, [[1, 1], [1, 1]])
+    venv.close()
+
+class ImgCountEnv(CountEnv):
+    "Frames filled with the step."
+    def reset(self): return super().reset()[:1].reshape(1, 1, 1).astype('uint8')
+    def step(self, a):
+        s, r, d, info = super().step(a)
+        return np.full((1, 1, 1), s[0], dtype='uint8'), r, d, info
+
+def test_sync_vec_env_stack_reset():
+    S = rw.space.Image(shape=[1, 1, 1, 1])
+    venv = rw.env.SyncVecEnv([ImgCountEnv()], s_fns=[rw.runner.paac.StateTfms(s_sp=S, tfms=rw.tfm.img.Stack(n=3))])
+    np.testing.assert_equal(venv.reset()[0, 0, 0], [0, 0, 0])
+    for t in [1, 2, 3, 1]:
+        ss, rs, ds, infos = venv.step(np.zeros((1, 1)))
+        if t == 3:
+            # The terminal stack holds the last frame, the stack starts over with the new episode
+            np.testing.assert_equal(venv.terminal_ss[0, 0, 0], [1, 2, 3])
+            np.testing.assert_equal(ss[0, 0, 0], [0, 0, 0])
+    np.testing.assert_equal(ss[0, 0, 0], [0, 0, 1])
+
+@pytest.mark.parametrize("start_method", [None, 'spawn'])
+def test_paac_dones_infos(start_method):
+    S, A = rw.space.Continuous(low=np.zeros(2), high=np.ones(2)), rw.space.Continuous(low=np.zeros(1), high=np.ones(1))
+    runner = rw.runner.PAAC(env_fn=CountEnv, n_envs=4, n_workers=2, s_sp=S, a_sp=A, info_schema=dict(t=np.int32), info_on_done=True,
+                            start_method=start_method)
+    runner.reset()
+    for t in [1, 2, 3]:
+        ss, rs, ds, infos = runner.step(np.zeros((4, 1)))
+        assert ds.dtype == torch.int32 and ds.tolist() == [int(t == 3)] * 4
+        assert infos == ([dict(t=t)] if t < 3 else [dict(t=3, extra='x')]) * 4
+    runner.close()